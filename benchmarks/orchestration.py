@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+'''Benchmark the orchestration of SIRIUS by q2-qemistree
+
+SIRIUS is replaced by the stand-in in ``q2_qemistree/tests/data/fake-sirius``
+so that the time measured is the time spent by q2-qemistree around SIRIUS:
+starting processes, writing shards, merging workspaces, caching and
+compacting results. Three suites are available:
+
+overhead
+    Time to compute fragmentation trees through q2-qemistree, compared with
+    running the stand-in directly on the same MGF file.
+sharding
+    Wall time of the fragmentation trees with 1, 2, 4 and 8 shards when
+    every feature takes ``--delay`` seconds, and the speedup over 1 shard.
+io
+    Time to merge shard outputs, restore results from the cache, predict
+    fingerprints (the largest per-feature outputs) and compact them.
+
+Results are printed as a tab-separated table, e.g.::
+
+    python benchmarks/orchestration.py --features 1000 10000 100000
+'''
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from q2_qemistree._semantics import MGFDirFmt, ZodiacDirFmt
+from q2_qemistree._fingerprint import (compute_fragmentation_trees,
+                                       predict_fingerprints,
+                                       merge_workspaces)
+from q2_qemistree._mgf import write_shards
+from q2_qemistree._compact import compact_csi
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_SIRIUS = os.path.join(ROOT, 'q2_qemistree', 'tests', 'data',
+                           'fake-sirius', 'bin')
+COLUMNS = ['suite', 'features', 'variant', 'seconds', 'ms_per_feature',
+           'speedup']
+
+
+def write_mgf(path, n_features, seed=0):
+    '''Write a synthetic MGF file with an MS1 and an MS2 record per feature'''
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        for fid in range(1, n_features + 1):
+            mz = round(rng.uniform(100, 600), 4)
+            rt = round(rng.uniform(30, 900), 3)
+            for level, peaks in [(1, 2), (2, rng.randint(5, 50))]:
+                f.write('BEGIN IONS\nFEATURE_ID=%d\nPEPMASS=%s\nCHARGE=1+\n'
+                        'RTINSECONDS=%s\nMSLEVEL=%d\n' % (fid, mz, rt, level))
+                for _ in range(peaks):
+                    f.write('%.4f %.1f\n' % (rng.uniform(50, mz),
+                                             rng.uniform(1e3, 1e6)))
+                f.write('END IONS\n\n')
+
+
+def timed(function, *args, **kwargs):
+    start = time.time()
+    result = function(*args, **kwargs)
+    return time.time() - start, result
+
+
+def trees(features, **kwargs):
+    return compute_fragmentation_trees(FAKE_SIRIUS, features, ppm_max=15,
+                                       profile='orbitrap', **kwargs)
+
+
+def overhead(features, n_features, tmp, delay):
+    mgf = os.path.join(str(features.path), 'features.mgf')
+    output = os.path.join(tmp, 'direct')
+    with open(os.devnull, 'w') as devnull:
+        direct, _ = timed(subprocess.check_call,
+                          [os.path.join(FAKE_SIRIUS, 'sirius'), '-o', output,
+                           '--maxmz', '600', mgf], stdout=devnull)
+    shutil.rmtree(output)
+
+    qemistree, result = timed(trees, features)
+    shutil.rmtree(str(result.path))
+    yield 'direct', direct, None
+    yield 'compute-fragmentation-trees', qemistree, None
+    yield 'overhead', qemistree - direct, None
+
+
+def sharding(features, n_features, tmp, delay):
+    os.environ['FAKE_SIRIUS_TREES_DELAY'] = str(delay)
+    try:
+        baseline = None
+        for n_shards in [1, 2, 4, 8]:
+            seconds, result = timed(trees, features, n_shards=n_shards,
+                                    n_jobs=n_shards)
+            shutil.rmtree(str(result.path))
+            baseline = baseline or seconds
+            yield '%d shards' % n_shards, seconds, baseline / seconds
+    finally:
+        del os.environ['FAKE_SIRIUS_TREES_DELAY']
+
+
+def io(features, n_features, tmp, delay):
+    mgf = os.path.join(str(features.path), 'features.mgf')
+    shards = write_shards(mgf, 4, os.path.join(tmp, 'shards'))
+    outputs = []
+    for shard in shards:
+        outputs.append(os.path.join(os.path.dirname(shard), 'output'))
+        subprocess.check_call([os.path.join(FAKE_SIRIUS, 'sirius'), '-o',
+                               outputs[-1], shard],
+                              stdout=subprocess.DEVNULL)
+    seconds, _ = timed(merge_workspaces, outputs, os.path.join(tmp, 'merged'))
+    yield 'merge 4 shards', seconds, None
+
+    cache_dir = os.path.join(tmp, 'cache')
+    cold, result = timed(trees, features, cache_dir=cache_dir,
+                         cache_max_size=10 ** 6)
+    shutil.rmtree(str(result.path))
+    warm, result = timed(trees, features, cache_dir=cache_dir,
+                         cache_max_size=10 ** 6)
+    yield 'trees, empty cache', cold, None
+    yield 'trees, all cached', warm, None
+
+    zodiac = ZodiacDirFmt()
+    subprocess.check_call([os.path.join(FAKE_SIRIUS, 'sirius'), '-o',
+                           zodiac.get_path(), '--zodiac', '--sirius',
+                           result.get_path(), '--spectra', mgf],
+                          stdout=subprocess.DEVNULL)
+    shutil.rmtree(str(result.path))
+    seconds, fingerprints = timed(predict_fingerprints, FAKE_SIRIUS, zodiac,
+                                  ppm_max=15)
+    yield 'predict-fingerprints', seconds, None
+    seconds, _ = timed(compact_csi, fingerprints.get_path())
+    yield 'compact fingerprints', seconds, None
+    shutil.rmtree(str(fingerprints.path))
+    shutil.rmtree(str(zodiac.path))
+
+
+SUITES = {'overhead': overhead, 'sharding': sharding, 'io': io}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--features', type=int, nargs='+',
+                        default=[1000, 10000],
+                        help='Numbers of features to benchmark with.')
+    parser.add_argument('--suites', nargs='+', choices=sorted(SUITES),
+                        default=['overhead', 'sharding', 'io'])
+    parser.add_argument('--delay', type=float, default=0.005,
+                        help='Seconds the stand-in spends on each feature '
+                             'in the sharding suite.')
+    parser.add_argument('--tmp-dir', default=None,
+                        help='Directory for the inputs and outputs, the '
+                             'default temporary directory if not given.')
+    args = parser.parse_args(argv)
+
+    out = sys.stdout
+    print('\t'.join(COLUMNS), file=out)
+    # q2-qemistree prints the commands it runs and their progress, which are
+    # left out of the table
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        for n_features in args.features:
+            with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp:
+                features = MGFDirFmt(tmp, mode='r')
+                write_mgf(os.path.join(tmp, 'features.mgf'), n_features)
+                for suite in args.suites:
+                    work = os.path.join(tmp, suite)
+                    os.makedirs(work)
+                    for variant, seconds, speedup in SUITES[suite](
+                            features, n_features, work, args.delay):
+                        print('\t'.join([
+                            suite, str(n_features), variant,
+                            '%.3f' % seconds,
+                            '%.4f' % (seconds / n_features * 1000),
+                            '' if speedup is None else '%.2f' % speedup]),
+                            file=out, flush=True)
+                    shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
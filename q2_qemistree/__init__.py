@@ -9,18 +9,27 @@ from ._version import get_versions
 
 from ._fingerprint import (compute_fragmentation_trees,
                            rerank_molecular_formulas,
-                           predict_fingerprints)
+                           predict_fingerprints, compute_fingerprints)
+from ._compact import compact_fingerprints
+from ._jobs import export_job_array, merge_fingerprints
 from ._classyfire import get_classyfire_taxonomy
+from ._filter import filter_features, subset_features
+from ._estimate import estimate_runtime
 from ._hierarchy import make_hierarchy
 from ._prune_hierarchy import prune_hierarchy
 from ._semantics import (MassSpectrometryFeatures, MGFDirFmt,
                          CSIFolder, CSIDirFmt, ZodiacFolder, ZodiacDirFmt,
-                         SiriusFolder, SiriusDirFmt, OutputDirs)
+                         SiriusFolder, SiriusDirFmt, JobArray, JobArrayDirFmt,
+                         OutputDirs)
 
-__all__ = ['compute_fragmentation_trees', 'rerank_molecular_formulas',
-           'predict_fingerprints', 'make_hierarchy', 'get_classyfire_taxonomy',
-           'prune_hierarchy', 'plot', 'MassSpectrometryFeatures', 'MGFDirFmt',
-           'CSIFolder', 'CSIDirFmt', 'ZodiacFolder', 'ZodiacDirFmt',
-           'SiriusFolder', 'SiriusDirFmt', 'OutputDirs']
+__all__ = ['filter_features', 'subset_features', 'estimate_runtime',
+           'compute_fragmentation_trees',
+           'rerank_molecular_formulas', 'predict_fingerprints',
+           'compute_fingerprints', 'compact_fingerprints', 'export_job_array',
+           'merge_fingerprints', 'make_hierarchy',
+           'get_classyfire_taxonomy', 'prune_hierarchy', 'plot',
+           'MassSpectrometryFeatures', 'MGFDirFmt', 'CSIFolder', 'CSIDirFmt',
+           'ZodiacFolder', 'ZodiacDirFmt', 'SiriusFolder', 'SiriusDirFmt',
+           'JobArray', 'JobArrayDirFmt', 'OutputDirs']
 
 __version__ = get_versions()['version']
@@ -0,0 +1,246 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from ._links import link_or_copy, link_tree
+
+
+def feature_id(name):
+    '''Get the feature identifier from a per-feature SIRIUS output name
+
+    SIRIUS names per-feature folders (and Zodiac the per-feature ``.ms``
+    files) as ``<index>_<source>_<feature id>``.
+    '''
+    if name.endswith('.ms'):
+        name = name[:-len('.ms')]
+    return name.split('_', 2)[-1]
+
+
+def hash_path(path):
+    '''Hash the contents of a file, or of all the files under a directory'''
+    digest = hashlib.sha256()
+    if os.path.isfile(path):
+        files = [(os.path.basename(path), path)]
+    else:
+        files = []
+        for root, _, names in os.walk(path):
+            for name in names:
+                full = os.path.join(root, name)
+                files.append((os.path.relpath(full, path), full))
+
+    for name, full in sorted(files):
+        digest.update(name.encode() + b'\0')
+        with open(full, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    '''Content-addressed on-disk cache of SIRIUS results
+
+    Each entry is a small SIRIUS workspace holding the output of one feature
+    (or of a whole run), stored under a key derived from the input records
+    and the parameters used to compute it. Entries are evicted in least
+    recently used order once the cache grows past ``max_size`` megabytes.
+
+    Parameters
+    ----------
+    root : str
+        Directory where the cache is stored, it is created if needed.
+    max_size : int
+        Maximum size of the cache in megabytes.
+    '''
+
+    def __init__(self, root: str, max_size: int):
+        self.root = root
+        self.max_size = max_size * 1024 ** 2
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(stage: str, parameters: list, *contents) -> str:
+        '''Compute the key for a stage, its parameters and input contents'''
+        digest = hashlib.sha256(stage.encode() + b'\0')
+        for parameter in parameters:
+            digest.update(str(parameter).encode() + b'\0')
+        for content in contents:
+            if isinstance(content, str):
+                content = content.encode()
+            digest.update(content)
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key: str):
+        '''Path to the workspace cached under ``key`` or None on a miss'''
+        entry = self._entry(key)
+        workspace = os.path.join(entry, 'workspace')
+        if not os.path.isdir(workspace):
+            return None
+
+        # the modification time of the entry tracks when it was last used
+        os.utime(entry)
+        return workspace
+
+    def put(self, key: str, workspace: str, feature_ids: list = None):
+        '''Store the results found in a workspace
+
+        Parameters
+        ----------
+        key : str
+            Key the results are stored under.
+        workspace : str
+            SIRIUS output directory to read the results from.
+        feature_ids : list of str, optional
+            Only store the per-feature outputs and the rows of top-level
+            tables (matched by ``experimentName``) for these features. Files
+            that do not belong to any feature are stored as they are. If not
+            specified the whole workspace is stored.
+        '''
+        entry = self._entry(key)
+        if os.path.isdir(entry):
+            return
+
+        tmp = self._stage(entry)
+        try:
+            staged = os.path.join(tmp, 'workspace')
+            if feature_ids is None:
+                link_tree(workspace, staged)
+            else:
+                os.makedirs(staged)
+                _copy_features(workspace, {fid: staged
+                                           for fid in feature_ids})
+            self._commit(tmp, entry)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.evict()
+
+    def put_features(self, keys: dict, workspace: str):
+        '''Store the results of each feature of a workspace separately
+
+        The same as calling ``put`` for each feature with its identifier,
+        but the workspace is read once and the cache is only trimmed once
+        all the features are stored, so the time taken grows linearly with
+        the number of features.
+
+        Parameters
+        ----------
+        keys : dict of str to str
+            Key each feature identifier is stored under.
+        workspace : str
+            SIRIUS output directory to read the results from.
+        '''
+        staged = {}
+        try:
+            for fid, key in keys.items():
+                entry = self._entry(key)
+                if not os.path.isdir(entry) and entry not in staged:
+                    staged[entry] = (fid, self._stage(entry))
+                    os.makedirs(os.path.join(staged[entry][1], 'workspace'))
+            if not staged:
+                return
+
+            _copy_features(workspace, {fid: os.path.join(tmp, 'workspace')
+                                       for fid, tmp in staged.values()})
+            for entry, (_, tmp) in staged.items():
+                self._commit(tmp, entry)
+        finally:
+            for _, tmp in staged.values():
+                shutil.rmtree(tmp, ignore_errors=True)
+
+        self.evict()
+
+    def _stage(self, entry):
+        # temporary directory next to an entry, renamed once complete
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        return tempfile.mkdtemp(dir=os.path.dirname(entry))
+
+    def _commit(self, tmp, entry):
+        staged = os.path.join(tmp, 'workspace')
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(staged)
+                   for name in names)
+        with open(os.path.join(tmp, 'size'), 'w') as f:
+            f.write(str(size))
+
+        # renaming is atomic, so concurrent readers either see the complete
+        # entry or none at all
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # stored by another process in the meantime
+            if not os.path.isdir(entry):
+                raise
+
+    def evict(self):
+        '''Remove least recently used entries until the cache fits'''
+        entries, total = [], 0
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                try:
+                    with open(os.path.join(entry.path, 'size')) as f:
+                        size = int(f.read())
+                    mtime = entry.stat().st_mtime
+                except (OSError, ValueError):
+                    # entries being written or removed by another process
+                    continue
+                entries.append((mtime, size, entry.path))
+                total += size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def _copy_features(workspace, destinations):
+    # destinations maps feature identifiers to the workspace their outputs
+    # are copied to, several features can share a workspace
+    targets = set(destinations.values())
+    for name in os.listdir(workspace):
+        path = os.path.join(workspace, name)
+
+        if os.path.isdir(path) or name.endswith('.ms'):
+            target = destinations.get(feature_id(name))
+            if target is None:
+                continue
+            if os.path.isdir(path):
+                link_tree(path, os.path.join(target, name))
+            else:
+                link_or_copy(path, os.path.join(target, name))
+            continue
+
+        with open(path) as f:
+            header = f.readline()
+            columns = header.rstrip('\n').split('\t')
+
+            if 'experimentName' not in columns:
+                for target in targets:
+                    link_or_copy(path, os.path.join(target, name))
+                continue
+
+            # the rows of each workspace are gathered in a single pass
+            column = columns.index('experimentName')
+            rows = {target: [header] for target in targets}
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) > column and fields[column] in destinations:
+                    rows[destinations[fields[column]]].append(line)
+
+        for target, lines in rows.items():
+            with open(os.path.join(target, name), 'w') as out:
+                out.writelines(lines)
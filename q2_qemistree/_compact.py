@@ -0,0 +1,100 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import shutil
+
+from ._semantics import CSIDirFmt
+from ._links import link_or_copy, link_tree
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        removed = sum(len(names) for _, _, names in os.walk(path))
+        shutil.rmtree(path)
+        return removed
+    os.remove(path)
+    return 1
+
+
+def compact_trees(workspace: str) -> int:
+    '''Remove the Graphviz renderings of the fragmentation trees
+
+    Zodiac reads the trees from their JSON files, the ``.dot`` files with the
+    same trees are only used to draw them.
+
+    Returns
+    -------
+    int
+        Number of files removed.
+    '''
+    removed = 0
+    for name in os.listdir(workspace):
+        trees = os.path.join(workspace, name, 'trees')
+        if not os.path.isdir(trees):
+            continue
+        for tree in os.listdir(trees):
+            if tree.endswith('.dot'):
+                removed += _remove(os.path.join(trees, tree))
+    return removed
+
+
+def compact_csi(workspace: str) -> int:
+    '''Keep only the CSI:FingerID output read by ``make_hierarchy``
+
+    Per-feature folders keep their predicted fingerprints, and the top-level
+    files (e.g. ``fingerprints.csv`` and ``summary_csi_fingerid.csv``) are
+    kept as they are. Candidate structures, trees, spectra and per-feature
+    summaries are removed, as are the folders of features without a
+    predicted fingerprint.
+
+    Returns
+    -------
+    int
+        Number of files removed.
+    '''
+    removed = 0
+    for name in os.listdir(workspace):
+        folder = os.path.join(workspace, name)
+        if not os.path.isdir(folder):
+            continue
+        if not os.path.isdir(os.path.join(folder, 'fingerprints')):
+            removed += _remove(folder)
+            continue
+        for entry in os.listdir(folder):
+            if entry != 'fingerprints':
+                removed += _remove(os.path.join(folder, entry))
+    return removed
+
+
+def compact_fingerprints(predicted_fingerprints: CSIDirFmt) -> CSIDirFmt:
+    '''Remove the CSI:FingerID output that is not needed by make_hierarchy
+
+    Parameters
+    ----------
+    predicted_fingerprints : CSIDirFmt
+        Directory with predicted fingerprints.
+
+    Returns
+    -------
+    CSIDirFmt
+        Directory with the predicted fingerprints and the summary of the
+        predicted structures.
+    '''
+    result = CSIDirFmt()
+    # the files are linked rather than copied, as most are removed right away
+    source = str(predicted_fingerprints.path)
+    for name in os.listdir(source):
+        path = os.path.join(source, name)
+        if os.path.isdir(path):
+            link_tree(path, os.path.join(str(result.path), name))
+        else:
+            link_or_copy(path, os.path.join(str(result.path), name))
+    removed = compact_csi(result.get_path())
+    print('Removed %d files not needed by make-hierarchy' % removed)
+    return result
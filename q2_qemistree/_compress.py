@@ -0,0 +1,101 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import gzip
+import shutil
+
+
+COMPRESSIONS = ['gzip', 'zstd']
+# name of the compressed MGF file in an MGFDirFmt, by compression
+COMPRESSED_NAMES = {'gzip': 'features.mgf.gz', 'zstd': 'features.mgf.zst'}
+
+_MAGIC = {b'\x1f\x8b': 'gzip', b'\x28\xb5\x2f\xfd': 'zstd'}
+
+# size of the blocks read from and written to the compressed streams
+BLOCK_SIZE = 1024 ** 2
+
+
+def _zstandard():
+    # zstd is an optional dependency, only needed for zstd-compressed files
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError('The zstandard package is needed for '
+                         'zstd-compressed MGF files, install it with '
+                         '"pip install zstandard"') from None
+    return zstandard
+
+
+def compression(fp: str):
+    '''The compression of a file from its first bytes
+
+    Returns
+    -------
+    str or None
+        ``gzip``, ``zstd`` or None if the file is not compressed with either.
+    '''
+    with open(fp, 'rb') as f:
+        head = f.read(4)
+    for magic, method in _MAGIC.items():
+        if head.startswith(magic):
+            return method
+    return None
+
+
+def open_compressed(fp: str):
+    '''Open a gzip or zstd-compressed file for streaming decompression
+
+    Raises
+    ------
+    ValueError
+        If the file is not compressed with gzip or zstd.
+
+    Returns
+    -------
+    file object
+        Binary stream with the decompressed content.
+    '''
+    method = compression(fp)
+    if method == 'gzip':
+        return gzip.open(fp, 'rb')
+    elif method == 'zstd':
+        return _zstandard().ZstdDecompressor().stream_reader(
+            open(fp, 'rb'), closefd=True)
+    raise ValueError('%s is not compressed with %s' %
+                     (fp, ' or '.join(COMPRESSIONS)))
+
+
+def decompress_mgf(compressed_fp: str, output_fp: str):
+    '''Decompress a file, one block at a time'''
+    with open_compressed(compressed_fp) as src, open(output_fp, 'wb') as dst:
+        shutil.copyfileobj(src, dst, BLOCK_SIZE)
+
+
+def compress_mgf(mgf_fp: str, output_fp: str, method: str = 'gzip'):
+    '''Compress an MGF file with gzip or zstd
+
+    The gzip header has no file name nor modification time, so the same MGF
+    file is always compressed to the same bytes.
+
+    Raises
+    ------
+    ValueError
+        If the compression method is not known.
+    '''
+    if method not in COMPRESSIONS:
+        raise ValueError('The compression should be one of %s, not %r' %
+                         (', '.join(COMPRESSIONS), method))
+
+    with open(mgf_fp, 'rb') as src, open(output_fp, 'wb') as f:
+        if method == 'gzip':
+            with gzip.GzipFile(filename='', mode='wb', fileobj=f,
+                               compresslevel=6, mtime=0) as dst:
+                shutil.copyfileobj(src, dst, BLOCK_SIZE)
+        else:
+            _zstandard().ZstdCompressor().copy_stream(
+                src, f, read_size=BLOCK_SIZE)
@@ -0,0 +1,238 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import bisect
+import os
+from collections import OrderedDict, namedtuple
+
+from ._cache import feature_id
+from ._links import link_tree
+from ._mgf import index_mgf, read_features, write_features
+
+
+DUPLICATES = 'duplicates.tsv'
+
+
+def _ms2_peaks(records):
+    peaks, level = [], None
+    for line in records.splitlines():
+        if line.startswith(b'BEGIN IONS'):
+            level = None
+        elif line.startswith(b'MSLEVEL='):
+            level = line.split(b'=')[1].strip()
+        elif level == b'2' and line[:1].isdigit():
+            fields = line.split()
+            peaks.append((float(fields[0]),
+                          float(fields[1]) if len(fields) > 1 else 0.0))
+    return peaks
+
+
+def _charge(records):
+    for line in records.splitlines():
+        if line.startswith(b'CHARGE='):
+            return line.split(b'=')[1].strip().decode()
+    return None
+
+
+Spectrum = namedtuple('Spectrum', ['feature_id', 'pepmass', 'rt', 'charge',
+                                   'peaks', 'fragments'])
+
+
+def spectrum(feature, records: bytes, min_intensity: float = 0.05):
+    '''Summarize the precursor, retention time and MS2 peaks of a feature
+
+    ``fragments`` are the sorted m/z of the MS2 peaks with at least
+    ``min_intensity`` of the intensity of the base peak, and ``peaks`` the
+    sorted m/z of all the MS2 peaks.
+    '''
+    peaks = _ms2_peaks(records)
+    base = max([intensity for _, intensity in peaks] or [0])
+    return Spectrum(feature.feature_id, feature.pepmass, feature.rt,
+                    _charge(records), sorted(mz for mz, _ in peaks),
+                    sorted(mz for mz, intensity in peaks
+                           if intensity >= min_intensity * base))
+
+
+def _explained(fragments, peaks, tolerance):
+    # every fragment has a peak within the tolerance
+    for mz in fragments:
+        i = bisect.bisect_left(peaks, mz - tolerance)
+        if i == len(peaks) or peaks[i] > mz + tolerance:
+            return False
+    return True
+
+
+def same_compound(a: Spectrum, b: Spectrum, mz_tolerance: float = 0.01,
+                  rt_tolerance: float = 10.0) -> bool:
+    '''Whether two spectra are near-identical
+
+    The precursors must be within ``mz_tolerance`` Da and ``rt_tolerance``
+    seconds of each other and have the same charge, and every intense MS2
+    peak of either spectrum must be matched by a peak of the other within
+    ``mz_tolerance``, so that low intensity noise is ignored.
+    '''
+    if a.pepmass is None or b.pepmass is None or not a.fragments or \
+            not b.fragments:
+        return False
+    if abs(a.pepmass - b.pepmass) > mz_tolerance or a.charge != b.charge:
+        return False
+    if (a.rt is None) != (b.rt is None) or (
+            a.rt is not None and abs(a.rt - b.rt) > rt_tolerance):
+        return False
+    return (_explained(a.fragments, b.peaks, mz_tolerance) and
+            _explained(b.fragments, a.peaks, mz_tolerance))
+
+
+def group_features(mgf_fp: str, features: list = None,
+                   mz_tolerance: float = 0.01,
+                   rt_tolerance: float = 10.0) -> OrderedDict:
+    '''Group features with near-identical spectra
+
+    Features are compared with the representatives of the groups found so
+    far, in input order, and join the first group whose representative is
+    the same compound (see ``same_compound``). Representatives are kept
+    sorted by precursor m/z, so only the ones within ``mz_tolerance`` of a
+    feature are compared.
+
+    Parameters
+    ----------
+    mgf_fp : str
+        Path to the MGF file.
+    features : list of Feature, optional
+        Features of the MGF file, as returned by ``index_mgf``. The file is
+        indexed if they are not given.
+    mz_tolerance : float, optional
+        Maximum difference in Da between the precursor m/z and the MS2 peaks
+        of duplicated features.
+    rt_tolerance : float, optional
+        Maximum difference in seconds between the retention times of
+        duplicated features.
+
+    Returns
+    -------
+    OrderedDict of str to list of str
+        Identifier of the first feature of each group, in input order, and
+        the identifiers of the other features in its group.
+    '''
+    if features is None:
+        features = index_mgf(mgf_fp)
+
+    groups = OrderedDict()
+    # (precursor m/z, input order, spectrum) of the representatives
+    representatives = []
+    for n, (feature, records) in enumerate(zip(
+            features, read_features(mgf_fp, features))):
+        current = spectrum(feature, records)
+
+        match = None
+        if current.pepmass is not None:
+            start = bisect.bisect_left(
+                representatives, (current.pepmass - mz_tolerance,))
+            candidates = []
+            # only the representatives within the m/z window are visited
+            for i in range(start, len(representatives)):
+                mz, order, other = representatives[i]
+                if mz > current.pepmass + mz_tolerance:
+                    break
+                if same_compound(current, other, mz_tolerance,
+                                 rt_tolerance):
+                    candidates.append((order, other.feature_id))
+            match = min(candidates)[1] if candidates else None
+
+        if match is None:
+            groups[feature.feature_id] = []
+            if current.pepmass is not None:
+                bisect.insort(representatives,
+                              (current.pepmass, n, current))
+        else:
+            groups[match].append(feature.feature_id)
+    return groups
+
+
+def deduplicate_mgf(mgf_fp: str, output_fp: str, mz_tolerance: float = 0.01,
+                    rt_tolerance: float = 10.0) -> OrderedDict:
+    '''Write the first feature of each group of duplicates to a new file
+
+    Returns
+    -------
+    OrderedDict of str to list of str
+        Identifier of each representative feature and of its duplicates.
+    '''
+    features = index_mgf(mgf_fp)
+    groups = group_features(mgf_fp, features, mz_tolerance, rt_tolerance)
+    write_features(mgf_fp, [feature for feature in features
+                            if feature.feature_id in groups], output_fp)
+    return groups
+
+
+def fan_out(workspace: str, groups: dict):
+    '''Copy the output of each representative feature to its duplicates
+
+    Per-feature folders are linked under the identifier of every duplicate,
+    numbered after the existing folders, and the rows of the representative
+    in top-level tables (matched by ``experimentName``) are repeated for
+    each duplicate.
+
+    Parameters
+    ----------
+    workspace : str
+        SIRIUS output directory with the results of the representatives.
+    groups : dict of str to list of str
+        Identifiers of the duplicates of each representative feature.
+    '''
+    folders = {feature_id(name): name for name in os.listdir(workspace)
+               if os.path.isdir(os.path.join(workspace, name))}
+    index = max([int(name.split('_', 1)[0]) for name in folders.values()
+                 if name.split('_', 1)[0].isdigit()] or [0])
+
+    for representative, duplicates in groups.items():
+        name = folders.get(representative)
+        if name is None:
+            continue
+        source = name.split('_')[1]
+        for duplicate in duplicates:
+            index += 1
+            link_tree(os.path.join(workspace, name),
+                      os.path.join(workspace, '%d_%s_%s' % (index, source,
+                                                            duplicate)))
+
+    for name in os.listdir(workspace):
+        path = os.path.join(workspace, name)
+        if os.path.isdir(path):
+            continue
+        with open(path) as f:
+            lines = f.readlines()
+        columns = lines[0].rstrip('\n').split('\t') if lines else []
+        if 'experimentName' not in columns:
+            continue
+
+        column = columns.index('experimentName')
+        rows = [lines[0]]
+        for line in lines[1:]:
+            rows.append(line)
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) <= column:
+                continue
+            for duplicate in groups.get(fields[column], []):
+                fields[column] = duplicate
+                rows.append('\t'.join(fields) + '\n')
+
+        # the table is replaced rather than rewritten in place, as it may
+        # share its data with a cached copy
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as out:
+            out.writelines(rows)
+        os.replace(tmp, path)
+
+
+def write_duplicates(groups: dict, output_fp: str):
+    with open(output_fp, 'w') as f:
+        f.write('#featureID\trepresentative\n')
+        for representative, duplicates in groups.items():
+            for duplicate in duplicates:
+                f.write('%s\t%s\n' % (duplicate, representative))
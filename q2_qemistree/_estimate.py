@@ -0,0 +1,84 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import pkg_resources
+import q2templates
+
+from ._semantics import MGFDirFmt
+from ._mgf import index_mgf
+from ._filter import select_features
+from ._resources import MB, estimate_steps
+from ._progress import format_duration
+
+
+TEMPLATES = pkg_resources.resource_filename('q2_qemistree', 'assets')
+
+
+def estimate_runtime(output_dir: str, features: MGFDirFmt, profile: str,
+                     n_jobs: int = 1, database: str = 'all',
+                     fingerid_db: str = 'pubchem', tree_timeout: int = 1600,
+                     maxmz: int = 600, num_candidates: int = 50) -> None:
+    '''Count the features Sirius would process and estimate its runtime
+
+    The runtime and memory of each step are estimates from an uncalibrated
+    cost model (see ``q2_qemistree._resources``), and are labelled as such.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory where the visualization is written.
+    features : MGFDirFmt
+        MGF file for Sirius
+    profile: str
+        configuration profile for mass-spec platform used
+    n_jobs : int, optional
+        Number of cpu cores Sirius would use.
+    database: str, optional
+        search formulas in given database
+    fingerid_db : str, optional
+        Search structure in given database.
+    tree_timeout : int, optional
+        time for computation per fragmentation tree in seconds. 0 for an
+        infinite amount of time
+    maxmz : int, optional
+        considers compounds with a precursor mz lower or equal to this
+        value (int)
+    num_candidates: int, optional
+        number of fragmentation trees to compute per feature
+    '''
+    features = features.decompressed()
+    indexed = index_mgf(os.path.join(str(features.path), 'features.mgf'))
+    # Sirius skips these features, so they do not add to the runtime
+    kept, dropped = select_features(indexed, maxmz=maxmz,
+                                    drop_duplicates=False)
+    counts = [('features in the MGF file', len(indexed))]
+    counts += [('dropped, %s' % reason, len(ids))
+               for reason, ids in dropped.items() if ids]
+    counts.append(('processed by Sirius', len(kept)))
+
+    estimates = estimate_steps(kept, profile, database, fingerid_db, n_jobs,
+                               tree_timeout, num_candidates)
+
+    with open(os.path.join(output_dir, 'features.tsv'), 'w') as f:
+        f.write('features\tcount\n')
+        for label, count in counts:
+            f.write('%s\t%d\n' % (label, count))
+
+    rows = []
+    with open(os.path.join(output_dir, 'estimate.tsv'), 'w') as f:
+        f.write('step\testimated_wall_seconds\testimated_cpu_seconds\t'
+                'estimated_heap_bytes\n')
+        for step, (wall, cpu, heap) in estimates.items():
+            f.write('%s\t%.0f\t%.0f\t%d\n' % (step, wall, cpu, heap))
+            rows.append((step, format_duration(wall), '%.1f' % (cpu / 3600),
+                         '%d MB' % (heap // MB)))
+
+    index = os.path.join(TEMPLATES, 'estimate', 'index.html')
+    q2templates.render(index, output_dir, context={
+        'rows': rows, 'counts': counts, 'n_jobs': n_jobs})
@@ -0,0 +1,177 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import bisect
+import os
+from collections import OrderedDict
+
+import qiime2
+
+from ._semantics import MGFDirFmt
+from ._mgf import index_mgf, write_features, write_index, write_subset
+
+
+def select_features(features: list, maxmz: int = 600, min_peaks: int = 1,
+                    drop_duplicates: bool = True, mz_tolerance: float = 0.01,
+                    rt_tolerance: float = 10.0):
+    '''Split indexed features into the ones SIRIUS can process and the rest
+
+    Parameters
+    ----------
+    features : list of Feature
+        Features of an MGF file, as returned by ``index_mgf``.
+    maxmz : int, optional
+        Features with a precursor m/z above this value are dropped.
+    min_peaks : int, optional
+        Features with fewer MS2 peaks than this are dropped.
+    drop_duplicates : bool, optional
+        Drop features with the same precursor m/z and retention time as an
+        earlier feature that is kept.
+    mz_tolerance : float, optional
+        Maximum difference in Da between the precursor m/z of duplicated
+        features, as in ``same_compound``.
+    rt_tolerance : float, optional
+        Maximum difference in seconds between the retention times of
+        duplicated features, as in ``same_compound``.
+
+    Returns
+    -------
+    list of Feature
+        Features that are kept, in input order.
+    OrderedDict of str to list
+        For each reason a feature was dropped, the identifiers of the
+        features dropped for that reason.
+    '''
+    # (precursor m/z, retention time) of the features kept, sorted
+    kept, precursors = [], []
+    dropped = OrderedDict((reason, []) for reason in [
+        'precursor m/z above %d' % maxmz, 'no MS2 records',
+        'fewer than %d MS2 peaks' % min_peaks, 'duplicated precursor'])
+    mz_reason, ms2_reason, peaks_reason, duplicate_reason = dropped
+
+    for feature in features:
+        if feature.pepmass is not None and feature.pepmass > maxmz:
+            reason = mz_reason
+        elif feature.ms2 < 1:
+            reason = ms2_reason
+        elif feature.peaks < min_peaks:
+            reason = peaks_reason
+        elif drop_duplicates and _duplicated(precursors, feature,
+                                             mz_tolerance, rt_tolerance):
+            reason = duplicate_reason
+        else:
+            if feature.pepmass is not None:
+                bisect.insort(precursors, (feature.pepmass, feature.rt or 0,
+                                           feature.rt is None))
+            kept.append(feature)
+            continue
+        dropped[reason].append(feature.feature_id)
+
+    return kept, dropped
+
+
+def _duplicated(precursors, feature, mz_tolerance, rt_tolerance):
+    # features without a precursor m/z are never duplicates, as in
+    # same_compound, and only precursors within the m/z window are compared
+    if feature.pepmass is None:
+        return False
+    start = bisect.bisect_left(precursors,
+                               (feature.pepmass - mz_tolerance,))
+    for i in range(start, len(precursors)):
+        pepmass, rt, no_rt = precursors[i]
+        if pepmass > feature.pepmass + mz_tolerance:
+            break
+        if no_rt != (feature.rt is None):
+            continue
+        if no_rt or abs(rt - feature.rt) <= rt_tolerance:
+            return True
+    return False
+
+
+def filter_features(features: MGFDirFmt, maxmz: int = 600,
+                    min_peaks: int = 1,
+                    drop_duplicates: bool = True) -> MGFDirFmt:
+    '''Remove features that SIRIUS would reject or compute twice
+
+    Parameters
+    ----------
+    features : MGFDirFmt
+        MGF file for Sirius
+    maxmz : int, optional
+        Features with a precursor m/z above this value are removed, as
+        Sirius does not consider them.
+    min_peaks : int, optional
+        Features with fewer peaks than this across all their MS2 records are
+        removed.
+    drop_duplicates : bool, optional
+        Remove features with the same precursor m/z (within 0.01 Da) and
+        retention time (within 10 seconds) as an earlier feature in the file.
+
+    Raises
+    ------
+    ValueError
+        If no features are left after filtering.
+
+    Returns
+    -------
+    MGFDirFmt
+        MGF file with the remaining features.
+    '''
+    features = features.decompressed()
+    mgf = os.path.join(str(features.path), 'features.mgf')
+    indexed = index_mgf(mgf)
+    kept, dropped = select_features(indexed, maxmz, min_peaks,
+                                    drop_duplicates)
+
+    print('Kept %d of %d features' % (len(kept), len(indexed)))
+    for reason, ids in dropped.items():
+        if ids:
+            print('Dropped %d features with %s: %s%s'
+                  % (len(ids), reason, ', '.join(ids[:10]),
+                     ', ...' if len(ids) > 10 else ''))
+
+    if not kept:
+        raise ValueError('None of the features passed the filters')
+
+    result = MGFDirFmt()
+    output = os.path.join(str(result.path), 'features.mgf')
+    write_index(write_features(mgf, kept, output), output)
+    return result
+
+
+def subset_features(features: MGFDirFmt,
+                    metadata: qiime2.Metadata) -> MGFDirFmt:
+    '''Extract the features listed in a metadata file
+
+    If the MGF file is indexed (as it is when imported), only the records of
+    the features extracted are read, so the time taken depends on the size
+    of the subset rather than that of the whole file.
+
+    Parameters
+    ----------
+    features : MGFDirFmt
+        MGF file for Sirius
+    metadata : qiime2.Metadata
+        Metadata whose IDs are the feature identifiers to extract.
+
+    Raises
+    ------
+    ValueError
+        If some of the IDs are not feature identifiers of the MGF file.
+
+    Returns
+    -------
+    MGFDirFmt
+        Indexed MGF file with the features extracted, in the order of the
+        input file.
+    '''
+    features = features.decompressed()
+    result = MGFDirFmt()
+    write_subset(os.path.join(str(features.path), 'features.mgf'),
+                 metadata.ids, os.path.join(str(result.path), 'features.mgf'))
+    return result
@@ -6,50 +6,609 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
-import subprocess
+import filecmp
+import functools
+import glob
+import shutil
+import tempfile
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from ._semantics import MGFDirFmt, SiriusDirFmt, ZodiacDirFmt, CSIDirFmt
+from ._mgf import (concatenate_mgf, index_mgf, read_features, write_features,
+                   write_shards)
+from ._cache import ResultCache, feature_id, hash_path
+from ._links import link_or_copy, link_tree, share_files
+from ._compact import compact_trees, compact_csi
+from ._dedup import DUPLICATES, deduplicate_mgf, fan_out, write_duplicates
+from ._partition import partition_features
+from ._launcher import Launcher, parse_cpus, split_cpus
+from ._progress import Progress
+from ._usage import merge_usage
+from ._watchdog import Watchdog
+from ._resources import (HEAP_FRACTION, available_resources,
+                         estimate_resources, feature_cost, heaviest_shard,
+                         with_heap)
 
 
-def run_command(cmd, output_fp, error_fp, verbose=True):
-    if verbose:
-        print("Running external command line application. This may print "
-              "messages to stdout and/or stderr.")
-        print("The command being run is below. This command cannot "
-              "be manually re-run as it will depend on temporary files that "
-              "no longer exist.")
-        print("\nCommand:", end=' ')
-        print(" ".join(cmd), end='\n\n')
+def artifactory(sirius_path: str, parameters: list, java_flags: str = None,
+                constructor=None, cpu_affinity: str = None,
+                niceness: int = 0, monitors: list = ()):
+    artifact = constructor()
+    cpus = None if cpu_affinity is None else parse_cpus(cpu_affinity)
+    launcher = Launcher(sirius_path, java_flags, cpus, niceness)
 
-    with open(output_fp, 'w') as output_f, open(error_fp, 'w') as error_f:
-        subprocess.run(cmd, stdout=output_f, stderr=error_f, check=True)
+    stdout = os.path.join(str(artifact.path), 'stdout.txt')
+    stderr = os.path.join(str(artifact.path), 'stderr.txt')
 
+    launcher.run(['-o', artifact.get_path()] + parameters, stdout, stderr,
+                 monitors=monitors)
 
-def artifactory(sirius_path: str, parameters: list, java_flags: str = None,
-                constructor=None):
+    return artifact
+
+
+def merge_workspaces(workspaces: list, destination: str,
+                     link: bool = False):
+    '''Merge SIRIUS output directories with disjoint features into one
+
+    Per-feature folders are renumbered so that their index prefix stays
+    unique. Top-level tables that differ between workspaces (e.g. per-feature
+    summaries) are concatenated, keeping a single header, and files that are
+    identical in all the workspaces (e.g. ``version.txt`` or
+    ``fingerprints.csv``) are copied once. Per-feature folders are moved out
+    of the workspaces, or linked if ``link`` is true so that the workspaces
+    are left untouched.
+    '''
+    os.makedirs(destination, exist_ok=True)
+
+    index, files = 0, {}
+    for workspace in workspaces:
+        for name in sorted(os.listdir(workspace), key=_folder_index):
+            path = os.path.join(workspace, name)
+            if os.path.isdir(path):
+                index += 1
+                name = '%d_%s' % (index, name.split('_', 1)[1])
+                if link:
+                    link_tree(path, os.path.join(destination, name))
+                else:
+                    shutil.move(path, os.path.join(destination, name))
+            else:
+                files.setdefault(name, []).append(path)
+
+    for name, paths in files.items():
+        output = os.path.join(destination, name)
+        if all(filecmp.cmp(paths[0], path, shallow=False)
+               for path in paths[1:]):
+            link_or_copy(paths[0], output)
+            continue
+
+        with open(output, 'w') as out:
+            for n, path in enumerate(paths):
+                with open(path) as f:
+                    header = f.readline()
+                    if n == 0:
+                        out.write(header)
+                    shutil.copyfileobj(f, out)
+
+
+def _folder_index(name):
+    # SIRIUS names per-feature folders as <index>_<source>_<feature id>
+    prefix = name.split('_', 1)[0]
+    return (0, int(prefix), name) if prefix.isdigit() else (1, 0, name)
+
+
+# outputs of the shards of a run, relative to its artifact, which are only
+# left behind if the run is killed before they are merged
+SHARD_OUTPUTS = os.path.join('shard-*', 'output')
+# batches of requeued_artifactory, relative to its artifact
+REQUEUED_BATCHES = os.path.join('requeue', 'batch-*')
+
+
+def sharded_artifactory(sirius_path: str, parameters: list, mgf_fp: str,
+                        n_shards: int, java_flags: str = None,
+                        constructor=None, cpu_affinity: str = None,
+                        niceness: int = 0, cost=None, monitors: list = ()):
+    '''Run one SIRIUS process per feature-disjoint shard of an MGF file
+
+    The shards are computed at the same time and their outputs merged into a
+    single artifact, as if SIRIUS had been run once on the whole input. If
+    ``cpu_affinity`` is specified, the CPUs are divided among the shards. If
+    a ``cost`` function is specified, the shards are balanced by cost and
+    each shard computes its most expensive features first.
+    '''
     artifact = constructor()
     if not os.path.exists(sirius_path):
         raise OSError("SIRIUS could not be located")
-    sirius = os.path.join(sirius_path, 'sirius')
 
-    initial_flags = os.environ.get('_JAVA_OPTIONS', '')
-    if java_flags is not None:
-        # append the flags to any existing options
-        os.environ['_JAVA_OPTIONS'] = initial_flags + ' ' + java_flags
-    cmdsir = ([sirius, '-o', artifact.get_path()] + parameters)
+    # the shards are written to fixed directories of the artifact (see
+    # SHARD_OUTPUTS), so that the features finished by a run that is killed
+    # can be found when it is resumed
+    inputs = write_shards(mgf_fp, n_shards, str(artifact.path), cost)
+    try:
+        _run_shards(sirius_path, artifact,
+                    [(os.path.dirname(fp), parameters + [fp])
+                     for fp in inputs], java_flags, cpu_affinity, niceness,
+                    monitors, 'shard')
+    finally:
+        for fp in inputs:
+            shutil.rmtree(os.path.dirname(fp))
+    return artifact
 
-    stdout = os.path.join(str(artifact.path), 'stdout.txt')
-    stderr = os.path.join(str(artifact.path), 'stderr.txt')
 
-    run_command(cmdsir, stdout, stderr)
+def _run_shards(sirius_path, artifact, shards, java_flags, cpu_affinity,
+                niceness, monitors, label, max_workers=None):
+    # run SIRIUS in each (directory, parameters) shard, at most max_workers
+    # at a time, and merge the outputs into the artifact
+    max_workers = max_workers or len(shards)
+    outputs = [os.path.join(shard_dir, 'output') for shard_dir, _ in shards]
+
+    if cpu_affinity is None:
+        cpus = [None] * len(shards)
+    else:
+        cpus = split_cpus(parse_cpus(cpu_affinity), max_workers)
+        cpus = [cpus[n % len(cpus)] for n in range(len(shards))]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for (shard_dir, parameters), output, shard_cpus in zip(
+                shards, outputs, cpus):
+            launcher = Launcher(sirius_path, java_flags, shard_cpus,
+                                niceness)
+            futures.append(executor.submit(
+                launcher.run, ['-o', output] + parameters,
+                os.path.join(shard_dir, 'stdout.txt'),
+                os.path.join(shard_dir, 'stderr.txt'),
+                monitors=monitors))
+    errors = [future.exception() for future in futures
+              if future.exception() is not None]
+
+    # merge the outputs even if a shard failed, so that the features that
+    # did finish are kept when the run is resumed
+    merge_workspaces([output for output in outputs
+                      if os.path.isdir(output)], artifact.get_path())
+
+    for log in ['stdout.txt', 'stderr.txt']:
+        with open(os.path.join(str(artifact.path), log), 'w') as out:
+            for n, (shard_dir, _) in enumerate(shards):
+                out.write('# %s %d\n' % (label, n))
+                shard_log = os.path.join(shard_dir, log)
+                if os.path.exists(shard_log):
+                    with open(shard_log) as f:
+                        shutil.copyfileobj(f, out)
+    merge_usage([('%s %d' % (label, n), shard_dir)
+                 for n, (shard_dir, _) in enumerate(shards)],
+                str(artifact.path), concurrent=max_workers >= len(shards))
+
+    if errors:
+        raise errors[0]
+
+
+def partitioned_zodiac(sirius_path: str, parameters: list,
+                       fragmentation_trees: str, mgf_fp: str, groups: list,
+                       java_flags: str = None, cpu_affinity: str = None,
+                       niceness: int = 0, monitors: list = (),
+                       max_workers: int = 1) -> ZodiacDirFmt:
+    '''Rerank the molecular formulas of groups of features separately
+
+    Each group gets a workspace with links to the fragmentation trees of its
+    features and an MGF file with their spectra, and Zodiac runs on at most
+    ``max_workers`` groups at a time. The outputs are merged into a single
+    artifact, as with ``sharded_artifactory``.
+
+    Parameters
+    ----------
+    parameters : list of str
+        Zodiac parameters other than ``--sirius`` and ``--spectra``.
+    fragmentation_trees : str
+        SIRIUS output directory with the trees of all the features.
+    mgf_fp : str
+        MGF file with the spectra of all the features.
+    groups : list of list of Feature
+        Disjoint groups of features, see ``partition_features``.
+    '''
+    artifact = ZodiacDirFmt()
+    if not os.path.exists(sirius_path):
+        raise OSError("SIRIUS could not be located")
+
+    folders = {}
+    for name in os.listdir(fragmentation_trees):
+        path = os.path.join(fragmentation_trees, name)
+        if os.path.isdir(path):
+            folders[feature_id(name)] = name
+
+    with tempfile.TemporaryDirectory(dir=str(artifact.path)) as tmp:
+        shards = []
+        for n, group in enumerate(groups):
+            group_dir = os.path.join(tmp, 'group-%d' % n)
+            workspace = os.path.join(group_dir, 'sirius')
+            os.makedirs(workspace)
+            for name in os.listdir(fragmentation_trees):
+                if not os.path.isdir(os.path.join(fragmentation_trees, name)):
+                    link_or_copy(os.path.join(fragmentation_trees, name),
+                                 os.path.join(workspace, name))
+            for feature in group:
+                name = folders.get(feature.feature_id)
+                if name is not None:
+                    link_tree(os.path.join(fragmentation_trees, name),
+                              os.path.join(workspace, name))
+            spectra = os.path.join(group_dir, 'features.mgf')
+            write_features(mgf_fp, group, spectra)
+            shards.append((group_dir, ['--zodiac', '--sirius', workspace] +
+                           parameters + ['--spectra', spectra]))
+
+        _run_shards(sirius_path, artifact, shards, java_flags, cpu_affinity,
+                    niceness, monitors, 'group', max_workers)
+    return artifact
+
+
+def cached_artifactory(constructor, cache: ResultCache, keys: dict, run):
+    '''Assemble an artifact from cached per-feature results
+
+    Parameters
+    ----------
+    constructor : type
+        Directory format of the artifact.
+    cache : ResultCache
+        Cache to read results from and store new results in.
+    keys : dict of str to str
+        Cache key of each feature identifier, in input order.
+    run : callable
+        Called with the list of missing feature identifiers and a temporary
+        directory, computes the missing features and returns them as a
+        ``constructor`` instance.
+    '''
+    artifact = constructor()
+    hits = {fid: cache.get(key) for fid, key in keys.items()}
+    missing = [fid for fid, workspace in hits.items() if workspace is None]
+
+    logs = {'stdout.txt': 'Restored %d of %d features from the cache at %s'
+                          '\n' % (len(hits) - len(missing), len(hits),
+                                  cache.root),
+            'stderr.txt': ''}
+    with tempfile.TemporaryDirectory(dir=str(artifact.path)) as tmp:
+        workspaces = []
+        for workspace in hits.values():
+            if workspace is not None:
+                staged = os.path.join(tmp, 'cached-%d' % len(workspaces))
+                link_tree(workspace, staged)
+                workspaces.append(staged)
 
-    if java_flags is not None:
-        os.environ['_JAVA_OPTIONS'] = initial_flags
+        if missing:
+            result = run(missing, tmp)
+            cache.put_features({fid: keys[fid] for fid in missing},
+                               result.get_path())
+            workspaces.append(result.get_path())
+
+            for log in logs:
+                with open(os.path.join(str(result.path), log)) as f:
+                    logs[log] += f.read()
+            merge_usage([('missing features', str(result.path))],
+                        str(artifact.path), concurrent=False)
+
+        merge_workspaces(workspaces, artifact.get_path())
+
+    for log, contents in logs.items():
+        with open(os.path.join(str(artifact.path), log), 'w') as f:
+            f.write(contents)
+
+    return artifact
+
+
+def _attempt_workspaces(constructor, attempt):
+    # the output of an attempt, and those of the shards and batches it did
+    # not get to merge because it was killed
+    output = constructor(attempt, mode='r').get_path()
+    folder = os.path.relpath(output, attempt)
+    patterns = [folder, SHARD_OUTPUTS,
+                os.path.join(REQUEUED_BATCHES, folder),
+                os.path.join(REQUEUED_BATCHES, SHARD_OUTPUTS)]
+    return [path for pattern in patterns
+            for path in sorted(glob.glob(os.path.join(attempt, pattern)))
+            if os.path.isdir(path)]
+
+
+def resumable_artifactory(constructor, work_dir: str, key: str,
+                          feature_ids: list, complete, run):
+    '''Run SIRIUS in a persistent directory, skipping completed features
+
+    Every call adds an attempt to ``work_dir``. Per-feature outputs that are
+    complete in a previous attempt are kept and SIRIUS is only run for the
+    remaining features, so an interrupted run can be resumed by calling
+    this function again. The attempts are linked into the returned artifact
+    and only removed once they are all merged, so a run killed while merging
+    can still be resumed.
+
+    Parameters
+    ----------
+    constructor : type
+        Directory format of the artifact.
+    work_dir : str
+        Directory where the attempts are stored.
+    key : str
+        Identifier of the inputs and parameters of the run. Resuming with a
+        different key is an error.
+    feature_ids : list of str
+        Identifiers of all the features of the input.
+    complete : callable
+        Called with the path to a per-feature output folder, returns whether
+        that feature finished.
+    run : callable
+        Called with the list of missing feature identifiers and the path to
+        a new attempt directory, computes the missing features writing them
+        to a ``constructor`` instance at that path.
+
+    Raises
+    ------
+    ValueError
+        If ``work_dir`` was used with different inputs or parameters.
+    '''
+    os.makedirs(work_dir, exist_ok=True)
+    key_fp = os.path.join(work_dir, 'key.txt')
+    if os.path.exists(key_fp):
+        with open(key_fp) as f:
+            if f.read().strip() != key:
+                raise ValueError('The working directory "%s" was used with '
+                                 'different inputs or parameters, a new '
+                                 'directory is needed' % work_dir)
+    else:
+        with open(key_fp, 'w') as f:
+            f.write(key)
+
+    attempts = sorted((name for name in os.listdir(work_dir)
+                       if name.startswith('attempt-')),
+                      key=lambda name: int(name.split('-')[1]))
+    attempts = [os.path.join(work_dir, name) for name in attempts]
+
+    done, workspaces = set(), []
+    for attempt in attempts:
+        for workspace in _attempt_workspaces(constructor, attempt):
+            for name in os.listdir(workspace):
+                path = os.path.join(workspace, name)
+                if not os.path.isdir(path):
+                    continue
+                # drop unfinished outputs and features completed earlier on
+                if feature_id(name) in done or not complete(path):
+                    shutil.rmtree(path)
+                else:
+                    done.add(feature_id(name))
+            workspaces.append(workspace)
+
+    missing = [fid for fid in feature_ids if fid not in done]
+    if missing:
+        index = int(attempts[-1].rsplit('-', 1)[1]) + 1 if attempts else 0
+        attempt = os.path.join(work_dir, 'attempt-%d' % index)
+        os.makedirs(attempt)
+        attempts.append(attempt)
+
+        run(missing, attempt)
+        workspaces.append(constructor(attempt, mode='r').get_path())
+
+    # the outputs are linked rather than moved, so that the attempts keep
+    # them until the artifact is complete
+    artifact = constructor()
+    merge_workspaces(workspaces, artifact.get_path(), link=True)
+
+    for log in ['stdout.txt', 'stderr.txt']:
+        with open(os.path.join(str(artifact.path), log), 'w') as out:
+            for attempt in attempts:
+                out.write('# %s\n' % os.path.basename(attempt))
+                attempt_log = os.path.join(attempt, log)
+                if os.path.exists(attempt_log):
+                    with open(attempt_log) as f:
+                        shutil.copyfileobj(f, out)
+    merge_usage([(os.path.basename(attempt), attempt)
+                 for attempt in attempts], str(artifact.path),
+                concurrent=False)
+
+    # only now that all the attempts are merged can they be removed
+    for attempt in attempts:
+        shutil.rmtree(attempt)
+    os.remove(key_fp)
 
     return artifact
 
 
+def requeued_artifactory(constructor, feature_ids: list, complete, run):
+    '''Run SIRIUS, requeueing the features of processes that hang
+
+    When a run is stopped by a ``Watchdog``, the features it completed are
+    kept and the rest are requeued as two smaller batches, so that a
+    feature that hangs SIRIUS ends up in a batch of its own. Such features
+    are skipped instead of failing the whole run, and are listed in
+    ``skipped_features.txt``.
+
+    Parameters
+    ----------
+    constructor : type
+        Directory format of the artifact.
+    feature_ids : list of str
+        Identifiers of all the features of the input.
+    complete : callable
+        Called with the path to a per-feature output folder, returns whether
+        that feature finished.
+    run : callable
+        Called with a list of feature identifiers and the path to a new
+        batch directory, computes those features writing them to a
+        directory format at that path.
+    '''
+    artifact = constructor()
+    fmt = type(artifact)
+    pending, done, skipped = [list(feature_ids)], set(), []
+
+    # the batches are in fixed directories (see REQUEUED_BATCHES) for the
+    # same reason as the shards of sharded_artifactory
+    tmp = os.path.join(str(artifact.path), os.path.dirname(REQUEUED_BATCHES))
+    try:
+        batches, workspaces = [], []
+        while pending:
+            batch = pending.pop(0)
+            batch_dir = os.path.join(tmp, 'batch-%d' % len(batches))
+            os.makedirs(batch_dir)
+            batches.append(batch_dir)
+
+            try:
+                run(batch, batch_dir)
+                error = None
+            except TimeoutError as e:
+                error = e
+
+            workspace = fmt(batch_dir, mode='r').get_path()
+            if os.path.isdir(workspace):
+                for name in os.listdir(workspace):
+                    path = os.path.join(workspace, name)
+                    if not os.path.isdir(path):
+                        continue
+                    if feature_id(name) in done or not complete(path):
+                        shutil.rmtree(path)
+                    else:
+                        done.add(feature_id(name))
+                workspaces.append(workspace)
+
+            if error is None:
+                continue
+            left = [fid for fid in batch if fid not in done]
+            if len(left) == 1:
+                skipped.extend(left)
+            elif left:
+                middle = len(left) // 2
+                pending.extend([left[:middle], left[middle:]])
+
+        merge_workspaces(workspaces, artifact.get_path())
+
+        for log in ['stdout.txt', 'stderr.txt']:
+            with open(os.path.join(str(artifact.path), log), 'w') as out:
+                for batch_dir in batches:
+                    out.write('# %s\n' % os.path.basename(batch_dir))
+                    batch_log = os.path.join(batch_dir, log)
+                    if os.path.exists(batch_log):
+                        with open(batch_log) as f:
+                            shutil.copyfileobj(f, out)
+                if log == 'stdout.txt' and skipped:
+                    out.write('Skipped %d features that hung SIRIUS: %s\n' %
+                              (len(skipped), ', '.join(skipped)))
+        merge_usage([(os.path.basename(batch_dir), batch_dir)
+                     for batch_dir in batches], str(artifact.path),
+                    concurrent=False)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if skipped:
+        with open(os.path.join(str(artifact.path), 'skipped_features.txt'),
+                  'w') as f:
+            f.write(''.join(fid + '\n' for fid in skipped))
+
+    return artifact
+
+
+def _watchdogs(stall_timeout, max_runtime):
+    # the timeouts are given in minutes
+    if not stall_timeout and not max_runtime:
+        return []
+    return [Watchdog(stall_timeout * 60, max_runtime * 60)]
+
+
+def _has_files(folder):
+    def complete(path):
+        path = os.path.join(path, folder)
+        return os.path.isdir(path) and len(os.listdir(path)) > 0
+    return complete
+
+
+def complete_csi_summary(workspace: str):
+    '''Add the features missing from ``summary_csi_fingerid.csv``
+
+    SIRIUS writes the top-level summary once all features are done, so the
+    rows of features from an interrupted attempt are rebuilt from the top
+    candidate in their per-feature summary.
+    '''
+    summary_fp = os.path.join(workspace, 'summary_csi_fingerid.csv')
+    header, found = None, set()
+    found_header = (os.path.exists(summary_fp) and
+                    os.path.getsize(summary_fp) > 0)
+    if found_header:
+        with open(summary_fp) as f:
+            header = f.readline().rstrip('\n').split('\t')
+            column = header.index('experimentName')
+            found = {line.rstrip('\n').split('\t')[column] for line in f}
+
+    rows = []
+    for name in sorted(os.listdir(workspace), key=_folder_index):
+        fp = os.path.join(workspace, name, 'summary_csi_fingerid.csv')
+        if feature_id(name) in found or not os.path.exists(fp):
+            continue
+        with open(fp) as f:
+            columns = f.readline().rstrip('\n').split('\t')
+            top = f.readline().rstrip('\n')
+        if not top:
+            continue
+
+        if header is None:
+            header = ['source', 'experimentName', 'confidence'] + columns
+        values = dict(zip(columns, top.split('\t')))
+        values['source'] = name.split('_', 2)[1]
+        values['experimentName'] = feature_id(name)
+        rows.append([values.get(column, '') for column in header])
+
+    if not rows:
+        return
+
+    # the summary is rewritten instead of appended to, as it may share its
+    # data with the file it was merged from
+    lines = []
+    if found_header:
+        with open(summary_fp) as f:
+            lines = f.readlines()
+    else:
+        lines = ['\t'.join(header) + '\n']
+    lines.extend('\t'.join(row) + '\n' for row in rows)
+
+    tmp = summary_fp + '.tmp'
+    with open(tmp, 'w') as out:
+        out.writelines(lines)
+    os.replace(tmp, summary_fp)
+
+
+def _cache_parameters(sirius_path, parameters):
+    # the number of processors and the size of the compound buffers do not
+    # change the results
+    parameters = list(parameters)
+    for flag in ['--processors', '--initial-compound-buffer',
+                 '--max-compound-buffer']:
+        if flag in parameters:
+            index = parameters.index(flag)
+            del parameters[index:index + 2]
+    return [os.path.realpath(sirius_path)] + parameters
+
+
+def _host_share(java_flags, n_jobs, cpu_affinity, concurrent=1):
+    # resources of a stage that processes all the features jointly, so the
+    # whole host goes to a single SIRIUS process (or is divided among
+    # concurrent ones)
+    cpus = None if cpu_affinity is None else parse_cpus(cpu_affinity)
+    memory, processors = available_resources(cpus, concurrent)
+    return with_heap(java_flags, int(memory * HEAP_FRACTION)), processors
+
+
+def _batch_features(features) -> MGFDirFmt:
+    '''Concatenate several MGF files into one, see ``concatenate_mgf``
+
+    A single MGF file is returned as is, without prefixing its feature
+    identifiers, unless it is compressed. Compressed MGF files are
+    decompressed to temporary directories, so the result should be kept
+    for as long as its MGF file is used.
+    '''
+    if isinstance(features, MGFDirFmt):
+        return features.decompressed()
+    features = list(features)
+    if len(features) == 1:
+        return features[0].decompressed()
+    batch = MGFDirFmt()
+    concatenate_mgf([os.path.join(str(f.decompressed().path), 'features.mgf')
+                     for f in features],
+                    os.path.join(str(batch.path), 'features.mgf'))
+    return batch
+
+
 def compute_fragmentation_trees(sirius_path: str, features: MGFDirFmt,
                                 ppm_max: int, profile: str,
                                 tree_timeout: int = 1600,
@@ -57,15 +616,27 @@ def compute_fragmentation_trees(sirius_path: str, features: MGFDirFmt,
                                 num_candidates: int = 50,
                                 database: str = 'all',
                                 ionization_mode: str = 'auto',
-                                java_flags: str = None) -> SiriusDirFmt:
+                                java_flags: str = None,
+                                n_shards: int = 1,
+                                cache_dir: str = None,
+                                cache_max_size: int = 10240,
+                                work_dir: str = None,
+                                cpu_affinity: str = None,
+                                niceness: int = 0,
+                                resources: str = 'manual',
+                                progress_file: str = None,
+                                stall_timeout: int = 0,
+                                max_runtime: int = 0,
+                                compact: bool = False) -> SiriusDirFmt:
     '''Compute fragmentation trees for candidate molecular formulas.
 
     Parameters
     ----------
     sirius_path : str
         Path to Sirius executable (without including the word sirius).
-    features : MGFDirFmt
-        MGF file for Sirius
+    features : MGFDirFmt or list of MGFDirFmt
+        MGF file for Sirius. Several files are computed in a single run, with
+        the feature identifiers of the n-th file prefixed by `n-`.
     ppm_max : int
         allowed parts per million tolerance for decomposing masses
     profile: str
@@ -88,6 +659,45 @@ def compute_fragmentation_trees(sirius_path: str, features: MGFDirFmt,
         `negative`.
     java_flags : str, optional
         Setup additional flags for the Java virtual machine.
+    n_shards : int, optional
+        Number of feature-disjoint shards the MGF file is split into. Each
+        shard is processed by its own SIRIUS process, and `n_jobs` cores are
+        divided evenly among them. Features are balanced across shards by
+        their expected cost (from their precursor m/z and number of MS2
+        peaks) and the most expensive ones are computed first.
+    cache_dir : str, optional
+        Directory of a cache of per-feature results. Features whose MGF
+        records and parameters match a cached result are not recomputed.
+    cache_max_size : int, optional
+        Maximum size of the cache in megabytes.
+    work_dir : str, optional
+        Persistent directory SIRIUS writes to while running. If a previous
+        run with the same inputs and parameters was interrupted, only the
+        features it did not complete are computed.
+    cpu_affinity : str, optional
+        CPUs SIRIUS is allowed to run on, e.g. `0-3,8`.
+    niceness : int, optional
+        Niceness added to the SIRIUS processes.
+    resources : str, optional
+        One of `manual` or `auto`. With `auto` the heap size, compound
+        buffers and number of processors are chosen from the features in the
+        MGF file and the memory and CPUs available, overriding `n_jobs`. A
+        heap size set in `java_flags` is kept.
+    progress_file : str, optional
+        File the progress of SIRIUS is appended to as JSON lines while it
+        runs, in addition to being printed.
+    stall_timeout : int, optional
+        Minutes without new output after which a SIRIUS process is
+        considered hung and killed. Its unfinished features are requeued in
+        smaller batches, and features that hang SIRIUS on their own are
+        skipped. 0 disables the check.
+    max_runtime : int, optional
+        Minutes a SIRIUS process may run for before it is killed and its
+        unfinished features requeued as with `stall_timeout`. 0 disables the
+        limit.
+    compact : bool, optional
+        Remove the Graphviz renderings of the trees, which are not needed
+        by Zodiac.
 
     Returns
     -------
@@ -104,26 +714,120 @@ def compute_fragmentation_trees(sirius_path: str, features: MGFDirFmt,
     else:
         raise ValueError('The ionization_type "%s" is invalid')
 
+    batch = _batch_features(features)
+    mgf = os.path.join(str(batch.path), 'features.mgf')
+    buffers, processors = (1, 32), max(1, n_jobs // n_shards)
+    if resources == 'auto':
+        # every shard gets an equal share of the host, and is sized for the
+        # first shard, which holds the most expensive feature
+        cpus = None if cpu_affinity is None else parse_cpus(cpu_affinity)
+        shard = heaviest_shard(index_mgf(mgf), n_shards)
+        plan = estimate_resources(shard,
+                                  *available_resources(cpus, n_shards))
+        buffers = plan.initial_buffer, plan.max_buffer
+        processors = plan.processors
+        java_flags = with_heap(java_flags, plan.heap)
+
     params = ['--quiet',
-              '--initial-compound-buffer', str(1),
-              '--max-compound-buffer', str(32), '--profile', str(profile),
+              '--initial-compound-buffer', str(buffers[0]),
+              '--max-compound-buffer', str(buffers[1]),
+              '--profile', str(profile),
               '--database', str(database),
               '--candidates', str(num_candidates),
-              '--processors', str(n_jobs),
+              '--processors', str(processors),
               '--trust-ion-prediction', ionization_flag,
               '--maxmz', str(maxmz),
               '--tree-timeout', str(tree_timeout),
-              '--ppm-max', str(ppm_max),
-              os.path.join(str(features.path), 'features.mgf')]
+              '--ppm-max', str(ppm_max)]
+
+    watchdogs = _watchdogs(stall_timeout, max_runtime)
+
+    def launch(mgf, constructor=SiriusDirFmt):
+        progress = Progress('compute-fragmentation-trees',
+                            len(index_mgf(mgf)), _has_files('trees'),
+                            progress_file)
+        if n_shards == 1:
+            # SIRIUS reads the input file as it is, in the input order
+            return artifactory(sirius_path, params + [mgf], java_flags,
+                               constructor, cpu_affinity, niceness,
+                               [progress] + watchdogs)
+        return sharded_artifactory(sirius_path, params, mgf, n_shards,
+                                   java_flags, constructor, cpu_affinity,
+                                   niceness, feature_cost,
+                                   [progress] + watchdogs)
+
+    def run(mgf, constructor=SiriusDirFmt):
+        if not watchdogs:
+            return launch(mgf, constructor)
+
+        indexed = {f.feature_id: f for f in index_mgf(mgf)}
+
+        def run_batch(batch, batch_dir):
+            subset = os.path.join(batch_dir, 'features.mgf')
+            write_features(mgf, [indexed[fid] for fid in batch], subset)
+            launch(subset, functools.partial(SiriusDirFmt, batch_dir,
+                                             mode='r'))
+
+        return requeued_artifactory(constructor, list(indexed),
+                                    _has_files('trees'), run_batch)
+
+    def resume(mgf):
+        if work_dir is None:
+            return run(mgf)
+
+        indexed = {f.feature_id: f for f in index_mgf(mgf)}
+
+        def run_attempt(missing, attempt):
+            subset = os.path.join(attempt, 'features.mgf')
+            write_features(mgf, [indexed[fid] for fid in missing], subset)
+            run(subset, functools.partial(SiriusDirFmt, attempt, mode='r'))
+
+        key = ResultCache.key('trees', _cache_parameters(sirius_path, params),
+                              hash_path(mgf))
+        return resumable_artifactory(SiriusDirFmt, work_dir, key,
+                                     list(indexed), _has_files('trees'),
+                                     run_attempt)
+
+    def cached(mgf):
+        if cache_dir is None:
+            return resume(mgf)
+
+        cache = ResultCache(cache_dir, cache_max_size)
+        indexed = {f.feature_id: f for f in index_mgf(mgf)}
+        parameters = _cache_parameters(sirius_path, params)
+        keys = {fid: cache.key('trees', parameters, records)
+                for fid, records in zip(indexed,
+                                        read_features(mgf, indexed.values()))}
+
+        def run_missing(missing, tmp):
+            subset = os.path.join(tmp, 'features.mgf')
+            write_features(mgf, [indexed[fid] for fid in missing], subset)
+            return resume(subset)
 
-    return artifactory(sirius_path, params, java_flags, SiriusDirFmt)
+        return cached_artifactory(SiriusDirFmt, cache, keys, run_missing)
+
+    result = cached(mgf)
+    # the cache holds complete results, compacting only unlinks the files of
+    # this artifact
+    if compact:
+        compact_trees(result.get_path())
+    return result
 
 
 def rerank_molecular_formulas(sirius_path: str,
                               fragmentation_trees: SiriusDirFmt,
                               features: MGFDirFmt,
                               zodiac_threshold: float = 0.98, n_jobs: int = 1,
-                              java_flags: str = None) -> ZodiacDirFmt:
+                              java_flags: str = None, cache_dir: str = None,
+                              cache_max_size: int = 10240,
+                              cpu_affinity: str = None,
+                              niceness: int = 0,
+                              resources: str = 'manual',
+                              max_runtime: int = 0,
+                              zodiac_max_features: int = 0,
+                              zodiac_partition: str = 'similarity',
+                              zodiac_parallel_groups: int = 1
+                              ) -> ZodiacDirFmt:
     """Reranks molecular formula candidates generated by computing
        fragmentation trees
 
@@ -133,8 +837,9 @@ def rerank_molecular_formulas(sirius_path: str,
         Path to Sirius executable (without including the word sirius).
     fragmentation_trees : SiriusDirFmt
         Directory with computed fragmentation trees
-    features : MGFDirFmt
-        MGF file for Sirius
+    features : MGFDirFmt or list of MGFDirFmt
+        MGF file for Sirius, the same used to compute the fragmentation
+        trees.
     zodiac_threshold : float
         threshold filter for molecular formula re-ranking. Higher value
         recommended for less false positives (float)
@@ -143,6 +848,37 @@ def rerank_molecular_formulas(sirius_path: str,
         cores
     java_flags : str, optional
         Setup additional flags for the Java virtual machine.
+    cache_dir : str, optional
+        Directory of a cache of results. Zodiac reranks all the features
+        jointly, so results are only reused when the fragmentation trees,
+        the MGF file and the parameters all match a previous run.
+    cache_max_size : int, optional
+        Maximum size of the cache in megabytes.
+    cpu_affinity : str, optional
+        CPUs SIRIUS is allowed to run on, e.g. `0-3,8`.
+    niceness : int, optional
+        Niceness added to the SIRIUS processes.
+    resources : str, optional
+        One of `manual` or `auto`. With `auto` Zodiac uses all the memory and
+        CPUs available, overriding `n_jobs`. A heap size set in `java_flags`
+        is kept.
+    max_runtime : int, optional
+        Minutes Zodiac may run for before it is killed. Zodiac reranks all
+        the features jointly, so they can not be requeued and the step
+        fails. 0 disables the limit. There is no stall timeout, as Zodiac
+        only writes its output once it is done.
+    zodiac_max_features : int, optional
+        Maximum number of features Zodiac reranks jointly. Larger inputs are
+        split into groups of features that are reranked separately, which
+        bounds the size of the Zodiac graph. 0 reranks all the features
+        jointly.
+    zodiac_partition : str, optional
+        One of `similarity`, to group features connected by similar MS2
+        spectra, or `retention-time`, to group features by retention time
+        windows. See `q2_qemistree._partition`.
+    zodiac_parallel_groups : int, optional
+        Number of groups reranked at the same time. `n_jobs` (and with
+        `auto` resources, the memory) is divided among them.
 
     Returns
     -------
@@ -150,19 +886,78 @@ def rerank_molecular_formulas(sirius_path: str,
        Directory with reranked molecular formulas
     """
 
-    params = ['--zodiac', '--sirius',
-              str(fragmentation_trees.get_path()),
-              '--thresholdfilter', str(zodiac_threshold),
-              '--processors', str(n_jobs),
-              '--spectra', os.path.join(str(features.path), 'features.mgf')]
+    batch = _batch_features(features)
+    mgf = os.path.join(str(batch.path), 'features.mgf')
+    groups = []
+    if zodiac_max_features:
+        groups = partition_features(mgf, zodiac_max_features,
+                                    zodiac_partition)
+    parallel = min(zodiac_parallel_groups, len(groups)) if groups else 1
+
+    if resources == 'auto':
+        java_flags, n_jobs = _host_share(java_flags, n_jobs, cpu_affinity,
+                                         parallel)
+    else:
+        n_jobs = max(1, n_jobs // parallel)
+
+    params = ['--thresholdfilter', str(zodiac_threshold),
+              '--processors', str(n_jobs)]
+
+    def run():
+        if len(groups) > 1:
+            result = partitioned_zodiac(
+                sirius_path, params, str(fragmentation_trees.get_path()),
+                mgf, groups, java_flags, cpu_affinity, niceness,
+                _watchdogs(0, max_runtime), parallel)
+        else:
+            result = artifactory(
+                sirius_path, ['--zodiac', '--sirius',
+                              str(fragmentation_trees.get_path())] +
+                params + ['--spectra', mgf], java_flags, ZodiacDirFmt,
+                cpu_affinity, niceness, _watchdogs(0, max_runtime))
+        # Zodiac reads the tree folders in place (or hardlinked, when
+        # partitioned) and writes only spectra with the reranked formulas
+        # and summaries, so version.txt is the one file it carries over
+        share_files(result.get_path(), str(fragmentation_trees.get_path()),
+                    {'version.txt': 'version.txt'})
+        return result
+
+    if cache_dir is None:
+        return run()
+
+    cache = ResultCache(cache_dir, cache_max_size)
+    parameters = _cache_parameters(sirius_path, params)
+    if len(groups) > 1:
+        # features reranked in different groups do not inform each other
+        parameters += ['--groups', str(zodiac_max_features),
+                       zodiac_partition]
+    key = cache.key('zodiac', parameters,
+                    hash_path(fragmentation_trees.get_path()), hash_path(mgf))
+    workspace = cache.get(key)
+    if workspace is None:
+        result = run()
+        cache.put(key, result.get_path())
+        return result
 
-    return artifactory(sirius_path, params, java_flags, ZodiacDirFmt)
+    result = ZodiacDirFmt()
+    link_tree(workspace, result.get_path())
+    with open(os.path.join(str(result.path), 'stdout.txt'), 'w') as f:
+        f.write('Restored all features from the cache at %s\n' % cache.root)
+    open(os.path.join(str(result.path), 'stderr.txt'), 'w').close()
+    return result
 
 
 def predict_fingerprints(sirius_path: str, molecular_formulas: ZodiacDirFmt,
                          ppm_max: int, n_jobs: int = 1,
                          fingerid_db: str = 'pubchem',
-                         java_flags: str = None) -> CSIDirFmt:
+                         java_flags: str = None, cache_dir: str = None,
+                         cache_max_size: int = 10240,
+                         work_dir: str = None, cpu_affinity: str = None,
+                         niceness: int = 0,
+                         resources: str = 'manual',
+                         progress_file: str = None, stall_timeout: int = 0,
+                         max_runtime: int = 0,
+                         compact: bool = False) -> CSIDirFmt:
     """Predict molecular fingerprints
 
     Parameters
@@ -180,6 +975,38 @@ def predict_fingerprints(sirius_path: str, molecular_formulas: ZodiacDirFmt,
         Search structure in given database.
     java_flags : str, optional
         Setup additional flags for the Java virtual machine.
+    cache_dir : str, optional
+        Directory of a cache of per-feature results. Features whose reranked
+        spectra and parameters match a cached result are not recomputed.
+    cache_max_size : int, optional
+        Maximum size of the cache in megabytes.
+    work_dir : str, optional
+        Persistent directory SIRIUS writes to while running. If a previous
+        run with the same inputs and parameters was interrupted, only the
+        features it did not complete are computed.
+    cpu_affinity : str, optional
+        CPUs SIRIUS is allowed to run on, e.g. `0-3,8`.
+    niceness : int, optional
+        Niceness added to the SIRIUS processes.
+    resources : str, optional
+        One of `manual` or `auto`. With `auto` CSI:FingerID uses all the
+        memory and CPUs available, overriding `n_jobs`. A heap size set in
+        `java_flags` is kept.
+    progress_file : str, optional
+        File the progress of SIRIUS is appended to as JSON lines while it
+        runs, in addition to being printed.
+    stall_timeout : int, optional
+        Minutes without new output after which a SIRIUS process is
+        considered hung and killed. Its unfinished features are requeued in
+        smaller batches, and features that hang SIRIUS on their own are
+        skipped. 0 disables the check.
+    max_runtime : int, optional
+        Minutes a SIRIUS process may run for before it is killed and its
+        unfinished features requeued as with `stall_timeout`. 0 disables the
+        limit.
+    compact : bool, optional
+        Only keep the predicted fingerprints and the summaries read by
+        `make_hierarchy`, see `compact_fingerprints`.
 
     Returns
     -------
@@ -187,7 +1014,293 @@ def predict_fingerprints(sirius_path: str, molecular_formulas: ZodiacDirFmt,
         Directory with predicted fingerprints.
     """
 
+    if resources == 'auto':
+        java_flags, n_jobs = _host_share(java_flags, n_jobs, cpu_affinity)
+
     params = ['--processors', str(n_jobs), '--fingerid',
-              '--fingerid-db', str(fingerid_db), '--ppm-max', str(ppm_max),
-              molecular_formulas.get_path()]
-    return artifactory(sirius_path, params, java_flags, CSIDirFmt)
+              '--fingerid-db', str(fingerid_db), '--ppm-max', str(ppm_max)]
+    zodiac = molecular_formulas.get_path()
+
+    watchdogs = _watchdogs(stall_timeout, max_runtime)
+
+    def launch(zodiac, constructor=CSIDirFmt):
+        progress = Progress('predict-fingerprints', len(_spectra_ids(zodiac)),
+                            _has_files('fingerprints'), progress_file)
+        result = artifactory(sirius_path, params + [zodiac], java_flags,
+                             constructor, cpu_affinity, niceness,
+                             [progress] + watchdogs)
+        share_files(result.get_path(), zodiac,
+                    _carried_spectra(result.get_path(), zodiac))
+        return result
+
+    def run(zodiac, constructor=CSIDirFmt):
+        if not watchdogs:
+            return launch(zodiac, constructor)
+
+        def run_batch(batch, batch_dir):
+            subset = os.path.join(batch_dir, 'input')
+            _subset_spectra(zodiac, batch, subset)
+            launch(subset, functools.partial(CSIDirFmt, batch_dir, mode='r'))
+
+        result = requeued_artifactory(constructor, _spectra_ids(zodiac),
+                                      _has_files('fingerprints'), run_batch)
+        complete_csi_summary(result.get_path())
+        return result
+
+    def resume(zodiac):
+        if work_dir is None:
+            return run(zodiac)
+
+        def run_attempt(missing, attempt):
+            subset = os.path.join(attempt, 'input')
+            _subset_spectra(zodiac, missing, subset)
+            run(subset, functools.partial(CSIDirFmt, attempt, mode='r'))
+
+        key = ResultCache.key('fingerprints',
+                              _cache_parameters(sirius_path, params),
+                              hash_path(zodiac))
+        result = resumable_artifactory(CSIDirFmt, work_dir, key,
+                                       _spectra_ids(zodiac),
+                                       _has_files('fingerprints'),
+                                       run_attempt)
+        complete_csi_summary(result.get_path())
+        return result
+
+    def cached(zodiac):
+        if cache_dir is None:
+            return resume(zodiac)
+
+        cache = ResultCache(cache_dir, cache_max_size)
+        parameters = _cache_parameters(sirius_path, params)
+        keys = {feature_id(name): cache.key(
+                    'fingerprints', parameters,
+                    hash_path(os.path.join(zodiac, name)))
+                for name in sorted(os.listdir(zodiac))
+                if name.endswith('.ms')}
+
+        def run_missing(missing, tmp):
+            subset = os.path.join(tmp, 'input')
+            _subset_spectra(zodiac, missing, subset)
+            return resume(subset)
+
+        return cached_artifactory(CSIDirFmt, cache, keys, run_missing)
+
+    result = cached(zodiac)
+    if compact:
+        compact_csi(result.get_path())
+    return result
+
+
+def _spectra_ids(zodiac):
+    return [feature_id(name) for name in sorted(os.listdir(zodiac))
+            if name.endswith('.ms')]
+
+
+def _carried_spectra(csi, zodiac):
+    # CSI:FingerID keeps the Zodiac spectrum of each feature as the
+    # spectrum.ms of its folder, and recomputes the trees and rewrites
+    # everything else
+    spectra = {feature_id(name): name for name in os.listdir(zodiac)
+               if name.endswith('.ms')}
+    names = {'version.txt': 'version.txt'}
+    for name in os.listdir(csi):
+        if feature_id(name) in spectra:
+            names[os.path.join(name, 'spectrum.ms')] = \
+                spectra[feature_id(name)]
+    return names
+
+
+def _subset_spectra(zodiac, feature_ids, output):
+    # only the spectra of the given features are kept, the remaining
+    # top-level files are copied as they are
+    os.makedirs(output)
+    feature_ids = set(feature_ids)
+    for name in os.listdir(zodiac):
+        path = os.path.join(zodiac, name)
+        if name.endswith('.ms') and feature_id(name) not in feature_ids:
+            continue
+        if os.path.isdir(path):
+            link_tree(path, os.path.join(output, name))
+        else:
+            link_or_copy(path, os.path.join(output, name))
+
+
+def compute_fingerprints(sirius_path: str, features: MGFDirFmt,
+                         ppm_max: int, profile: str,
+                         tree_timeout: int = 1600, maxmz: int = 600,
+                         n_jobs: int = 1, num_candidates: int = 50,
+                         database: str = 'all',
+                         ionization_mode: str = 'auto',
+                         zodiac_threshold: float = 0.98,
+                         fingerid_db: str = 'pubchem',
+                         java_flags: str = None, n_shards: int = 1,
+                         cache_dir: str = None, cache_max_size: int = 10240,
+                         work_dir: str = None, cpu_affinity: str = None,
+                         niceness: int = 0,
+                         resources: str = 'manual',
+                         progress_file: str = None, stall_timeout: int = 0,
+                         max_runtime: int = 0, compact: bool = False,
+                         deduplicate: bool = False,
+                         dedup_mz_tolerance: float = 0.01,
+                         dedup_rt_tolerance: float = 10.0,
+                         zodiac_max_features: int = 0,
+                         zodiac_partition: str = 'similarity',
+                         zodiac_parallel_groups: int = 1) -> CSIDirFmt:
+    '''Compute fragmentation trees, rerank formulas and predict fingerprints
+
+    Runs ``compute_fragmentation_trees``, ``rerank_molecular_formulas`` and
+    ``predict_fingerprints`` one after the other. The intermediate results
+    stay in temporary directories instead of being stored as artifacts, and
+    each one is removed as soon as the next step is done with it.
+
+    Parameters
+    ----------
+    sirius_path : str
+        Path to Sirius executable (without including the word sirius).
+    features : MGFDirFmt or list of MGFDirFmt
+        MGF file for Sirius. Several files are computed in a single run, with
+        the feature identifiers of the n-th file prefixed by `n-`.
+    ppm_max : int
+        allowed parts per million tolerance for decomposing masses
+    profile: str
+        configuration profile for mass-spec platform used
+    tree_timeout : int, optional
+        time for computation per fragmentation tree in seconds. 0 for an
+        infinite amount of time
+    maxmz : int, optional
+        considers compounds with a precursor mz lower or equal to this
+        value (int)
+    n_jobs : int, optional
+        Number of cpu cores to use. If not specified Sirius uses all available
+        cores
+    num_candidates: int, optional
+        number of fragmentation trees to compute per feature
+    database: str, optional
+        search formulas in given database
+    ionization_mode : str, optional
+        Ionization mode for mass spectrometry. One of `auto`, `positive` or
+        `negative`.
+    zodiac_threshold : float, optional
+        threshold filter for molecular formula re-ranking. Higher value
+        recommended for less false positives (float)
+    fingerid_db : str, optional
+        Search structure in given database.
+    java_flags : str, optional
+        Setup additional flags for the Java virtual machine.
+    n_shards : int, optional
+        Number of feature-disjoint shards used to compute the fragmentation
+        trees.
+    cache_dir : str, optional
+        Directory of a cache of results shared by the three steps.
+    cache_max_size : int, optional
+        Maximum size of the cache in megabytes.
+    work_dir : str, optional
+        Persistent directory SIRIUS writes to while running, so that an
+        interrupted run can be resumed. Each resumable step uses its own
+        subdirectory.
+    cpu_affinity : str, optional
+        CPUs SIRIUS is allowed to run on, e.g. `0-3,8`.
+    niceness : int, optional
+        Niceness added to the SIRIUS processes.
+    resources : str, optional
+        One of `manual` or `auto`. With `auto` the heap size, compound
+        buffers and number of processors of each step are chosen from its
+        input and the memory and CPUs available.
+    progress_file : str, optional
+        File the progress of the fragmentation tree and fingerprint steps is
+        appended to as JSON lines while they run.
+    stall_timeout : int, optional
+        Minutes without new output after which a SIRIUS process is
+        considered hung and killed. The unfinished features of the
+        fragmentation tree and fingerprint steps are requeued in smaller
+        batches, and features that hang SIRIUS on their own are skipped.
+        Zodiac only writes its output at the end, so it is not checked. 0
+        disables the check.
+    max_runtime : int, optional
+        Minutes a SIRIUS process may run for. 0 disables the limit.
+    compact : bool, optional
+        Only keep the predicted fingerprints and the summaries read by
+        `make_hierarchy`, see `compact_fingerprints`.
+    deduplicate : bool, optional
+        Only compute one representative of each group of features with
+        near-identical spectra (e.g. QC pools or standards injected in every
+        batch), and copy its results to the rest of the group.
+    dedup_mz_tolerance : float, optional
+        Maximum difference in Da between the precursor m/z and the MS2 peaks
+        of duplicated features.
+    dedup_rt_tolerance : float, optional
+        Maximum difference in seconds between the retention times of
+        duplicated features.
+    zodiac_max_features, zodiac_partition, zodiac_parallel_groups : optional
+        Split inputs with more features into groups reranked separately by
+        Zodiac, see `rerank_molecular_formulas`.
+
+    Returns
+    -------
+    CSIDirFmt
+        Directory with predicted fingerprints.
+    '''
+    # the MGF files written here are removed once the fingerprints are done
+    inputs = [features] if isinstance(features, MGFDirFmt) else list(features)
+    batch = _batch_features(inputs)
+    temporary = [] if any(batch is f for f in inputs) else [batch]
+    features = batch
+
+    groups = None
+    if deduplicate:
+        mgf = os.path.join(str(features.path), 'features.mgf')
+        features = MGFDirFmt()
+        temporary.append(features)
+        groups = deduplicate_mgf(mgf, os.path.join(str(features.path),
+                                                   'features.mgf'),
+                                 dedup_mz_tolerance, dedup_rt_tolerance)
+
+    def step_dir(name):
+        return None if work_dir is None else os.path.join(work_dir, name)
+
+    trees = compute_fragmentation_trees(
+        sirius_path=sirius_path, features=features, ppm_max=ppm_max,
+        profile=profile, tree_timeout=tree_timeout, maxmz=maxmz,
+        n_jobs=n_jobs, num_candidates=num_candidates, database=database,
+        ionization_mode=ionization_mode, java_flags=java_flags,
+        n_shards=n_shards, cache_dir=cache_dir,
+        cache_max_size=cache_max_size,
+        work_dir=step_dir('fragmentation-trees'), cpu_affinity=cpu_affinity,
+        niceness=niceness, resources=resources, progress_file=progress_file,
+        stall_timeout=stall_timeout, max_runtime=max_runtime)
+
+    formulas = rerank_molecular_formulas(
+        sirius_path=sirius_path, fragmentation_trees=trees,
+        features=features, zodiac_threshold=zodiac_threshold, n_jobs=n_jobs,
+        java_flags=java_flags, cache_dir=cache_dir,
+        cache_max_size=cache_max_size, cpu_affinity=cpu_affinity,
+        niceness=niceness, resources=resources, max_runtime=max_runtime,
+        zodiac_max_features=zodiac_max_features,
+        zodiac_partition=zodiac_partition,
+        zodiac_parallel_groups=zodiac_parallel_groups)
+    shutil.rmtree(str(trees.path))
+
+    fingerprints = predict_fingerprints(
+        sirius_path=sirius_path, molecular_formulas=formulas,
+        ppm_max=ppm_max, n_jobs=n_jobs, fingerid_db=fingerid_db,
+        java_flags=java_flags, cache_dir=cache_dir,
+        cache_max_size=cache_max_size, work_dir=step_dir('fingerprints'),
+        cpu_affinity=cpu_affinity, niceness=niceness, resources=resources,
+        progress_file=progress_file, stall_timeout=stall_timeout,
+        max_runtime=max_runtime, compact=compact)
+    shutil.rmtree(str(formulas.path))
+    for mgf in temporary:
+        shutil.rmtree(str(mgf.path))
+
+    if groups is not None:
+        fan_out(fingerprints.get_path(), groups)
+        write_duplicates(groups, os.path.join(str(fingerprints.path),
+                                              DUPLICATES))
+        duplicates = sum(len(members) for members in groups.values())
+        stdout = os.path.join(str(fingerprints.path), 'stdout.txt')
+        with open(stdout, 'a') as f:
+            f.write('Copied the results of %d duplicated features from '
+                    'the %d representatives computed\n' %
+                    (duplicates, len(groups)))
+
+    return fingerprints
@@ -14,7 +14,8 @@ from scipy.cluster.hierarchy import linkage
 from skbio import TreeNode
 from q2_feature_table import merge
 
-from ._process_fingerprint import process_csi_results
+from ._process_fingerprint import process_csi_results, is_batched_result
+from ._mgf import feature_prefix
 from ._match import get_matched_tables
 from ._semantics import CSIDirFmt
 
@@ -72,7 +73,9 @@ def make_hierarchy(csi_results: CSIDirFmt,
     Parameters
     ----------
     csi_results : CSIDirFmt
-        one or more CSI:FingerID output folder
+        one or more CSI:FingerID output folder. A single folder computed from
+        several MGF files at once is split into one per feature table, by the
+        prefix of its feature identifiers.
     feature_table : biom.Table
         one or more feature tables with mass-spec feature intensity per sample
     library_matches: pd.DataFrame
@@ -101,6 +104,12 @@ def make_hierarchy(csi_results: CSIDirFmt,
         vectors of mass-spec features
     '''
     fps, fts, fdata = [], [], []
+    prefixes = [None] * len(csi_results)
+    if (len(csi_results) == 1 and len(feature_tables) > 1 and
+            is_batched_result(csi_results[0])):
+        # the n-th table goes with the features of the n-th MGF file
+        prefixes = [feature_prefix(n) for n in range(len(feature_tables))]
+        csi_results = list(csi_results) * len(feature_tables)
     if len(feature_tables) != len(csi_results):
         raise ValueError("The feature tables and CSI results should have a "
                          "one-to-one correspondance.")
@@ -120,10 +129,12 @@ def make_hierarchy(csi_results: CSIDirFmt,
             collated_fps, smiles = process_csi_results(csi_result,
                                                        library_match,
                                                        qc_properties,
-                                                       metric=metric)
+                                                       metric=metric,
+                                                       prefix=prefixes[n])
         else:
             collated_fps, smiles = process_csi_results(csi_result, None,
-                                                       qc_properties, metric)
+                                                       qc_properties, metric,
+                                                       prefixes[n])
         relabeled_fp, matched_ft, feature_data = get_matched_tables(
             collated_fps, smiles, feature_table)
         fps.append(relabeled_fp)
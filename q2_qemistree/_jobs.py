@@ -0,0 +1,192 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import shlex
+import stat
+from collections import Counter
+
+from ._semantics import MGFDirFmt, CSIDirFmt, JobArrayDirFmt
+from ._fingerprint import merge_workspaces
+from ._mgf import index_mgf, write_shards
+from ._resources import feature_cost
+
+
+MANIFEST = 'manifest.tsv'
+
+SCRIPT = '''#!/bin/sh
+# q2-qemistree job array: shard %(shard)d of %(n_shards)d
+# %(features)d features
+#
+# Runs from the directory of the exported job array, set QEMISTREE_JOB_DIR
+# if the scheduler starts the script from a copy somewhere else.
+set -e
+cd "${QEMISTREE_JOB_DIR:-$(dirname "$0")}"
+%(commands)s
+'''
+
+
+def _command(arguments):
+    # one option per line
+    lines = [' '.join(shlex.quote(str(a)) for a in argument)
+             for argument in arguments]
+    return ' \\\n    '.join(lines)
+
+
+def job_script(shard_dir: str, shard: int, n_shards: int, n_features: int,
+               parameters: list) -> str:
+    '''Shell script that predicts the fingerprints of one shard
+
+    The MGF file of the shard is imported as a ``MassSpectrometryFeatures``
+    artifact and ``compute-fingerprints`` writes ``fingerprints.qza`` next to
+    it. Paths are relative to the job array directory.
+
+    Parameters
+    ----------
+    shard_dir : str
+        Name of the shard directory, holding ``features.mgf``.
+    shard, n_shards : int
+        Number of the shard, starting from 1, and number of shards.
+    n_features : int
+        Number of features in the shard.
+    parameters : list of tuple
+        Arguments of ``compute-fingerprints`` other than its input and
+        output, e.g. ``[('--p-ppm-max', 15), ('--p-compact',)]``.
+    '''
+    features = '%s/features.qza' % shard_dir
+    commands = [
+        _command([('qiime', 'tools', 'import'),
+                  ('--type', 'MassSpectrometryFeatures'),
+                  ('--input-format', 'MGFFile'),
+                  ('--input-path', '%s/features.mgf' % shard_dir),
+                  ('--output-path', features)]),
+        _command([('qiime', 'qemistree', 'compute-fingerprints'),
+                  ('--i-features', features)] + parameters +
+                 [('--o-predicted-fingerprints',
+                   '%s/fingerprints.qza' % shard_dir)])]
+    return SCRIPT % {'shard': shard, 'n_shards': n_shards,
+                     'features': n_features,
+                     'commands': '\n'.join(commands)}
+
+
+def export_job_array(features: MGFDirFmt, sirius_path: str, ppm_max: int,
+                     profile: str, array_size: int,
+                     tree_timeout: int = 1600, maxmz: int = 600,
+                     n_jobs: int = 1, num_candidates: int = 50,
+                     database: str = 'all', ionization_mode: str = 'auto',
+                     zodiac_threshold: float = 0.98,
+                     fingerid_db: str = 'pubchem', java_flags: str = None,
+                     resources: str = 'manual',
+                     compact: bool = False) -> JobArrayDirFmt:
+    '''Split features into shards with a job script to compute each one
+
+    Features are balanced across the shards by their expected cost, as with
+    the `n_shards` parameter of ``compute_fragmentation_trees``. Each shard
+    gets a directory ``shard-<n>`` with its MGF file and a shell script
+    ``shard-<n>.sh`` that runs ``compute-fingerprints`` on it, so that the
+    shards can be submitted to any batch scheduler and their results merged
+    with ``merge_fingerprints``. ``manifest.tsv`` lists the shards, their
+    number of features and the paths of their MGF file, script and output.
+
+    Zodiac reranks the molecular formulas of the features in each shard
+    separately.
+
+    Parameters
+    ----------
+    features : MGFDirFmt
+        MGF file for Sirius
+    sirius_path : str
+        Path to Sirius executable on the nodes running the jobs.
+    array_size : int
+        Number of shards. Fewer are written if there are fewer features.
+
+    The other parameters are passed to ``compute_fingerprints``.
+
+    Returns
+    -------
+    JobArrayDirFmt
+        Directory with the shards, their scripts and the manifest.
+    '''
+    parameters = [('--p-sirius-path', sirius_path),
+                  ('--p-ppm-max', ppm_max),
+                  ('--p-profile', profile),
+                  ('--p-tree-timeout', tree_timeout),
+                  ('--p-maxmz', maxmz),
+                  ('--p-n-jobs', n_jobs),
+                  ('--p-num-candidates', num_candidates),
+                  ('--p-database', database),
+                  ('--p-ionization-mode', ionization_mode),
+                  ('--p-zodiac-threshold', zodiac_threshold),
+                  ('--p-fingerid-db', fingerid_db),
+                  ('--p-resources', resources),
+                  ('--p-compact' if compact else '--p-no-compact',)]
+    if java_flags is not None:
+        parameters.append(('--p-java-flags', java_flags))
+
+    features = features.decompressed()
+    mgf = os.path.join(str(features.path), 'features.mgf')
+    jobs = JobArrayDirFmt()
+    job_dir = jobs.get_path()
+    os.makedirs(job_dir)
+    shards = write_shards(mgf, array_size, job_dir, feature_cost)
+
+    with open(os.path.join(job_dir, MANIFEST), 'w') as manifest:
+        manifest.write('#shard\tfeatures\tmgf\tscript\tfingerprints\n')
+        for n, shard in enumerate(shards):
+            shard_dir = os.path.basename(os.path.dirname(shard))
+            n_features = len(index_mgf(shard))
+            script = os.path.join(job_dir, shard_dir + '.sh')
+            with open(script, 'w') as f:
+                f.write(job_script(shard_dir, n + 1, len(shards), n_features,
+                                   parameters))
+            os.chmod(script, os.stat(script).st_mode | stat.S_IXUSR |
+                     stat.S_IXGRP | stat.S_IXOTH)
+            manifest.write('%s\t%d\t%s/features.mgf\t%s.sh\t'
+                           '%s/fingerprints.qza\n' % (shard_dir, n_features,
+                                                      shard_dir, shard_dir,
+                                                      shard_dir))
+    return jobs
+
+
+def _csi_feature_ids(workspace):
+    return [name.split('_')[-1] for name in os.listdir(workspace)
+            if os.path.isdir(os.path.join(workspace, name))]
+
+
+def merge_fingerprints(predicted_fingerprints: CSIDirFmt) -> CSIDirFmt:
+    '''Merge the CSI:FingerID results of feature-disjoint shards
+
+    Parameters
+    ----------
+    predicted_fingerprints : list of CSIDirFmt
+        CSI:FingerID results of each shard, e.g. computed by the scripts of
+        ``export_job_array``.
+
+    Returns
+    -------
+    CSIDirFmt
+        CSI:FingerID results of all the features.
+
+    Raises
+    ------
+    ValueError
+        If a feature identifier is in more than one of the results.
+    '''
+    workspaces = [str(shard.get_path()) for shard in predicted_fingerprints]
+    counts = Counter(fid for workspace in workspaces
+                     for fid in set(_csi_feature_ids(workspace)))
+    repeated = sorted(fid for fid, count in counts.items() if count > 1)
+    if repeated:
+        raise ValueError('The CSI results should have disjoint features, '
+                         'but %d feature IDs are in more than one of them: '
+                         '%s' % (len(repeated), ', '.join(repeated[:10])))
+
+    merged = CSIDirFmt()
+    # the shards are linked so that the input artifacts are left untouched
+    merge_workspaces(workspaces, merged.get_path(), link=True)
+    return merged
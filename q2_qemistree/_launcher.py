@@ -0,0 +1,214 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import re
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+
+from ._usage import UsageSampler, process_tree
+
+
+def run_command(cmd, output_fp, error_fp, verbose=True, env=None,
+                monitor=None, interval=10):
+    if verbose:
+        print("Running external command line application. This may print "
+              "messages to stdout and/or stderr.")
+        print("The command being run is below. This command cannot "
+              "be manually re-run as it will depend on temporary files that "
+              "no longer exist.")
+        print("\nCommand:", end=' ')
+        print(" ".join(cmd), end='\n\n')
+
+    with open(output_fp, 'w') as output_f, open(error_fp, 'w') as error_f:
+        process = subprocess.Popen(cmd, stdout=output_f, stderr=error_f,
+                                   env=env)
+        started = time.time()
+        try:
+            while True:
+                try:
+                    process.wait(timeout=interval)
+                    break
+                except subprocess.TimeoutExpired:
+                    if monitor is not None:
+                        monitor(process, started)
+        except BaseException:
+            kill_tree(process)
+            raise
+
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+
+def kill_tree(process):
+    '''Kill a process and all its descendants, e.g. the JVM started by the
+    SIRIUS launcher script'''
+    pids = [process.pid]
+    if os.path.isdir('/proc'):
+        pids = process_tree(process.pid)
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+    process.wait()
+
+
+def parse_cpus(spec: str) -> list:
+    '''Parse a list of CPUs such as ``0-3,8,10-11``
+
+    Raises
+    ------
+    ValueError
+        If the list is malformed or empty.
+    '''
+    cpus = set()
+    for part in spec.split(','):
+        match = re.fullmatch(r'\s*(\d+)\s*(?:-\s*(\d+)\s*)?', part)
+        if match is None:
+            raise ValueError('"%s" is not a valid list of CPUs' % spec)
+        first, last = match.groups()
+        last = first if last is None else last
+        if int(last) < int(first):
+            raise ValueError('"%s" is not a valid list of CPUs' % spec)
+        cpus.update(range(int(first), int(last) + 1))
+    return sorted(cpus)
+
+
+def split_cpus(cpus: list, n: int) -> list:
+    '''Divide CPUs into ``n`` contiguous groups of (nearly) equal size'''
+    size, extra = divmod(len(cpus), n)
+    groups, start = [], 0
+    for i in range(n):
+        end = start + size + (i < extra)
+        groups.append(cpus[start:end] or cpus)
+        start = end
+    return groups
+
+
+def _executable(name):
+    path = shutil.which(name)
+    if path is None:
+        raise ValueError('%s is needed to set the CPU affinity and '
+                         'niceness of SIRIUS, but it could not be found' %
+                         name)
+    return path
+
+
+class Launcher:
+    '''Start SIRIUS processes that do not share any global state
+
+    Every process gets a copy of the environment with its own
+    ``_JAVA_OPTIONS`` and its own ``java.io.tmpdir``, so several SIRIUS jobs
+    can run at the same time from one Python process.
+
+    Parameters
+    ----------
+    sirius_path : str
+        Path to Sirius executable (without including the word sirius).
+    java_flags : str, optional
+        Flags for the Java virtual machine, appended to any existing
+        ``_JAVA_OPTIONS``. If they set ``java.io.tmpdir``, the temporary
+        directory of each job is created inside that directory.
+    cpus : list of int, optional
+        CPUs the processes are allowed to run on.
+    niceness : int, optional
+        Niceness added to the processes.
+    interval : float, optional
+        Seconds between polls of the monitors of a running process.
+
+    Raises
+    ------
+    OSError
+        If SIRIUS cannot be located.
+    ValueError
+        If CPU affinity is not supported on this platform, the CPUs are not
+        available to this process, or ``taskset`` or ``nice`` are missing.
+
+    Notes
+    -----
+    The affinity and niceness are applied by starting SIRIUS through
+    ``taskset`` and ``nice`` rather than in a ``preexec_fn``, which is not
+    safe to use when several processes are started from threads.
+    '''
+
+    def __init__(self, sirius_path: str, java_flags: str = None,
+                 cpus: list = None, niceness: int = 0, interval: float = 10):
+        if not os.path.exists(sirius_path):
+            raise OSError("SIRIUS could not be located")
+        self.sirius = os.path.join(sirius_path, 'sirius')
+
+        if cpus:
+            if not hasattr(os, 'sched_setaffinity'):
+                raise ValueError('CPU affinity is not supported on this '
+                                 'platform')
+            unavailable = set(cpus) - os.sched_getaffinity(0)
+            if unavailable:
+                raise ValueError('CPUs %s are not available' %
+                                 ', '.join(map(str, sorted(unavailable))))
+        self.cpus = cpus
+        self.niceness = niceness
+        self.interval = interval
+
+        # every thread of the JVM inherits the affinity and niceness
+        self.prefix = []
+        if cpus:
+            self.prefix += [_executable('taskset'), '--cpu-list',
+                            ','.join(map(str, cpus))]
+        if niceness:
+            self.prefix += [_executable('nice'), '-n', str(niceness)]
+
+        self.java_flags, self.tmp_root = [], None
+        for flag in shlex.split(java_flags or ''):
+            if flag.startswith('-Djava.io.tmpdir='):
+                self.tmp_root = flag.split('=', 1)[1]
+            else:
+                self.java_flags.append(flag)
+
+    def environment(self, tmp_dir: str) -> dict:
+        '''Environment for a process using ``tmp_dir`` as java.io.tmpdir'''
+        env = os.environ.copy()
+        flags = [env.get('_JAVA_OPTIONS', '')] + self.java_flags
+        flags.append('-Djava.io.tmpdir=%s' % tmp_dir)
+        env['_JAVA_OPTIONS'] = ' '.join(flag for flag in flags if flag)
+        return env
+
+    def run(self, parameters: list, output_fp: str, error_fp: str,
+            verbose: bool = True, monitors: list = ()):
+        '''Run SIRIUS with ``parameters``, logging its output to files
+
+        While SIRIUS runs, every monitor is periodically polled with the
+        process, the output directory given with ``-o`` and the time the
+        process was started at. The resources
+        used by the process and its children are sampled at the same time
+        and written next to ``output_fp`` once it exits.
+        '''
+        tmp_dir = tempfile.mkdtemp(prefix='sirius-', dir=self.tmp_root)
+        output_dir = None
+        if '-o' in parameters:
+            output_dir = parameters[parameters.index('-o') + 1]
+
+        sampler = UsageSampler()
+
+        def monitor(process, started):
+            sampler.poll(process)
+            for m in monitors:
+                m.poll(process, output_dir, started)
+
+        try:
+            run_command(self.prefix + [self.sirius] + parameters, output_fp,
+                        error_fp, verbose=verbose,
+                        env=self.environment(tmp_dir), monitor=monitor,
+                        interval=self.interval)
+        finally:
+            sampler.write(os.path.dirname(output_fp))
+            shutil.rmtree(tmp_dir, ignore_errors=True)
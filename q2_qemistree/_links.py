@@ -0,0 +1,119 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import filecmp
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# ioctl request to clone a file's extents (Linux, e.g. on btrfs or XFS)
+_FICLONE = 0x40049409
+
+
+def _share(src, dst):
+    # hardlink when both paths are on the same filesystem, or reflink if the
+    # filesystem supports it
+    try:
+        os.link(src, dst)
+        return True
+    except OSError:
+        pass
+    return _reflink(src, dst)
+
+
+def _reflink(src, dst):
+    # a reflink shares the data until either file is written to
+    if fcntl is None:
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+
+def link_or_copy(src: str, dst: str):
+    '''Make ``dst`` share the contents of ``src`` without copying if possible
+
+    Files are hardlinked or reflinked where the filesystem allows it, and
+    copied otherwise. The results of the SIRIUS stages are never modified
+    once written, so sharing the underlying data is safe.
+    '''
+    if not _share(src, dst):
+        shutil.copy2(src, dst)
+    return dst
+
+
+def reflink_or_copy(src: str, dst: str):
+    '''Copy ``src`` to ``dst``, sharing the data through a reflink if the
+    filesystem supports it
+
+    Unlike ``link_or_copy`` this never hardlinks, so it is used for files
+    outside of q2-qemistree's control, e.g. imported files, that may be
+    modified in place after they are copied.
+    '''
+    if not _reflink(src, dst):
+        shutil.copy2(src, dst)
+    return dst
+
+
+def link_tree(src: str, dst: str):
+    '''Recursively mirror a directory using ``link_or_copy``'''
+    return shutil.copytree(src, dst, copy_function=link_or_copy)
+
+
+def share_files(workspace: str, reference: str, names: dict):
+    '''Replace files in a workspace by links to identical reference files
+
+    Used to make the output of a SIRIUS stage share the files it carries
+    over unchanged with the output of the previous stage. Only the files in
+    ``names`` are considered, so the files the stage rewrites are never read.
+    A file is linked when it has the same size and contents as its
+    reference file, and is left as it is when the filesystem cannot share
+    it.
+
+    Parameters
+    ----------
+    workspace : str
+        Output directory of the stage.
+    reference : str
+        Output directory of the previous stage.
+    names : dict of str to str
+        Paths of the files in ``workspace`` that the stage copies from its
+        input, to the paths of those files in ``reference``; both relative.
+
+    Returns
+    -------
+    int
+        Number of files that now share their data with a reference file.
+    '''
+    shared = 0
+    for name, reference_name in names.items():
+        path = os.path.join(workspace, name)
+        candidate = os.path.join(reference, reference_name)
+        if not (os.path.isfile(path) and os.path.isfile(candidate)):
+            continue
+        if os.path.islink(path) or os.path.samefile(candidate, path):
+            continue
+        if (os.path.getsize(path) != os.path.getsize(candidate) or
+                not filecmp.cmp(candidate, path, shallow=False)):
+            continue
+
+        tmp = path + '.link'
+        if _share(candidate, tmp):
+            os.replace(tmp, path)
+            shared += 1
+    return shared
@@ -0,0 +1,321 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import heapq
+import os
+import re
+from collections import namedtuple
+
+
+# spans is a list of (start, end) byte offsets, one per BEGIN/END IONS record,
+# peaks is the number of peaks across all the MS2 records of a feature and rt
+# the retention time of its first record
+Feature = namedtuple('Feature', ['feature_id', 'spans', 'ms1', 'ms2',
+                                 'pepmass', 'peaks', 'rt'])
+
+
+def index_mgf(mgf_fp):
+    '''Scan an MGF file and group its records by feature identifier
+
+    If the file has an index (see ``write_index``) that matches it, the
+    features are read from the index instead.
+
+    Parameters
+    ----------
+    mgf_fp : str
+        Path to the MGF file.
+
+    Raises
+    ------
+    ValueError
+        If a record does not have a FEATURE_ID.
+
+    Returns
+    -------
+    list of Feature
+        One entry per feature, in order of first appearance in the file. The
+        spans of a feature point to all the records that share its
+        identifier.
+    '''
+    indexed = read_index(mgf_fp)
+    if indexed is not None:
+        return indexed
+
+    features = {}
+    offset, start = 0, None
+
+    with open(mgf_fp, 'rb') as fh:
+        for line in fh:
+            if line.startswith(b'BEGIN IONS'):
+                start = offset
+                feature_id, level, pepmass, peaks = None, None, None, 0
+                rt = None
+            elif start is None:
+                pass
+            elif line.startswith(b'END IONS'):
+                if feature_id is None:
+                    raise ValueError('The record starting at byte %d does not '
+                                     'have a FEATURE_ID' % start)
+                span = (start, offset + len(line))
+
+                feature = features.get(feature_id)
+                if feature is None:
+                    feature = Feature(feature_id, [], 0, 0, pepmass, 0, rt)
+                feature.spans.append(span)
+                features[feature_id] = feature._replace(
+                    ms1=feature.ms1 + (level == b'1'),
+                    ms2=feature.ms2 + (level == b'2'),
+                    pepmass=(feature.pepmass if feature.pepmass is not None
+                             else pepmass),
+                    peaks=feature.peaks + (peaks if level == b'2' else 0))
+                start = None
+            elif line.startswith(b'FEATURE_ID='):
+                feature_id = line.split(b'=')[1].strip().decode()
+            elif line.startswith(b'MSLEVEL='):
+                level = line.split(b'=')[1].strip()
+            elif line.startswith(b'PEPMASS='):
+                pepmass = float(line.split(b'=')[1].split()[0])
+            elif line.startswith(b'RTINSECONDS='):
+                rt = float(line.split(b'=')[1])
+            elif line[:1].isdigit():
+                peaks += 1
+
+            offset += len(line)
+
+    return list(features.values())
+
+
+def write_features(mgf_fp, features, output_fp):
+    '''Copy the records of a subset of features into a new MGF file
+
+    Parameters
+    ----------
+    mgf_fp : str
+        Path to the MGF file the features were indexed from.
+    features : iterable of Feature
+        Features to copy, as returned by ``index_mgf``.
+    output_fp : str
+        Path to the MGF file to write.
+
+    Returns
+    -------
+    list of Feature
+        The features copied, with the spans of their records in the new
+        file.
+    '''
+    written = []
+    with open(mgf_fp, 'rb') as src, open(output_fp, 'wb') as dst:
+        for feature in features:
+            spans = []
+            for start, end in feature.spans:
+                src.seek(start)
+                offset = dst.tell()
+                dst.write(src.read(end - start))
+                spans.append((offset, offset + end - start))
+                dst.write(b'\n')
+            written.append(feature._replace(spans=spans))
+    return written
+
+
+INDEX_COLUMNS = ['#featureID', 'spans', 'ms1', 'ms2', 'pepmass', 'peaks',
+                 'rt']
+
+
+def index_path(mgf_fp: str) -> str:
+    '''Path of the index of an MGF file, e.g. features.index.tsv for
+    features.mgf'''
+    return os.path.splitext(mgf_fp)[0] + '.index.tsv'
+
+
+def _number(value):
+    return '' if value is None else repr(value)
+
+
+def write_index(features: list, mgf_fp: str):
+    '''Write the index of an MGF file next to it
+
+    The index is a tab-separated file with the fields of each ``Feature``:
+    its identifier, the byte ranges of its records, its number of MS1 and
+    MS2 records, precursor m/z, number of MS2 peaks and retention time. Its
+    first line is the size of the MGF file, so that an index that does not
+    match the file is ignored.
+
+    Parameters
+    ----------
+    features : list of Feature
+        All the features of the MGF file, as returned by ``index_mgf`` or
+        ``write_features``.
+    mgf_fp : str
+        Path to the MGF file.
+    '''
+    with open(index_path(mgf_fp), 'w') as f:
+        f.write('#mgf-bytes=%d\n' % os.path.getsize(mgf_fp))
+        f.write('\t'.join(INDEX_COLUMNS) + '\n')
+        for feature in features:
+            f.write('\t'.join([
+                feature.feature_id,
+                ','.join('%d-%d' % span for span in feature.spans),
+                str(feature.ms1), str(feature.ms2), _number(feature.pepmass),
+                str(feature.peaks), _number(feature.rt)]) + '\n')
+
+
+def read_index(mgf_fp: str):
+    '''Features of an MGF file read from its index
+
+    Returns
+    -------
+    list of Feature or None
+        The features, in the order of the index, or None if the file does
+        not have an index or the index does not match the file.
+    '''
+    index_fp = index_path(mgf_fp)
+    if not os.path.exists(index_fp):
+        return None
+
+    size = os.path.getsize(mgf_fp)
+    with open(index_fp) as f:
+        if f.readline().strip() != '#mgf-bytes=%d' % size:
+            return None
+        f.readline()
+
+        features = []
+        for line in f:
+            fid, spans, ms1, ms2, pepmass, peaks, rt = \
+                line.rstrip('\n').split('\t')
+            spans = [tuple(int(offset) for offset in span.split('-'))
+                     for span in spans.split(',')]
+            features.append(Feature(fid, spans, int(ms1), int(ms2),
+                                    float(pepmass) if pepmass else None,
+                                    int(peaks), float(rt) if rt else None))
+
+    # records start where the index says, as a check that it was written for
+    # this file
+    with open(mgf_fp, 'rb') as f:
+        for feature in features[:1] + features[-1:]:
+            f.seek(feature.spans[0][0])
+            if f.read(10) != b'BEGIN IONS':
+                return None
+    return features
+
+
+def write_subset(mgf_fp: str, feature_ids: list, output_fp: str) -> list:
+    '''Copy the records of some features into a new, indexed MGF file
+
+    The features are found with the index of the MGF file if it has one, so
+    only their records are read. Features are written in the order of the
+    input file.
+
+    Raises
+    ------
+    ValueError
+        If some of the feature identifiers are not in the MGF file.
+
+    Returns
+    -------
+    list of Feature
+        The features written, indexed in the new file.
+    '''
+    wanted = set(feature_ids)
+    features = [f for f in index_mgf(mgf_fp) if f.feature_id in wanted]
+    missing = wanted - {f.feature_id for f in features}
+    if missing:
+        missing = sorted(missing)
+        raise ValueError('%d feature IDs are not in the MGF file: %s' %
+                         (len(missing), ', '.join(missing[:10])))
+
+    written = write_features(mgf_fp, features, output_fp)
+    write_index(written, output_fp)
+    return written
+
+
+def split_features(features, n_shards, cost=None):
+    '''Distribute features over at most ``n_shards`` disjoint groups
+
+    Without a ``cost`` the features are dealt out round-robin. Otherwise the
+    most expensive features are placed first, each one in the group with the
+    lowest total cost so far, so the groups take about as long and each
+    group is ordered from the most to the least expensive feature.
+    '''
+    if cost is None:
+        shards = [features[i::n_shards] for i in range(n_shards)]
+        return [shard for shard in shards if shard]
+
+    shards = [[] for _ in range(n_shards)]
+    loads = [(0, i) for i in range(n_shards)]
+    for feature in sorted(features, key=cost, reverse=True):
+        load, i = heapq.heappop(loads)
+        shards[i].append(feature)
+        heapq.heappush(loads, (load + cost(feature), i))
+    return [shard for shard in shards if shard]
+
+
+def write_shards(mgf_fp, n_shards, output_dir, cost=None):
+    '''Split an MGF file into feature-disjoint MGF files
+
+    Each shard is written as ``features.mgf`` inside its own subdirectory of
+    ``output_dir`` so that SIRIUS names the per-feature output folders the
+    same way it does for the unsharded input. The features are distributed
+    as described in ``split_features``.
+
+    Returns
+    -------
+    list of str
+        Paths to the MGF file of each non-empty shard.
+    '''
+    features = index_mgf(mgf_fp)
+    paths = []
+    for n, shard in enumerate(split_features(features, n_shards, cost)):
+        shard_dir = os.path.join(output_dir, 'shard-%d' % n)
+        os.makedirs(shard_dir)
+
+        path = os.path.join(shard_dir, 'features.mgf')
+        write_features(mgf_fp, shard, path)
+        paths.append(path)
+    return paths
+
+
+def read_features(mgf_fp, features):
+    '''Yield the raw bytes of all the records of each feature'''
+    with open(mgf_fp, 'rb') as fh:
+        for feature in features:
+            records = []
+            for start, end in feature.spans:
+                fh.seek(start)
+                records.append(fh.read(end - start))
+            yield b''.join(records)
+
+
+def feature_prefix(index: int) -> str:
+    '''Prefix of the feature identifiers of the ``index``-th of several
+    MGF files computed in one batch'''
+    return '%d-' % (index + 1)
+
+
+def is_batched(feature_ids) -> bool:
+    '''Whether all the identifiers have the prefix of a batch'''
+    feature_ids = list(feature_ids)
+    return bool(feature_ids) and all(re.match(r'\d+-', fid)
+                                     for fid in feature_ids)
+
+
+def concatenate_mgf(mgf_fps: list, output_fp: str):
+    '''Concatenate MGF files into one, prefixing their feature identifiers
+
+    The identifiers of the n-th file are prefixed with ``feature_prefix(n)``
+    so that features with the same identifier in different files are kept
+    apart.
+    '''
+    with open(output_fp, 'wb') as out:
+        for n, mgf_fp in enumerate(mgf_fps):
+            prefix = b'FEATURE_ID=' + feature_prefix(n).encode()
+            with open(mgf_fp, 'rb') as fh:
+                for line in fh:
+                    if line.startswith(b'FEATURE_ID='):
+                        line = prefix + line[len(b'FEATURE_ID='):]
+                    out.write(line)
+            out.write(b'\n')
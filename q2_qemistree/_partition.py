@@ -0,0 +1,167 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from collections import Counter, defaultdict
+
+from ._dedup import spectrum
+from ._mgf import index_mgf, read_features
+
+
+PARTITIONS = ['similarity', 'retention-time']
+
+
+def retention_windows(features: list, max_size: int) -> list:
+    '''Split features into windows of consecutive retention times
+
+    Features are sorted by retention time, with the features without one
+    last, and cut into windows of at most ``max_size`` features, so that
+    co-eluting ions (adducts, in-source fragments) stay together.
+    '''
+    ordered = sorted(features, key=lambda f: (f.rt is None, f.rt or 0,
+                                              f.pepmass or 0))
+    return [ordered[i:i + max_size]
+            for i in range(0, len(ordered), max_size)]
+
+
+class _Components:
+    # union-find over the positions of the features
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+
+def similarity_components(mgf_fp: str, features: list, max_size: int,
+                          mz_tolerance: float = 0.01, min_shared: int = 4,
+                          min_fraction: float = 0.5) -> list:
+    '''Connected components of the network of features with similar spectra
+
+    Two features are connected if at least ``min_shared`` of their intense
+    MS2 peaks (see ``_dedup.spectrum``), and at least ``min_fraction`` of
+    the peaks of the feature with fewer of them, are within
+    ``mz_tolerance`` Da of each other. Pairs are found through an index of
+    the peaks by m/z, so only features that share a peak are compared.
+    Peaks shared by more than ``max_size`` features (e.g. common fragments)
+    are left out of the index, as a component held together by them would
+    have to be split anyway.
+
+    Returns
+    -------
+    list of list of Feature
+        Components, each in input order, ordered by their first feature.
+    '''
+    spectra = [spectrum(feature, records) for feature, records in
+               zip(features, read_features(mgf_fp, features))]
+
+    bins = defaultdict(set)
+    for n, current in enumerate(spectra):
+        for mz in current.fragments:
+            bins[int(round(mz / mz_tolerance))].add(n)
+
+    components = _Components(len(features))
+    for n, current in enumerate(spectra):
+        shared = Counter()
+        for mz in current.fragments:
+            center = int(round(mz / mz_tolerance))
+            neighbours = set()
+            for key in (center - 1, center, center + 1):
+                members = bins.get(key, ())
+                if len(members) <= max_size:
+                    neighbours.update(members)
+            # each peak is counted once per neighbour, and each pair once
+            shared.update(other for other in neighbours if other > n)
+
+        for other, count in shared.items():
+            fewest = min(len(current.fragments),
+                         len(spectra[other].fragments))
+            if count >= min_shared and count >= min_fraction * fewest:
+                components.union(n, other)
+
+    groups = defaultdict(list)
+    for n, feature in enumerate(features):
+        groups[components.find(n)].append(feature)
+    return [groups[root] for root in sorted(groups)]
+
+
+def pack_groups(components: list, max_size: int) -> list:
+    '''Pack components into groups of at most ``max_size`` features
+
+    Components larger than ``max_size`` are split into retention time
+    windows. The rest are placed from the largest to the smallest into the
+    first group with room for them, so that few small groups are left.
+    '''
+    pieces = []
+    for component in components:
+        if len(component) > max_size:
+            pieces.extend(retention_windows(component, max_size))
+        else:
+            pieces.append(component)
+
+    groups = []
+    for piece in sorted(pieces, key=len, reverse=True):
+        for group in groups:
+            if len(group) + len(piece) <= max_size:
+                group.extend(piece)
+                break
+        else:
+            groups.append(list(piece))
+    return groups
+
+
+def partition_features(mgf_fp: str, max_size: int,
+                       method: str = 'similarity') -> list:
+    '''Split the features of an MGF file into groups reranked separately
+
+    Parameters
+    ----------
+    mgf_fp : str
+        Path to the MGF file.
+    max_size : int
+        Maximum number of features in a group.
+    method : str, optional
+        One of ``similarity``, to group the connected components of the
+        network of features with similar spectra (see
+        ``similarity_components``), or ``retention-time``, to group features
+        by retention time windows.
+
+    Raises
+    ------
+    ValueError
+        If the method is not known or ``max_size`` is not positive.
+
+    Returns
+    -------
+    list of list of Feature
+        Disjoint groups with all the features in the file. The features of
+        each group are in the order of the file.
+    '''
+    if method not in PARTITIONS:
+        raise ValueError('The partition method should be one of %s, not %r'
+                         % (', '.join(PARTITIONS), method))
+    if max_size < 1:
+        raise ValueError('The maximum group size should be positive')
+
+    features = index_mgf(mgf_fp)
+    if method == 'similarity':
+        groups = pack_groups(similarity_components(mgf_fp, features,
+                                                   max_size), max_size)
+    else:
+        groups = retention_windows(features, max_size)
+
+    order = {feature.feature_id: n for n, feature in enumerate(features)}
+    return [sorted(group, key=lambda f: order[f.feature_id])
+            for group in groups]
@@ -12,16 +12,31 @@ import numpy as np
 import pkg_resources
 
 from ._semantics import CSIDirFmt
+from ._mgf import is_batched
 
 
 data = pkg_resources.resource_filename('q2_qemistree', 'data')
 
 
+def _feature_ids(csi_result):
+    return [foldr.split('_')[-1] for foldr in os.listdir(csi_result)
+            if os.path.isdir(os.path.join(csi_result, foldr))]
+
+
+def is_batched_result(csi_result: CSIDirFmt) -> bool:
+    '''Whether the CSI:FingerID result holds the features of several MGF
+    files, with the identifiers prefixed by the file they come from'''
+    if isinstance(csi_result, CSIDirFmt):
+        csi_result = str(csi_result.get_path())
+    return is_batched(_feature_ids(csi_result))
+
+
 def collate_fingerprint(csi_result: CSIDirFmt, qc_properties: bool = False,
-                        metric: str = 'euclidean'):
+                        metric: str = 'euclidean', prefix: str = None):
     '''
     This function collates predicted chemical fingerprints for mass-spec
-    features in an experiment.
+    features in an experiment. If a prefix is given, only the features whose
+    identifier starts with it are collated, and the prefix is removed.
     '''
     if isinstance(csi_result, CSIDirFmt):
         csi_result = str(csi_result.get_path())
@@ -30,6 +45,10 @@ def collate_fingerprint(csi_result: CSIDirFmt, qc_properties: bool = False,
     for foldr in fpfoldrs:
         if os.path.isdir(os.path.join(csi_result, foldr)):
             fid = foldr.split('_')[-1]
+            if prefix is not None:
+                if not fid.startswith(prefix):
+                    continue
+                fid = fid[len(prefix):]
             fidpath = os.path.join(csi_result, foldr)
             if 'fingerprints' in os.listdir(fidpath):
                 fname = os.listdir(os.path.join(fidpath, 'fingerprints'))[0]
@@ -57,7 +76,8 @@ def collate_fingerprint(csi_result: CSIDirFmt, qc_properties: bool = False,
 
 
 def get_feature_smiles(csi_result: CSIDirFmt, collated_fps: pd.DataFrame,
-                       library_match: pd.DataFrame = None):
+                       library_match: pd.DataFrame = None,
+                       prefix: str = None):
     '''This function gets the SMILES of mass-spec features from
     CSI:FingerID and optionally, MS/MS library match results
     '''
@@ -66,6 +86,9 @@ def get_feature_smiles(csi_result: CSIDirFmt, collated_fps: pd.DataFrame,
     csi_summary = os.path.join(csi_result, 'summary_csi_fingerid.csv')
     csi_summary = pd.read_csv(csi_summary, dtype=str,
                               sep='\t').set_index('experimentName')
+    if prefix is not None:
+        csi_summary = csi_summary[csi_summary.index.str.startswith(prefix)]
+        csi_summary.index = csi_summary.index.str[len(prefix):]
     smiles = pd.DataFrame(index=collated_fps.index)
     smiles['csi_smiles'] = csi_summary.loc[smiles.index, 'smiles'].str.strip()
     smiles['ms2_smiles'] = np.nan
@@ -87,12 +110,13 @@ def get_feature_smiles(csi_result: CSIDirFmt, collated_fps: pd.DataFrame,
 def process_csi_results(csi_result: CSIDirFmt,
                         library_match: pd.DataFrame = None,
                         qc_properties: bool = False,
-                        metric: str = 'euclidean') -> (pd.DataFrame,
-                                                       pd.DataFrame):
+                        metric: str = 'euclidean',
+                        prefix: str = None) -> (pd.DataFrame, pd.DataFrame):
     '''This function parses CSI:FingerID result to generate tables
     of collated molecular fingerprints and SMILES for mass-spec features
     '''
-    collated_fps = collate_fingerprint(csi_result, qc_properties, metric)
+    collated_fps = collate_fingerprint(csi_result, qc_properties, metric,
+                                       prefix)
     feature_smiles = get_feature_smiles(csi_result, collated_fps,
-                                        library_match)
+                                        library_match, prefix)
     return collated_fps, feature_smiles
@@ -0,0 +1,103 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+def count_complete(output_dir: str, complete) -> int:
+    '''Number of per-feature folders in a SIRIUS output that are complete'''
+    if output_dir is None or not os.path.isdir(output_dir):
+        return 0
+    return sum(1 for entry in os.scandir(output_dir)
+               if entry.is_dir() and complete(entry.path))
+
+
+def format_duration(seconds: float) -> str:
+    '''Format a number of seconds as H:MM:SS'''
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+
+class Progress:
+    '''Report the features completed by running SIRIUS processes
+
+    Completed features are counted in the output directories of the
+    processes it is polled with, so the processes of a sharded run can share
+    one instance. Each time the count changes, the number of features
+    completed, the throughput over the last ``window`` seconds and the
+    expected time left are printed and, if ``progress_fp`` is specified,
+    appended to that file as a line of JSON.
+
+    Parameters
+    ----------
+    stage : str
+        Name of the step being run.
+    total : int
+        Number of features the processes compute.
+    complete : callable
+        Called with the path to a per-feature output folder, returns whether
+        that feature finished.
+    progress_fp : str, optional
+        Path to a JSON-lines file the progress is appended to.
+    window : float, optional
+        Seconds over which the throughput is measured.
+    '''
+
+    def __init__(self, stage: str, total: int, complete,
+                 progress_fp: str = None, window: float = 600):
+        self.stage = stage
+        self.total = total
+        self.complete = complete
+        self.progress_fp = progress_fp
+        self.window = window
+
+        self.start = time.time()
+        self.counts = {}
+        self.history = deque([(self.start, 0)])
+        self.last = 0
+        self.lock = threading.Lock()
+
+    def poll(self, process, output_dir: str, started: float = None):
+        count = count_complete(output_dir, self.complete)
+        with self.lock:
+            self.counts[output_dir] = count
+            self.update(sum(self.counts.values()))
+
+    def update(self, completed: int, now: float = None):
+        '''Record that ``completed`` features are done'''
+        now = time.time() if now is None else now
+        self.history.append((now, completed))
+        while now - self.history[1][0] > self.window:
+            self.history.popleft()
+
+        if completed == self.last:
+            return
+        self.last = completed
+
+        then, before = self.history[0]
+        rate = (completed - before) / (now - then) * 60 if now > then else 0
+        eta = (self.total - completed) / rate * 60 if rate > 0 else None
+
+        print('%s: completed %d of %d features (%.1f features/min), '
+              'ETA %s' % (self.stage, completed, self.total, rate,
+                          'unknown' if eta is None else format_duration(eta)),
+              flush=True)
+
+        if self.progress_fp is not None:
+            record = {'stage': self.stage, 'time': now,
+                      'elapsed_seconds': round(now - self.start, 1),
+                      'completed': completed, 'total': self.total,
+                      'features_per_minute': round(rate, 3),
+                      'eta_seconds': None if eta is None else round(eta, 1)}
+            with open(self.progress_fp, 'a') as f:
+                f.write(json.dumps(record) + '\n')
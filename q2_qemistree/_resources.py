@@ -0,0 +1,309 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import math
+import os
+import shlex
+from collections import OrderedDict, namedtuple
+
+from ._mgf import split_features
+
+
+MB = 1024 ** 2
+
+# memory used by the JVM and SIRIUS before any compound is loaded
+BASE_HEAP = 1024 * MB
+
+# fraction of the memory available to the job given to the heap, the rest is
+# left for the JVM's own memory and the operating system
+HEAP_FRACTION = 0.8
+
+# cost model for the runtime of SIRIUS: seconds per unit of feature_cost to
+# compute the trees with a qtof profile and de novo formula search, seconds
+# per feature for CSI:FingerID searching PubChem, and the relative speed of
+# the other profiles and databases. These are uncalibrated defaults, not
+# derived from measured runs, so estimate_runtime labels its estimates as such
+TREE_SECONDS = 0.05
+PROFILE_SPEED = {'qtof': 1.0, 'orbitrap': 0.7, 'fticr': 0.5}
+DATABASE_SPEED = {'all': 1.0, 'pubchem': 0.4}
+FINGERID_SECONDS = 8.0
+FINGERID_DATABASE_SPEED = {'all': 1.3, 'pubchem': 1.0, 'bio': 0.5,
+                           'kegg': 0.3, 'hmdb': 0.3}
+
+# CSI:FingerID keeps its prediction models in memory, plus a little per
+# processor for the compounds being predicted; also uncalibrated defaults
+FINGERID_HEAP = 4096 * MB
+FINGERID_PROCESSOR_HEAP = 256 * MB
+
+Resources = namedtuple('Resources', ['heap', 'initial_buffer', 'max_buffer',
+                                     'processors'])
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _own_cgroups(proc_cgroup):
+    # path of the cgroup of this process by controller, under '' for the
+    # unified (v2) hierarchy
+    paths = {}
+    for line in (_read(proc_cgroup) or '').splitlines():
+        fields = line.split(':', 2)
+        if len(fields) != 3:
+            continue
+        controllers, path = fields[1], fields[2]
+        for controller in controllers.split(',') if controllers else ['']:
+            paths[controller] = path
+    return paths
+
+
+def _ancestors(root, path):
+    # the directory of a cgroup and those of its ancestors, up to the root
+    parts = [part for part in path.split('/') if part]
+    return [os.path.join(root, *parts[:n])
+            for n in range(len(parts), -1, -1)]
+
+
+def _lowest(limit, value):
+    return value if limit is None else min(limit, value)
+
+
+def cgroup_limits(root: str = '/sys/fs/cgroup',
+                  proc_cgroup: str = '/proc/self/cgroup'):
+    '''Memory (in bytes) and CPU limits of the cgroup of this process
+
+    Both cgroup v2 and v1 hierarchies mounted at ``root`` are supported. The
+    cgroup of the process is read from ``proc_cgroup``, and the limits are
+    the lowest ones set from that cgroup up to the root, as batch schedulers
+    (e.g. Slurm), systemd and nested containers limit jobs in child cgroups.
+    Limits that are not set are returned as None.
+    '''
+    paths = _own_cgroups(proc_cgroup)
+    memory, cpus = None, None
+
+    # cgroup v2
+    for path in _ancestors(root, paths.get('', '/')):
+        value = _read(os.path.join(path, 'memory.max'))
+        if value is not None and value != 'max':
+            memory = _lowest(memory, int(value))
+        value = _read(os.path.join(path, 'cpu.max'))
+        if value is not None:
+            quota, period = value.split()[:2]
+            if quota != 'max':
+                cpus = _lowest(cpus, max(1, int(int(quota) / int(period))))
+
+    # cgroup v1, where unlimited memory is reported as a very large number
+    if memory is None:
+        for path in _ancestors(os.path.join(root, 'memory'),
+                               paths.get('memory', '/')):
+            value = _read(os.path.join(path, 'memory.limit_in_bytes'))
+            if value is not None and int(value) < 2 ** 60:
+                memory = _lowest(memory, int(value))
+    if cpus is None:
+        for path in _ancestors(os.path.join(root, 'cpu'),
+                               paths.get('cpu', '/')):
+            quota = _read(os.path.join(path, 'cpu.cfs_quota_us'))
+            period = _read(os.path.join(path, 'cpu.cfs_period_us'))
+            if quota is not None and period is not None and int(quota) > 0:
+                cpus = _lowest(cpus, max(1, int(int(quota) / int(period))))
+
+    return memory, cpus
+
+
+def host_resources(root: str = '/sys/fs/cgroup',
+                   proc_cgroup: str = '/proc/self/cgroup'):
+    '''Memory (in bytes) and number of CPUs available to this process'''
+    memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+
+    cgroup_memory, cgroup_cpus = cgroup_limits(root, proc_cgroup)
+    if cgroup_memory is not None:
+        memory = min(memory, cgroup_memory)
+    if cgroup_cpus is not None:
+        cpus = min(cpus, cgroup_cpus)
+    return memory, cpus
+
+
+def available_resources(cpus: list = None, n_jobs: int = 1):
+    '''Memory (in bytes) and CPUs for each of ``n_jobs`` concurrent jobs
+
+    If ``cpus`` is specified, the jobs are restricted to those CPUs.
+    '''
+    memory, available = host_resources()
+    if cpus:
+        available = len(cpus)
+    return memory // n_jobs, max(1, available // n_jobs)
+
+
+def compound_memory(feature) -> int:
+    '''Rough heap needed (in bytes) to compute the trees of one feature
+
+    The number of candidate formulas grows steeply with the precursor m/z
+    and the size of the fragmentation graph with the number of MS2 peaks.
+    '''
+    mz = feature.pepmass or 0
+    return int((32 + 0.25 * feature.peaks + 64 * (mz / 500) ** 3) * MB)
+
+
+def feature_cost(feature) -> float:
+    '''Relative time needed to compute the trees of one feature
+
+    The number of candidate formulas grows roughly with the cube of the
+    precursor m/z, and the time spent on each of them with the number of MS2
+    peaks.
+    '''
+    mz = feature.pepmass or 0
+    return (mz / 100) ** 3 * (1 + feature.peaks / 10)
+
+
+def heaviest_shard(features: list, n_shards: int) -> list:
+    '''Features of the shard that holds the most expensive feature
+
+    The features are split as in ``write_shards``; there is no such shard,
+    and the result is empty, when there are no features.
+    '''
+    shards = split_features(features, n_shards, feature_cost)
+    return shards[0] if shards else []
+
+
+def estimate_resources(features: list, memory: int, cpus: int) -> Resources:
+    '''Pick heap size, compound buffers and processors for a SIRIUS job
+
+    Parameters
+    ----------
+    features : list of Feature
+        Features of the MGF file, as returned by ``index_mgf``.
+    memory : int
+        Memory available to the job, in bytes.
+    cpus : int
+        Number of CPUs available to the job.
+
+    Returns
+    -------
+    Resources
+        Heap size in bytes, initial and maximum compound buffer sizes and the
+        number of processors SIRIUS should use.
+
+    Raises
+    ------
+    ValueError
+        If the share of ``memory`` given to the heap is smaller than the
+        heap SIRIUS needs without any compound in memory.
+    '''
+    limit = int(memory * HEAP_FRACTION)
+    if limit < BASE_HEAP:
+        # a larger heap would get the JVM killed by the memory limit
+        needed = math.ceil(BASE_HEAP / HEAP_FRACTION / MB)
+        raise ValueError('%d MB of memory are available to each SIRIUS job, '
+                         'but at least %d MB are needed. Use fewer shards or '
+                         'raise the memory limit.' % (memory // MB, needed))
+
+    processors = max(1, cpus)
+    if not features:
+        return Resources(BASE_HEAP, 1, 1, processors)
+
+    # size the buffer for the heavier compounds, not the average one
+    needs = sorted(compound_memory(f) for f in features)
+    per_compound = needs[min(len(needs) - 1, int(len(needs) * 0.95))]
+
+    max_buffer = min(len(features), 4 * processors)
+    fits = max(1, (limit - BASE_HEAP) // per_compound)
+    max_buffer = max(1, min(max_buffer, fits))
+
+    heap = min(limit, BASE_HEAP + max_buffer * per_compound)
+    return Resources(heap, min(processors, max_buffer), max_buffer,
+                     processors)
+
+
+def with_heap(java_flags: str, heap: int) -> str:
+    '''Add a maximum heap size to the JVM flags unless they already set one'''
+    flags = shlex.split(java_flags or '')
+    if not any(flag.startswith('-Xmx') for flag in flags):
+        flags.append('-Xmx%dm' % max(1, heap // MB))
+    return ' '.join(flags)
+
+
+def tree_seconds(feature, profile: str = 'qtof', database: str = 'all',
+                 tree_timeout: int = 1600, num_candidates: int = 50) -> float:
+    '''Expected time to compute the fragmentation trees of one feature
+
+    The time is bounded by ``tree_timeout`` for each of the
+    ``num_candidates`` trees, 0 meaning no bound.
+    '''
+    seconds = (TREE_SECONDS * feature_cost(feature) * PROFILE_SPEED[profile] *
+               DATABASE_SPEED[database])
+    if tree_timeout:
+        seconds = min(seconds, tree_timeout * num_candidates)
+    return seconds
+
+
+def makespan(features: list, seconds, n_jobs: int) -> float:
+    '''Wall time of running features longest-first on ``n_jobs`` cores'''
+    shards = split_features(features, n_jobs, seconds)
+    return max((sum(seconds(f) for f in shard) for shard in shards),
+               default=0)
+
+
+def estimate_steps(features: list, profile: str, database: str = 'all',
+                   fingerid_db: str = 'pubchem', n_jobs: int = 1,
+                   tree_timeout: int = 1600, num_candidates: int = 50):
+    '''Expected wall time, CPU time and peak heap of the SIRIUS steps
+
+    The estimates rest on the uncalibrated defaults of the cost model
+    (``TREE_SECONDS``, ``PROFILE_SPEED``, ``FINGERID_SECONDS``, ...), so they
+    are only meant to compare settings, not to predict a run.
+
+    Parameters
+    ----------
+    features : list of Feature
+        Features SIRIUS will process, as returned by ``index_mgf``.
+    profile : str
+        Configuration profile for the mass-spec platform used.
+    database : str, optional
+        Database formulas are searched in.
+    fingerid_db : str, optional
+        Database structures are searched in.
+    n_jobs : int, optional
+        Number of cpu cores SIRIUS uses.
+    tree_timeout : int, optional
+        Time for computation per fragmentation tree in seconds.
+    num_candidates : int, optional
+        Number of fragmentation trees to compute per feature.
+
+    Returns
+    -------
+    OrderedDict of str to tuple
+        For each step, the wall time and CPU time in seconds and the peak
+        heap size in bytes.
+    '''
+    def trees(feature):
+        return tree_seconds(feature, profile, database, tree_timeout,
+                            num_candidates)
+
+    def fingerprints(feature):
+        return FINGERID_SECONDS * FINGERID_DATABASE_SPEED[fingerid_db]
+
+    # the heap needed when memory is not a constraint
+    heap = estimate_resources(features, 2 ** 62, n_jobs).heap
+
+    estimates = OrderedDict()
+    estimates['compute-fragmentation-trees'] = (
+        makespan(features, trees, n_jobs),
+        sum(trees(f) for f in features), heap)
+    estimates['predict-fingerprints'] = (
+        makespan(features, fingerprints, n_jobs),
+        sum(fingerprints(f) for f in features),
+        FINGERID_HEAP + n_jobs * FINGERID_PROCESSOR_HEAP)
+    return estimates
@@ -7,63 +7,110 @@
 # ----------------------------------------------------------------------------
 
 import qiime2.plugin.model as model
-from qiime2.plugin import SemanticType
+from qiime2.plugin import SemanticType, ValidationError
 from q2_types.feature_data import FeatureData
 import os
-import warnings
 
+from ._compress import COMPRESSED_NAMES, compression, decompress_mgf
+from ._links import link_or_copy
+from ._mgf import index_path, read_index
+from ._resources import host_resources
+from ._validate import (SNIFF_RECORDS, validate_compressed_mgf,
+                        validate_mgf_file, validate_mgf_sample)
 
-def validate_mgf(iterable):
 
-    # ms1 and ms2 count the number of records for the MS1 and MS2 spectra
-    read_id, new_feature_id, ms1, ms2 = None, None, 0, 0
+class MGFFile(model.TextFileFormat):
+    def sniff(self):
+        # checks for unique MS1s and at least one MS2 per MS1 in a sample of
+        # the records
+        return validate_mgf_sample(str(self))
+
+    def _validate_(self, level):
+        # the whole file is only scanned for an exhaustive validation
+        try:
+            if level == 'min':
+                validate_mgf_sample(str(self))
+            else:
+                _, cpus = host_resources()
+                validate_mgf_file(str(self), n_jobs=cpus)
+        except ValueError as e:
+            raise ValidationError(str(e)) from e
 
-    for line in iterable:
-        if line.startswith('FEATURE_ID='):
-            # get the feature identifier without the new line
-            new_feature_id = line.split('=')[1].strip()
 
-            if read_id is None:
-                read_id = new_feature_id
-            else:
-                if new_feature_id != read_id:
-                    if ms2 < 1:
-                        warnings.warn('At least one feature (Feature ID = '
-                                      '"%s") does not have MS2 '
-                                      'information' % read_id, UserWarning)
-
-                    # if the previous record is good, then we'll reset
-                    # the current state variables and start over
-                    read_id = new_feature_id
-
-                    ms1, ms2 = 0, 0
-
-        elif read_id is not None:
-            if line.startswith('MSLEVEL=1'):
-                ms1 += 1
-
-                if ms1 > 1:
-                    raise ValueError('Feature "%s" has more than one MSLEVEL=1'
-                                     ' record' % read_id)
-            elif line.startswith('MSLEVEL=2'):
-                ms2 += 1
-            elif line.startswith('END IONS'):
-                # after reading a whole record, we should have an MS1, this is
-                # assuming that MS1 records always come before any MS2 records
-                if ms1 < 1:
-                    raise ValueError('Feature "%s" does not have an '
-                                     'MSLEVEL=1 record' % read_id)
-    return True
+class CompressedMGFFile(model.BinaryFileFormat):
+    def sniff(self):
+        return compression(str(self)) is not None and \
+            validate_compressed_mgf(str(self), records=SNIFF_RECORDS)
 
+    def _validate_(self, level):
+        # the file is decompressed as it is read, a minimal validation only
+        # reads the first records
+        try:
+            validate_compressed_mgf(str(self), records=SNIFF_RECORDS
+                                    if level == 'min' else None)
+        except ValueError as e:
+            raise ValidationError(str(e)) from e
 
-class MGFFile(model.TextFileFormat):
+
+class MGFIndexFile(model.TextFileFormat):
     def sniff(self):
-        # checks for unique MS1s and at least one MS2 per MS1
         with open(str(self)) as f:
-            return validate_mgf(f)
+            return f.readline().startswith('#mgf-bytes=')
+
+
+class MGFDirFmt(model.DirectoryFormat):
+    file = model.File('features.mgf', format=MGFFile, optional=True)
+    # the MGF file compressed with gzip or zstd, instead of features.mgf
+    compressed = model.File(r'features\.mgf\.(gz|zst)',
+                            format=CompressedMGFFile, optional=True)
+    # byte ranges and summaries of the features, see _mgf.write_index. For a
+    # compressed file they are those of the decompressed file
+    index = model.File('features.index.tsv', format=MGFIndexFile,
+                       optional=True)
+
+    def compressed_path(self):
+        """Get the path to the compressed MGF file, or None if not compressed
+        """
+        for name in COMPRESSED_NAMES.values():
+            path = os.path.join(str(self.path), name)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def decompressed(self):
+        """Get a directory with the MGF file decompressed
+
+        The directory itself is returned if its MGF file is not compressed,
+        otherwise the file is decompressed to a temporary directory, along
+        with the index, which only lasts as long as the returned object.
+        """
+        compressed = self.compressed_path()
+        if compressed is None:
+            return self
+        result = MGFDirFmt()
+        mgf = os.path.join(str(result.path), 'features.mgf')
+        decompress_mgf(compressed, mgf)
+        index = os.path.join(str(self.path), 'features.index.tsv')
+        if os.path.exists(index):
+            link_or_copy(index, index_path(mgf))
+        return result
+
+    def _validate_(self, level):
+        mgf = os.path.join(str(self.path), 'features.mgf')
+        found = [name for name in ['features.mgf'] +
+                 list(COMPRESSED_NAMES.values())
+                 if os.path.exists(os.path.join(str(self.path), name))]
+        if len(found) != 1:
+            raise ValidationError('Expected exactly one of features.mgf, '
+                                  'features.mgf.gz or features.mgf.zst, '
+                                  'found %d' % len(found))
+        # checking the index of a compressed file would decompress it
+        if level == 'max' and found[0] == 'features.mgf' and \
+                os.path.exists(index_path(mgf)) and read_index(mgf) is None:
+            raise ValidationError('features.index.tsv is not the index of '
+                                  'features.mgf')
 
 
-MGFDirFmt = model.SingleFileDirectoryFormat('MGFFile', 'features.mgf', MGFFile)
 MassSpectrometryFeatures = SemanticType('MassSpectrometryFeatures')
 
 
@@ -113,3 +160,11 @@ class ZodiacDirFmt(OutputDirs):
 
 
 ZodiacFolder = SemanticType('ZodiacFolder')
+
+
+class JobArrayDirFmt(OutputDirs):
+    def get_folder_name(self):
+        return 'job-array'
+
+
+JobArray = SemanticType('JobArray')
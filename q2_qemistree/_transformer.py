@@ -1,5 +1,11 @@
 from .plugin_setup import plugin
-from ._semantics import TSVMolecules
+from ._semantics import TSVMolecules, MGFFile, CompressedMGFFile, MGFDirFmt
+from ._compress import COMPRESSED_NAMES, compression, decompress_mgf
+from ._mgf import index_mgf, index_path, write_index
+from ._links import reflink_or_copy
+import os
+import shutil
+import tempfile
 import pandas as pd
 import qiime2
 
@@ -46,3 +52,42 @@ def _2(ff: TSVMolecules) -> pd.DataFrame:
 @plugin.register_transformer
 def _3(ff: TSVMolecules) -> qiime2.Metadata:
     return qiime2.Metadata(_tsvmolecules_to_df(ff))
+
+
+# imported MGF files are indexed, in a single pass over the file; they belong
+# to the user and may be edited after the import, so they are never hardlinked
+@plugin.register_transformer
+def _4(ff: MGFFile) -> MGFDirFmt:
+    result = MGFDirFmt()
+    mgf = os.path.join(str(result.path), 'features.mgf')
+    reflink_or_copy(str(ff), mgf)
+    write_index(index_mgf(mgf), mgf)
+    return result
+
+
+# a compressed MGF file is decompressed only when a real path is needed
+@plugin.register_transformer
+def _5(df: MGFDirFmt) -> MGFFile:
+    compressed = df.compressed_path()
+    if compressed is None:
+        return MGFFile(os.path.join(str(df.path), 'features.mgf'), mode='r')
+    ff = MGFFile()
+    decompress_mgf(compressed, str(ff))
+    return ff
+
+
+# imported compressed MGF files are stored as they are, the index is built
+# from a copy decompressed to a temporary directory
+@plugin.register_transformer
+def _6(ff: CompressedMGFFile) -> MGFDirFmt:
+    result = MGFDirFmt()
+    compressed = os.path.join(str(result.path),
+                              COMPRESSED_NAMES[compression(str(ff))])
+    reflink_or_copy(str(ff), compressed)
+    with tempfile.TemporaryDirectory() as tmp:
+        mgf = os.path.join(tmp, 'features.mgf')
+        decompress_mgf(compressed, mgf)
+        write_index(index_mgf(mgf), mgf)
+        shutil.move(index_path(mgf), os.path.join(str(result.path),
+                                                  'features.index.tsv'))
+    return result
@@ -0,0 +1,209 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+USAGE = 'usage.tsv'
+SUMMARY = 'usage_summary.tsv'
+
+COLUMNS = ['elapsed_seconds', 'rss_bytes', 'cpu_percent', 'threads',
+           'read_bytes', 'write_bytes']
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _stat(pid):
+    stat = _read('/proc/%d/stat' % pid)
+    if stat is None:
+        return None
+    # the command name is in parentheses and may contain spaces, the
+    # remaining fields start with the state of the process (field 3)
+    fields = stat[stat.rfind(')') + 2:].split()
+    return {'ppid': int(fields[1]),
+            'ticks': int(fields[11]) + int(fields[12]),
+            'threads': int(fields[17]),
+            'rss': int(fields[21]) * os.sysconf('SC_PAGE_SIZE')}
+
+
+def process_tree(pid: int) -> list:
+    '''Identifiers of a process and all its descendants'''
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        stat = _stat(int(name))
+        if stat is not None:
+            children.setdefault(stat['ppid'], []).append(int(name))
+
+    tree, pending = [], [pid]
+    while pending:
+        pid = pending.pop()
+        tree.append(pid)
+        pending.extend(children.get(pid, []))
+    return tree
+
+
+def sample_tree(pid: int) -> dict:
+    '''Resident memory, CPU ticks, threads and I/O of a process tree
+
+    Processes that exit while they are being read are skipped.
+    '''
+    total = {'rss': 0, 'ticks': 0, 'threads': 0, 'read_bytes': 0,
+             'write_bytes': 0}
+    for child in process_tree(pid):
+        stat = _stat(child)
+        if stat is None:
+            continue
+        for key in ['rss', 'ticks', 'threads']:
+            total[key] += stat[key]
+
+        io = _read('/proc/%d/io' % child) or ''
+        for line in io.splitlines():
+            key, _, value = line.partition(':')
+            if key in ('read_bytes', 'write_bytes'):
+                total[key] += int(value)
+    return total
+
+
+class UsageSampler:
+    '''Record the resources used by a SIRIUS process and its children
+
+    Each poll reads the resident memory, CPU time, threads and bytes read
+    and written by the process tree from ``/proc``. On platforms without
+    ``/proc`` only the wall time is recorded.
+    '''
+
+    def __init__(self):
+        self.start = time.time()
+        self.rows = []
+        self.ticks, self.cpu_seconds, self.last = 0, 0.0, self.start
+        self.supported = os.path.isdir('/proc')
+        self.lock = threading.Lock()
+
+    def poll(self, process, output_dir: str = None):
+        if not self.supported:
+            return
+        sample = sample_tree(process.pid)
+        now = time.time()
+
+        with self.lock:
+            # the CPU time of children that exited is no longer counted by
+            # the tree, so only increases are added up
+            seconds = (max(0, sample['ticks'] - self.ticks) /
+                       os.sysconf('SC_CLK_TCK'))
+            self.cpu_seconds += seconds
+            cpu = seconds / (now - self.last) * 100 if now > self.last else 0
+            self.ticks, self.last = sample['ticks'], now
+
+            self.rows.append([round(now - self.start, 1), sample['rss'],
+                              round(cpu, 1), sample['threads'],
+                              sample['read_bytes'], sample['write_bytes']])
+
+    def summary(self) -> OrderedDict:
+        wall = time.time() - self.start
+        column = dict(zip(COLUMNS, zip(*self.rows))) if self.rows else {}
+        return OrderedDict([
+            ('wall_seconds', round(wall, 1)),
+            ('peak_rss_bytes', max(column.get('rss_bytes', [0]))),
+            ('mean_cpu_percent', round(self.cpu_seconds / wall * 100, 1)
+             if wall > 0 else 0),
+            ('cpu_seconds', round(self.cpu_seconds, 1)),
+            ('peak_threads', max(column.get('threads', [0]))),
+            ('read_bytes', max(column.get('read_bytes', [0]))),
+            ('write_bytes', max(column.get('write_bytes', [0]))),
+            ('samples', len(self.rows))])
+
+    def write(self, directory: str):
+        '''Write the time series and the summary to ``directory``'''
+        with self.lock:
+            with open(os.path.join(directory, USAGE), 'w') as f:
+                f.write('\t'.join(COLUMNS) + '\n')
+                for row in self.rows:
+                    f.write('\t'.join(map(str, row)) + '\n')
+            write_summary(self.summary(), directory)
+
+
+def write_summary(summary: dict, directory: str):
+    with open(os.path.join(directory, SUMMARY), 'w') as f:
+        f.write('metric\tvalue\n')
+        for metric, value in summary.items():
+            f.write('%s\t%s\n' % (metric, value))
+
+
+def read_summary(directory: str):
+    '''Read the usage summary in ``directory``, None if there is none'''
+    contents = _read(os.path.join(directory, SUMMARY))
+    if contents is None:
+        return None
+    summary = OrderedDict()
+    for line in contents.splitlines()[1:]:
+        metric, value = line.split('\t')
+        summary[metric] = float(value) if '.' in value else int(value)
+    return summary
+
+
+def merge_usage(parts: list, destination: str, concurrent: bool):
+    '''Merge the resource usage recorded for several SIRIUS processes
+
+    Parameters
+    ----------
+    parts : list of (str, str)
+        Label and directory of the usage of each process. Directories
+        without a usage summary are ignored.
+    destination : str
+        Directory the merged usage is written to.
+    concurrent : bool
+        Whether the processes ran at the same time (shards) or one after the
+        other (attempts). The peak memory and threads of concurrent
+        processes are added up, an upper bound of their joint peak.
+    '''
+    summaries = []
+    with open(os.path.join(destination, USAGE), 'w') as out:
+        out.write('\t'.join(COLUMNS) + '\n')
+        for label, directory in parts:
+            summary = read_summary(directory)
+            if summary is None:
+                continue
+            summaries.append(summary)
+            out.write('# %s\n' % label)
+            with open(os.path.join(directory, USAGE)) as f:
+                f.readline()
+                out.writelines(f)
+
+    if not summaries:
+        os.remove(os.path.join(destination, USAGE))
+        return
+
+    def total(metric):
+        return sum(s[metric] for s in summaries)
+
+    def peak(metric):
+        return max(s[metric] for s in summaries)
+
+    combine = total if concurrent else peak
+    wall = peak('wall_seconds') if concurrent else total('wall_seconds')
+    cpu = total('cpu_seconds')
+    write_summary(OrderedDict([
+        ('wall_seconds', round(wall, 1)),
+        ('peak_rss_bytes', combine('peak_rss_bytes')),
+        ('mean_cpu_percent', round(cpu / wall * 100, 1) if wall > 0 else 0),
+        ('cpu_seconds', round(cpu, 1)),
+        ('peak_threads', combine('peak_threads')),
+        ('read_bytes', total('read_bytes')),
+        ('write_bytes', total('write_bytes')),
+        ('samples', total('samples'))]), destination)
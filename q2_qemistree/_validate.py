@@ -0,0 +1,423 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import io
+import mmap
+import os
+import random
+import re
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+from ._compress import BLOCK_SIZE, open_compressed
+
+
+# records checked by the sampled validation: the first SNIFF_RECORDS of the
+# file and SAMPLE_RECORDS from each of SAMPLES random offsets
+SNIFF_RECORDS = 1000
+SAMPLES = 32
+SAMPLE_RECORDS = 64
+
+# smallest part of a file validated by each process
+MIN_CHUNK_SIZE = 64 * 1024 ** 2
+# bytes of a memory-mapped file scanned at a time by the sampled validation,
+# which stops as soon as it has read enough records
+SAMPLE_BLOCK_SIZE = 64 * 1024
+
+FEATURE_ID, MS1, MS2, END = 'FEATURE_ID', 'MS1', 'MS2', 'END'
+
+# lines starting with one of the markers, in the same order as the checks in
+# _line_events. Lines are matched from the newline before them, which is much
+# faster than matching at every line start
+_MARKER = (rb'(?:F|M|E)(?:EATURE_ID=([^\r\n]*)|SLEVEL=(1)|SLEVEL=(2)|'
+           rb'ND IONS)')
+_FIRST_MARKER = re.compile(_MARKER)
+_MARKERS = re.compile(rb'\n' + _MARKER)
+# a carriage return that is not followed by a newline also ends a line when
+# the file is read as text
+_LONE_CR = re.compile(rb'\r(?!\n)')
+
+
+class _LoneCR(Exception):
+    # raised by the byte scans when a block has a lone carriage return, in
+    # which case the file is read as text instead
+    pass
+
+
+def _line_events(iterable):
+    for line in iterable:
+        if line.startswith('FEATURE_ID='):
+            # get the feature identifier without the new line
+            yield FEATURE_ID, line.split('=')[1].strip()
+        elif line.startswith('MSLEVEL=1'):
+            yield MS1, None
+        elif line.startswith('MSLEVEL=2'):
+            yield MS2, None
+        elif line.startswith('END IONS'):
+            yield END, None
+
+
+def _event(match):
+    feature_id, ms1, ms2 = match.groups()
+    if feature_id is not None:
+        return FEATURE_ID, feature_id.split(b'=')[0].strip().decode()
+    elif ms1:
+        return MS1, None
+    elif ms2:
+        return MS2, None
+    return END, None
+
+
+def _byte_events(data, start=0, end=None):
+    # start should be the beginning of a line
+    end = len(data) if end is None else end
+    first = _FIRST_MARKER.match(data, start, end)
+    if first is not None:
+        yield _event(first)
+    for match in _MARKERS.finditer(data, start, end):
+        yield _event(match)
+
+
+def _block_events(stream, block, block_size):
+    # events of the complete lines of each block, the partial line at the end
+    # of a block is carried over to the next one. A carriage return at the
+    # end of a block is in that partial line, so whether it is a lone one is
+    # only decided with the next block
+    carry = b''
+    while block:
+        data = carry + block
+        end = data.rfind(b'\n') + 1
+        if _LONE_CR.search(data, 0, end) is not None:
+            raise _LoneCR()
+        yield from _byte_events(data, 0, end)
+        carry = data[end:]
+        block = stream.read(block_size)
+    if carry:
+        if _LONE_CR.search(carry) is not None:
+            raise _LoneCR()
+        yield from _byte_events(carry)
+
+
+def _mapped_events(data, start=0, block_size=SAMPLE_BLOCK_SIZE):
+    # events from start to the end of a memory map, one block of lines at a
+    # time, so that a scan that stops early only reads the blocks it needs
+    while start < len(data):
+        end = data.find(b'\n', min(start + block_size, len(data)) - 1) + 1
+        end = end or len(data)
+        if _LONE_CR.search(data, start, end) is not None:
+            raise _LoneCR()
+        yield from _byte_events(data, start, end)
+        start = end
+
+
+def _warn(message):
+    warnings.warn(message, UserWarning)
+
+
+def _check(events, state=(None, 0, 0), warn=_warn):
+    # state is the identifier of the feature being read and its number of
+    # records for the MS1 and MS2 spectra, returned after the events
+    read_id, ms1, ms2 = state
+
+    for event, value in events:
+        if event == FEATURE_ID:
+            if read_id is None:
+                read_id = value
+            elif value != read_id:
+                if ms2 < 1:
+                    warn('At least one feature (Feature ID = "%s") does not '
+                         'have MS2 information' % read_id)
+
+                # if the previous record is good, then we'll reset the
+                # current state variables and start over
+                read_id = value
+                ms1, ms2 = 0, 0
+
+        elif read_id is not None:
+            if event == MS1:
+                ms1 += 1
+
+                if ms1 > 1:
+                    raise ValueError('Feature "%s" has more than one MSLEVEL=1'
+                                     ' record' % read_id)
+            elif event == MS2:
+                ms2 += 1
+            elif event == END:
+                # after reading a whole record, we should have an MS1, this
+                # is assuming that MS1 records always come before any MS2
+                # records
+                if ms1 < 1:
+                    raise ValueError('Feature "%s" does not have an '
+                                     'MSLEVEL=1 record' % read_id)
+    return read_id, ms1, ms2
+
+
+def validate_mgf(iterable):
+    '''Check that every feature has one MS1 record before its MS2 records
+
+    Parameters
+    ----------
+    iterable : iterable of str
+        Lines of an MGF file.
+
+    Raises
+    ------
+    ValueError
+        If a feature has no MS1 record, or more than one.
+
+    Warns
+    -----
+    UserWarning
+        If a feature does not have any MS2 record.
+
+    Returns
+    -------
+    bool
+        True if the file is valid.
+    '''
+    _check(_line_events(iterable))
+    return True
+
+
+def _chunks(data, n_chunks):
+    # (start, end) of n_chunks parts of about the same size, split where a
+    # record begins
+    starts = [0]
+    for n in range(1, n_chunks):
+        start = data.find(b'\nBEGIN IONS', len(data) * n // n_chunks)
+        if start == -1:
+            break
+        if start + 1 > starts[-1]:
+            starts.append(start + 1)
+    return list(zip(starts, starts[1:] + [len(data)]))
+
+
+def _validate_chunk(mgf_fp, start, end):
+    '''Validate part of an MGF file independently of the rest
+
+    The first feature of a chunk may continue from the previous chunk, so its
+    events (up to and including the identifier of the next feature) are
+    returned to be checked once the state before the chunk is known. The
+    rest of the chunk is checked here.
+
+    Returns
+    -------
+    tuple
+        The events of the first feature, the warnings and the error (or
+        None) of the rest of the chunk, and the state at its end.
+    '''
+    with open(mgf_fp, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        events = _byte_events(data, start, end)
+        try:
+            head, first = [], None
+            for event, value in events:
+                head.append((event, value))
+                if event != FEATURE_ID:
+                    continue
+                if first is None:
+                    first = value
+                elif value != first:
+                    break
+            else:
+                return head, [], None, None
+
+            found, error, state = [], None, None
+            try:
+                # whatever the state before the chunk, the next feature
+                # starts from scratch
+                state = _check(events, (head[-1][1], 0, 0), found.append)
+            except ValueError as e:
+                error = str(e)
+            return head, found, error, state
+        finally:
+            events.close()
+
+
+def validate_mgf_file(mgf_fp: str, n_jobs: int = 1,
+                      min_chunk_size: int = MIN_CHUNK_SIZE):
+    '''Same as ``validate_mgf`` for the MGF file at ``mgf_fp``
+
+    The file is memory-mapped and scanned as bytes for the lines with the
+    feature identifiers, MS levels and ends of records, instead of decoding
+    and splitting every line, which is much faster for large files.
+
+    With ``n_jobs`` greater than one, files of at least two
+    ``min_chunk_size`` bytes are split into chunks at the beginning of
+    records and the chunks are scanned by a pool of ``n_jobs`` processes.
+    The features that span two chunks are checked once both are scanned, so
+    the errors and warnings are the same as those of a single scan.
+    '''
+    size = os.path.getsize(mgf_fp)
+    if size == 0:
+        return True
+    with open(mgf_fp, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if _LONE_CR.search(data) is not None:
+            # old Mac line endings, rare enough to read the file as text
+            with open(mgf_fp) as lines:
+                return validate_mgf(lines)
+
+        n_chunks = min(n_jobs, size // min_chunk_size)
+        if n_chunks < 2:
+            events = _byte_events(data)
+            try:
+                _check(events)
+                return True
+            finally:
+                # the scan holds a view of the map until it is closed
+                events.close()
+        chunks = _chunks(data, n_chunks)
+
+    with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+        futures = [executor.submit(_validate_chunk, mgf_fp, start, end)
+                   for start, end in chunks]
+
+        state = (None, 0, 0)
+        try:
+            for future in futures:
+                head, found, error, end_state = future.result()
+                state = _check(head, state)
+                if end_state is None and error is None:
+                    # the whole chunk is the same feature
+                    continue
+                for message in found:
+                    _warn(message)
+                if error is not None:
+                    raise ValueError(error)
+                state = end_state
+        except BaseException:
+            # the chunks left are not needed
+            for future in futures:
+                future.cancel()
+            raise
+    return True
+
+
+def _take(events, records):
+    # the events up to the end of the given number of records
+    taken = []
+    for event in events:
+        taken.append(event)
+        if event[0] == END:
+            records -= 1
+            if records == 0:
+                break
+    return taken
+
+
+def _from_next_feature(events):
+    # skip the rest of the feature being read, whose first records may be
+    # before the events
+    first = None
+    for event in events:
+        if event[0] != FEATURE_ID:
+            continue
+        if first is None:
+            first = event[1]
+        elif event[1] != first:
+            yield event
+            break
+    yield from events
+
+
+def validate_mgf_sample(mgf_fp: str, records: int = SNIFF_RECORDS,
+                        samples: int = SAMPLES,
+                        sample_records: int = SAMPLE_RECORDS):
+    '''Validate the first records of an MGF file and a sample of the rest
+
+    A cheaper version of ``validate_mgf_file`` that checks the first
+    ``records`` records and ``sample_records`` records from each of
+    ``samples`` random byte offsets. Each sample starts at the first feature
+    that begins after its offset, so only features read from their first
+    record are checked. The offsets are seeded with the size of the file, so
+    the same file is always checked the same way.
+
+    Errors found are the same as those of ``validate_mgf_file``, but errors
+    outside of the records checked are missed. Only the blocks around the
+    records checked are read, including for the line endings: a file with
+    old Mac line endings (lone carriage returns) in those blocks is
+    validated as text, as a whole.
+    '''
+    size = os.path.getsize(mgf_fp)
+    if size == 0:
+        return True
+
+    rng = random.Random(size)
+    offsets = sorted(rng.randrange(size) for _ in range(samples))
+    with open(mgf_fp, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        # samples may overlap, so their warnings are only raised once
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            try:
+                events = _mapped_events(data)
+                try:
+                    _check(_take(events, records))
+                finally:
+                    events.close()
+
+                for offset in offsets:
+                    start = data.rfind(b'\n', 0, offset) + 1
+                    events = _mapped_events(data, start)
+                    try:
+                        _check(_take(_from_next_feature(events),
+                                     sample_records))
+                    finally:
+                        events.close()
+            except _LoneCR:
+                caught = None
+
+    if caught is None:
+        with open(mgf_fp) as lines:
+            return validate_mgf(lines)
+
+    messages = []
+    for warning in caught:
+        if str(warning.message) not in messages:
+            messages.append(str(warning.message))
+            warnings.warn(warning.message, warning.category)
+    return True
+
+
+def validate_compressed_mgf(compressed_fp: str, records: int = None,
+                            block_size: int = BLOCK_SIZE):
+    '''Same as ``validate_mgf`` for a gzip or zstd-compressed MGF file
+
+    The file is decompressed as a stream and scanned one block at a time, so
+    it is neither written to disk nor held in memory. With ``records``, only
+    the first ``records`` records are checked.
+
+    The blocks are ``block_size`` bytes of the decompressed file, extended to
+    the end of their last line. Every block is checked for old Mac line
+    endings (lone carriage returns), and the file is validated as text once
+    one is found.
+    '''
+    # the warnings of a scan stopped by a lone carriage return are raised
+    # again by the text validation, so they are only kept if it completes
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        with open_compressed(compressed_fp) as stream:
+            events = _block_events(stream, stream.read(block_size),
+                                   block_size)
+            try:
+                _check(events if records is None else _take(events, records))
+            except _LoneCR:
+                caught = None
+            finally:
+                events.close()
+
+    if caught is not None:
+        for warning in caught:
+            warnings.warn(warning.message, warning.category)
+        return True
+
+    with io.TextIOWrapper(open_compressed(compressed_fp)) as lines:
+        events = _line_events(lines)
+        _check(events if records is None else _take(events, records))
+    return True
@@ -0,0 +1,90 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import threading
+import time
+
+
+def activity(output_dir: str):
+    '''Number of entries and newest modification time in a SIRIUS output
+
+    Only the output directory and the per-feature folders in it are
+    inspected, which is where SIRIUS adds files as features complete.
+    '''
+    count, newest = 0, 0
+    if output_dir is None or not os.path.isdir(output_dir):
+        return count, newest
+
+    pending = [(output_dir, 0)]
+    while pending:
+        path, depth = pending.pop()
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            # removed while it was being read
+            continue
+        for entry in entries:
+            try:
+                newest = max(newest, entry.stat().st_mtime)
+            except OSError:
+                continue
+            count += 1
+            if depth < 1 and entry.is_dir():
+                pending.append((entry.path, depth + 1))
+    return count, newest
+
+
+class Watchdog:
+    '''Stop SIRIUS processes that hang
+
+    A process is stopped when its output directory does not change for
+    ``stall_timeout`` seconds, or when it runs for longer than
+    ``max_runtime`` seconds, both measured from the time the process was
+    started at. Stopping is done by raising ``TimeoutError``
+    from ``poll``, which makes the launcher kill the process and its
+    children.
+
+    Parameters
+    ----------
+    stall_timeout : float, optional
+        Seconds without changes to the output after which a process is
+        considered hung. 0 or None disables the check.
+    max_runtime : float, optional
+        Seconds a process may run for. 0 or None disables the check.
+    '''
+
+    def __init__(self, stall_timeout: float = None,
+                 max_runtime: float = None):
+        self.stall_timeout = stall_timeout
+        self.max_runtime = max_runtime
+        self.state = {}
+        self.lock = threading.Lock()
+
+    def poll(self, process, output_dir: str, started: float = None,
+             now: float = None):
+        now = time.time() if now is None else now
+        started = now if started is None else started
+        current = activity(output_dir)
+
+        with self.lock:
+            # the first poll happens up to one interval after the start, so
+            # the clocks start when the process did, with no output yet
+            start, changed, seen = self.state.get(output_dir,
+                                                  (started, started, (0, 0)))
+            if current != seen:
+                changed = now
+            self.state[output_dir] = (start, changed, current)
+
+        if self.max_runtime and now - start > self.max_runtime:
+            raise TimeoutError('SIRIUS ran for more than %d seconds writing '
+                               'to "%s"' % (self.max_runtime, output_dir))
+        if self.stall_timeout and now - changed > self.stall_timeout:
+            raise TimeoutError('SIRIUS did not make progress for %d seconds '
+                               'writing to "%s"' % (self.stall_timeout,
+                                                    output_dir))
@@ -9,18 +9,25 @@ import q2_qemistree
 import importlib
 from ._fingerprint import (compute_fragmentation_trees,
                            rerank_molecular_formulas,
-                           predict_fingerprints)
+                           predict_fingerprints,
+                           compute_fingerprints)
+from ._compact import compact_fingerprints
+from ._jobs import export_job_array, merge_fingerprints
+from ._filter import filter_features, subset_features
+from ._estimate import estimate_runtime
 from ._hierarchy import make_hierarchy
 from ._prune_hierarchy import prune_hierarchy
 from ._classyfire import get_classyfire_taxonomy
-from ._semantics import (MassSpectrometryFeatures, MGFDirFmt,
+from ._semantics import (MassSpectrometryFeatures, MGFDirFmt, MGFFile,
+                         MGFIndexFile, CompressedMGFFile,
                          SiriusFolder, SiriusDirFmt,
                          ZodiacFolder, ZodiacDirFmt,
                          CSIFolder, CSIDirFmt,
+                         JobArray, JobArrayDirFmt,
                          FeatureData, TSVMoleculesFormat, Molecules)
 
 from qiime2.plugin import (Plugin, Str, Range, Choices, Float, Int, Bool, List,
-                           Citations)
+                           Citations, Metadata)
 from q2_types.feature_table import FeatureTable, Frequency
 from q2_types.tree import Phylogeny, Rooted
 
@@ -38,7 +45,7 @@ plugin = Plugin(
 )
 
 # type registration
-plugin.register_views(MGFDirFmt)
+plugin.register_views(MGFFile, MGFIndexFile, CompressedMGFFile, MGFDirFmt)
 plugin.register_semantic_types(MassSpectrometryFeatures)
 plugin.register_semantic_type_to_format(MassSpectrometryFeatures,
                                         artifact_format=MGFDirFmt)
@@ -58,6 +65,11 @@ plugin.register_semantic_types(CSIFolder)
 plugin.register_semantic_type_to_format(CSIFolder,
                                         artifact_format=CSIDirFmt)
 
+plugin.register_views(JobArrayDirFmt)
+plugin.register_semantic_types(JobArray)
+plugin.register_semantic_type_to_format(JobArray,
+                                        artifact_format=JobArrayDirFmt)
+
 plugin.register_views(TSVMoleculesFormat)
 plugin.register_semantic_types(Molecules)
 plugin.register_semantic_type_to_format(FeatureData[Molecules],
@@ -75,7 +87,27 @@ PARAMS = {
     'tree_timeout': Int % Range(600, 3000, inclusive_end=True),
     'maxmz': Int % Range(100, 850, inclusive_end=True),
     'zodiac_threshold': Float % Range(0, 1, inclusive_end=True),
-    'java_flags': Str
+    'java_flags': Str,
+    'n_shards': Int % Range(1, None),
+    'cache_dir': Str,
+    'cache_max_size': Int % Range(1, None),
+    'work_dir': Str,
+    'cpu_affinity': Str,
+    'niceness': Int % Range(0, 19, inclusive_end=True),
+    'resources': Str % Choices(['manual', 'auto']),
+    'min_peaks': Int % Range(1, None),
+    'drop_duplicates': Bool,
+    'progress_file': Str,
+    'stall_timeout': Int % Range(0, None),
+    'max_runtime': Int % Range(0, None),
+    'compact': Bool,
+    'deduplicate': Bool,
+    'dedup_mz_tolerance': Float % Range(0, None, inclusive_start=False),
+    'dedup_rt_tolerance': Float % Range(0, None, inclusive_start=False),
+    'array_size': Int % Range(1, None),
+    'zodiac_max_features': Int % Range(0, None),
+    'zodiac_partition': Str % Choices(['similarity', 'retention-time']),
+    'zodiac_parallel_groups': Int % Range(1, None)
 }
 
 PARAMS_DESC = {
@@ -94,21 +126,155 @@ PARAMS_DESC = {
                   'For Sirius it is recommended that you modify the initial '
                   'and maximum heap size. For example to set an initial and '
                   'maximum heap size of 16GB and 64GB (respectively) specify '
-                  '"-Xms16G -Xmx64G". Note that the quotes are important.'
+                  '"-Xms16G -Xmx64G". Note that the quotes are important.',
+    'n_shards': 'Number of feature-disjoint shards the input is split into. '
+                'Each shard is processed by a separate Sirius process and '
+                'the cores in n_jobs are divided evenly among them. '
+                'Features are balanced across shards by their expected cost '
+                'and the most expensive ones are computed first. With a '
+                'single shard the input is given to Sirius as it is',
+    'cache_dir': 'Directory of a local cache of Sirius results. Results '
+                 'computed with the same input records and parameters are '
+                 'reused instead of being recomputed',
+    'cache_max_size': 'Maximum size of the cache in megabytes. The least '
+                      'recently used results are removed first',
+    'work_dir': 'Persistent directory where Sirius writes its results while '
+                'running. If a previous run with the same inputs and '
+                'parameters was interrupted, the features it completed are '
+                'not recomputed',
+    'cpu_affinity': 'CPUs that Sirius is allowed to run on, for example '
+                    '"0-3,8". When the input is sharded the CPUs are divided '
+                    'among the shards',
+    'niceness': 'Niceness added to the Sirius processes, higher values '
+                'give them a lower scheduling priority',
+    'resources': 'How the Java heap size, compound buffers and number of '
+                 'processors are chosen. With "manual" they come from n_jobs '
+                 'and java_flags. With "auto" they are sized from the input '
+                 'and the memory and CPUs available (including container '
+                 'limits), overriding n_jobs. A heap size set in java_flags '
+                 'is always kept',
+    'min_peaks': 'remove features with fewer peaks than this across all '
+                 'their MS2 records',
+    'drop_duplicates': 'remove features with the same precursor mz (within '
+                       '0.01 Da) and retention time (within 10 seconds) as '
+                       'an earlier feature',
+    'progress_file': 'File where the progress of Sirius is appended as JSON '
+                     'lines while it runs (features completed, features per '
+                     'minute and expected seconds left), so that it can be '
+                     'polled by other programs. The progress is also printed '
+                     'when running with --verbose',
+    'stall_timeout': 'Minutes without new output after which a Sirius '
+                     'process is considered hung and killed. Unfinished '
+                     'features are requeued in smaller batches and features '
+                     'that hang Sirius on their own are skipped. 0 disables '
+                     'the check',
+    'max_runtime': 'Minutes a Sirius process may run for before it is '
+                   'killed and its unfinished features are requeued as '
+                   'with stall_timeout (Zodiac fails instead, as it reranks '
+                   'all features jointly). 0 disables the limit',
+    'compact': 'Remove the Sirius output that later steps do not need. '
+               'Fragmentation trees drop their Graphviz renderings, '
+               'fingerprints keep only what make-hierarchy reads',
+    'deduplicate': 'Compute a single representative of each group of '
+                   'features with near-identical precursor m/z, retention '
+                   'time and MS2 peaks (e.g. QC pools and standards injected '
+                   'in every batch), and copy its results to the other '
+                   'features of the group',
+    'dedup_mz_tolerance': 'Maximum difference in Da between the precursor '
+                          'mz and the MS2 peaks of duplicated features',
+    'dedup_rt_tolerance': 'Maximum difference in seconds between the '
+                          'retention times of duplicated features',
+    'array_size': 'Number of feature-disjoint shards, each computed by its '
+                  'own job. Features are balanced across shards by their '
+                  'expected cost',
+    'zodiac_max_features': 'Maximum number of features Zodiac reranks '
+                           'jointly. Larger inputs are split into groups '
+                           'that are reranked separately, which bounds the '
+                           'memory used by Zodiac. 0 reranks all the '
+                           'features jointly',
+    'zodiac_partition': 'How features are grouped for Zodiac: "similarity" '
+                        'groups features connected by similar MS2 spectra, '
+                        'and "retention-time" groups features in retention '
+                        'time windows',
+    'zodiac_parallel_groups': 'Number of Zodiac groups reranked at the same '
+                              'time. The cores in n_jobs are divided evenly '
+                              'among them'
 }
 
 # method registration
+keys = ['maxmz', 'min_peaks', 'drop_duplicates']
+plugin.methods.register_function(
+    function=filter_features,
+    name='Filter mass-spec features before running Sirius',
+    description='Remove features that Sirius would reject or compute more '
+                'than once: precursors above maxmz, features without MS2 '
+                'records or with too few MS2 peaks, and duplicated '
+                'precursors. The number of features removed for each reason '
+                'is reported when running with --verbose',
+    inputs={'features': MassSpectrometryFeatures},
+    parameters={k: v for k, v in PARAMS.items() if k in keys},
+    input_descriptions={'features': 'List of MS1 ions and corresponding '
+                                    'MS2 ions for each MS1.'},
+    parameter_descriptions={k: v
+                            for k, v in PARAMS_DESC.items() if k in keys},
+    outputs=[('filtered_features', MassSpectrometryFeatures)],
+    output_descriptions={'filtered_features': 'MS1 and MS2 ions of the '
+                                              'features that passed the '
+                                              'filters'}
+)
+
+plugin.methods.register_function(
+    function=subset_features,
+    name='Extract a subset of mass-spec features',
+    description='Extract the features whose IDs are listed in a metadata '
+                'file into a new artifact. Imported MGF files are indexed, '
+                'so only the records of the features extracted are read',
+    inputs={'features': MassSpectrometryFeatures},
+    parameters={'metadata': Metadata},
+    input_descriptions={'features': 'List of MS1 ions and corresponding '
+                                    'MS2 ions for each MS1.'},
+    parameter_descriptions={'metadata': 'Metadata whose IDs are the feature '
+                                        'IDs to extract'},
+    outputs=[('subset_features', MassSpectrometryFeatures)],
+    output_descriptions={'subset_features': 'MS1 and MS2 ions of the '
+                                            'features extracted'}
+)
+
+keys = ['profile', 'n_jobs', 'database', 'fingerid_db', 'tree_timeout',
+        'maxmz', 'num_candidates']
+plugin.visualizers.register_function(
+    function=estimate_runtime,
+    name='Estimate the runtime of Sirius',
+    description='Count the features compute-fragmentation-trees and '
+                'predict-fingerprints would process, without running '
+                'Sirius, and give uncalibrated estimates of their wall '
+                'time, CPU time and peak memory from the precursor mz and '
+                'number of MS2 peaks of each feature. The constants of the '
+                'cost model are not derived from measured runs.',
+    inputs={'features': MassSpectrometryFeatures},
+    parameters={k: v for k, v in PARAMS.items() if k in keys},
+    input_descriptions={'features': 'List of MS1 ions and corresponding '
+                                    'MS2 ions for each MS1.'},
+    parameter_descriptions={k: v
+                            for k, v in PARAMS_DESC.items() if k in keys}
+)
+
 keys = ['sirius_path', 'features', 'ppm_max', 'tree_timeout', 'maxmz',
         'n_jobs', 'num_candidates', 'database', 'profile', 'java_flags',
-        'ionization_mode']
+        'ionization_mode', 'n_shards', 'cache_dir', 'cache_max_size',
+        'work_dir', 'cpu_affinity', 'niceness', 'resources', 'progress_file',
+        'stall_timeout', 'max_runtime', 'compact']
 plugin.methods.register_function(
     function=compute_fragmentation_trees,
     name='Compute fragmentation trees for candidate molecular formulas',
     description='Use Sirius to compute fragmentation trees',
-    inputs={'features': MassSpectrometryFeatures},
+    inputs={'features': List[MassSpectrometryFeatures]},
     parameters={k: v for k, v in PARAMS.items() if k in keys},
     input_descriptions={'features': 'List of MS1 ions and corresponding '
-                                    'MS2 ions for each MS1.'},
+                                    'MS2 ions for each MS1. Several '
+                                    'lists are computed in one run, '
+                                    'with the feature IDs of the '
+                                    'n-th list prefixed by "n-".'},
     parameter_descriptions={k: v
                             for k, v in PARAMS_DESC.items() if k in keys},
     outputs=[('fragmentation_trees', SiriusFolder)],
@@ -118,16 +284,22 @@ plugin.methods.register_function(
     citations=[citations['duhrkop2015sirius']]
 )
 
-keys = ['sirius_path', 'zodiac_threshold', 'n_jobs', 'java_flags']
+keys = ['sirius_path', 'zodiac_threshold', 'n_jobs', 'java_flags',
+        'cache_dir', 'cache_max_size', 'cpu_affinity', 'niceness',
+        'resources', 'max_runtime', 'zodiac_max_features',
+        'zodiac_partition', 'zodiac_parallel_groups']
 plugin.methods.register_function(
     function=rerank_molecular_formulas,
     name='Reranks candidate molecular formulas',
     description='Use Zodiac to rerank candidate molecular formulas',
-    inputs={'features': MassSpectrometryFeatures,
+    inputs={'features': List[MassSpectrometryFeatures],
             'fragmentation_trees': SiriusFolder},
     parameters={k: v for k, v in PARAMS.items() if k in keys},
     input_descriptions={'features': 'List of MS1 ions and corresponding '
-                                    'MS2 ions for each MS1.'},
+                                    'MS2 ions for each MS1. Several '
+                                    'lists are computed in one run, '
+                                    'with the feature IDs of the '
+                                    'n-th list prefixed by "n-".'},
     parameter_descriptions={k: v
                             for k, v in PARAMS_DESC.items() if k in keys},
     outputs=[('molecular_formulas', ZodiacFolder)],
@@ -137,7 +309,10 @@ plugin.methods.register_function(
     citations=[citations['duhrkop2015sirius']]
 )
 
-keys = ['sirius_path', 'ppm_max', 'n_jobs', 'fingerid_db', 'java_flags']
+keys = ['sirius_path', 'ppm_max', 'n_jobs', 'fingerid_db', 'java_flags',
+        'cache_dir', 'cache_max_size', 'work_dir', 'cpu_affinity', 'niceness',
+        'resources', 'progress_file', 'stall_timeout', 'max_runtime',
+        'compact']
 plugin.methods.register_function(
     function=predict_fingerprints,
     name='Predict fingerprints for molecular formulas',
@@ -155,6 +330,100 @@ plugin.methods.register_function(
     citations=[citations['duhrkop2015sirius']]
 )
 
+keys = ['sirius_path', 'ppm_max', 'tree_timeout', 'maxmz', 'n_jobs',
+        'num_candidates', 'database', 'profile', 'java_flags',
+        'ionization_mode', 'zodiac_threshold', 'fingerid_db', 'n_shards',
+        'cache_dir', 'cache_max_size', 'work_dir', 'cpu_affinity',
+        'niceness', 'resources', 'progress_file', 'stall_timeout',
+        'max_runtime', 'compact', 'deduplicate', 'dedup_mz_tolerance',
+        'dedup_rt_tolerance', 'zodiac_max_features',
+        'zodiac_partition', 'zodiac_parallel_groups']
+plugin.methods.register_function(
+    function=compute_fingerprints,
+    name='Predict fingerprints from mass-spec features',
+    description='Use Sirius to compute fragmentation trees, Zodiac to '
+                'rerank candidate molecular formulas and CSI:FingerID to '
+                'predict molecular fingerprints in a single step, without '
+                'storing the intermediate results as artifacts',
+    inputs={'features': List[MassSpectrometryFeatures]},
+    parameters={k: v for k, v in PARAMS.items() if k in keys},
+    input_descriptions={'features': 'List of MS1 ions and corresponding '
+                                    'MS2 ions for each MS1. Several '
+                                    'lists are computed in one run, '
+                                    'with the feature IDs of the '
+                                    'n-th list prefixed by "n-".'},
+    parameter_descriptions={k: v
+                            for k, v in PARAMS_DESC.items() if k in keys},
+    outputs=[('predicted_fingerprints', CSIFolder)],
+    output_descriptions={'predicted_fingerprints': 'Predicted substructures '
+                                                   'per feature using '
+                                                   'CSI:FingerID'},
+    citations=[citations['duhrkop2015sirius']]
+)
+
+plugin.methods.register_function(
+    function=compact_fingerprints,
+    name='Remove CSI:FingerID output not needed to build a tree',
+    description='Keep only the predicted fingerprints of each feature and '
+                'the summaries read by make-hierarchy, removing the '
+                'candidate structures, spectra and fragmentation trees',
+    inputs={'predicted_fingerprints': CSIFolder},
+    parameters={},
+    input_descriptions={'predicted_fingerprints': 'Predicted substructures '
+                                                  'per feature using '
+                                                  'CSI:FingerID'},
+    parameter_descriptions={},
+    outputs=[('compacted_fingerprints', CSIFolder)],
+    output_descriptions={'compacted_fingerprints': 'Predicted substructures '
+                                                   'per feature, without '
+                                                   'the intermediate '
+                                                   'CSI:FingerID output'}
+)
+
+keys = ['sirius_path', 'ppm_max', 'profile', 'array_size', 'tree_timeout',
+        'maxmz', 'n_jobs', 'num_candidates', 'database', 'ionization_mode',
+        'zodiac_threshold', 'fingerid_db', 'java_flags', 'resources',
+        'compact']
+plugin.methods.register_function(
+    function=export_job_array,
+    name='Split mass-spec features into a job array',
+    description='Split the features into shards balanced by their expected '
+                'cost and write a shell script per shard that runs '
+                'compute-fingerprints on it, so that the shards can be '
+                'computed on several nodes by any batch scheduler. Export '
+                'the artifact with `qiime tools export` to get the shards, '
+                'the scripts and a manifest listing them. Zodiac reranks the '
+                'molecular formulas of each shard separately',
+    inputs={'features': MassSpectrometryFeatures},
+    parameters={k: v for k, v in PARAMS.items() if k in keys},
+    input_descriptions={'features': 'List of MS1 ions and corresponding '
+                                    'MS2 ions for each MS1.'},
+    parameter_descriptions={k: v
+                            for k, v in PARAMS_DESC.items() if k in keys},
+    outputs=[('job_array', JobArray)],
+    output_descriptions={'job_array': 'MGF file and job script of each '
+                                      'shard, and a manifest listing them'}
+)
+
+plugin.methods.register_function(
+    function=merge_fingerprints,
+    name='Merge the predicted fingerprints of feature-disjoint shards',
+    description='Merge CSI:FingerID results computed separately, e.g. by '
+                'the jobs of export-job-array, into a single result. The '
+                'results must not have feature IDs in common',
+    inputs={'predicted_fingerprints': List[CSIFolder]},
+    parameters={},
+    input_descriptions={'predicted_fingerprints': 'Predicted substructures '
+                                                  'of the features in each '
+                                                  'shard'},
+    parameter_descriptions={},
+    outputs=[('merged_fingerprints', CSIFolder)],
+    output_descriptions={'merged_fingerprints': 'Predicted substructures '
+                                                'of the features in all the '
+                                                'shards'},
+    citations=[citations['duhrkop2015sirius']]
+)
+
 plugin.methods.register_function(
     function=make_hierarchy,
     name='Create a molecular tree',
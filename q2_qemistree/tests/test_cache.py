@@ -0,0 +1,130 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import os
+import tempfile
+
+from q2_qemistree._cache import ResultCache, feature_id, hash_path
+
+
+class CacheTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.workspace = os.path.join(self.tmp.name, 'workspace')
+        for name in ['1_features_10', '2_features_20']:
+            os.makedirs(os.path.join(self.workspace, name, 'trees'))
+            with open(os.path.join(self.workspace, name, 'spectrum.ms'),
+                      'w') as f:
+                f.write('>compound %s\n' % name)
+        with open(os.path.join(self.workspace, 'version.txt'), 'w') as f:
+            f.write('Sirius 4.0 (build 22)\n')
+        with open(os.path.join(self.workspace, 'summary.csv'), 'w') as f:
+            f.write('source\texperimentName\tscore\n'
+                    'features\t10\t0.1\n'
+                    'features\t20\t0.2\n')
+        self.cache = ResultCache(os.path.join(self.tmp.name, 'cache'), 1)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_feature_id(self):
+        self.assertEqual(feature_id('1_features_10'), '10')
+        self.assertEqual(feature_id('12_features_4.ms'), '4')
+        self.assertEqual(feature_id('3_features_a_b'), 'a_b')
+
+    def test_hash_path(self):
+        folder = os.path.join(self.workspace, '1_features_10')
+        obs = hash_path(folder)
+        self.assertEqual(obs, hash_path(folder))
+        self.assertNotEqual(obs, hash_path(os.path.join(self.workspace,
+                                                        '2_features_20')))
+
+    def test_key(self):
+        key = ResultCache.key('trees', ['--ppm-max', 15], b'BEGIN IONS')
+        self.assertEqual(key, ResultCache.key('trees', ['--ppm-max', '15'],
+                                              b'BEGIN IONS'))
+        self.assertNotEqual(key, ResultCache.key('trees', ['--ppm-max', 10],
+                                                 b'BEGIN IONS'))
+        self.assertNotEqual(key, ResultCache.key('zodiac', ['--ppm-max', 15],
+                                                 b'BEGIN IONS'))
+
+    def test_get_miss(self):
+        self.assertIsNone(self.cache.get('a' * 64))
+
+    def test_put_feature(self):
+        key = 'a' * 64
+        self.cache.put(key, self.workspace, ['20'])
+
+        obs = self.cache.get(key)
+        self.assertEqual(sorted(os.listdir(obs)),
+                         ['2_features_20', 'summary.csv', 'version.txt'])
+        with open(os.path.join(obs, 'summary.csv')) as f:
+            self.assertEqual(f.read(), 'source\texperimentName\tscore\n'
+                                       'features\t20\t0.2\n')
+
+    def test_put_missing_feature(self):
+        key = 'b' * 64
+        self.cache.put(key, self.workspace, ['30'])
+
+        obs = self.cache.get(key)
+        self.assertEqual(sorted(os.listdir(obs)),
+                         ['summary.csv', 'version.txt'])
+
+    def test_put_workspace(self):
+        key = 'c' * 64
+        self.cache.put(key, self.workspace)
+
+        obs = self.cache.get(key)
+        self.assertEqual(sorted(os.listdir(obs)),
+                         sorted(os.listdir(self.workspace)))
+
+    def test_put_features(self):
+        keys = {'10': 'a' * 64, '20': 'b' * 64, '30': 'c' * 64}
+        self.cache.put_features(keys, self.workspace)
+
+        for fid, key in keys.items():
+            obs = self.cache.get(key)
+            names = ['summary.csv', 'version.txt']
+            rows = ''
+            if fid != '30':
+                names.append('%s_features_%s' % (fid[0], fid))
+                rows = 'features\t%s\t0.%s\n' % (fid, fid[0])
+            self.assertEqual(sorted(os.listdir(obs)), sorted(names))
+            with open(os.path.join(obs, 'summary.csv')) as f:
+                self.assertEqual(f.read(), 'source\texperimentName\tscore\n'
+                                 + rows)
+
+        # stored entries are left as they are
+        self.cache.put_features(keys, self.tmp.name)
+        self.assertEqual(len(os.listdir(self.cache.get(keys['10']))), 3)
+
+    def _entry(self, key):
+        return os.path.dirname(self.cache.get(key))
+
+    def test_evict(self):
+        with open(os.path.join(self.workspace, 'large.bin'), 'wb') as f:
+            f.write(b'\0' * (400 * 1024))
+
+        first, second, third = 'a' * 64, 'b' * 64, 'c' * 64
+        self.cache.put(first, self.workspace)
+        os.utime(self._entry(first), (100, 100))
+        self.cache.put(second, self.workspace)
+        os.utime(self._entry(second), (200, 200))
+
+        # reading an entry makes it the most recently used one
+        self.cache.get(first)
+        self.cache.put(third, self.workspace)
+
+        self.assertIsNotNone(self.cache.get(first))
+        self.assertIsNone(self.cache.get(second))
+        self.assertIsNotNone(self.cache.get(third))
+
+
+if __name__ == '__main__':
+    main()
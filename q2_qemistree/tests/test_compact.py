@@ -0,0 +1,74 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import os
+import shutil
+import tempfile
+
+from q2_qemistree import CSIDirFmt, compact_fingerprints
+from q2_qemistree._compact import compact_trees, compact_csi
+
+
+class CompactTests(TestCase):
+    def setUp(self):
+        THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+        self.goodcsi = os.path.join(THIS_DIR, 'data/goodcsi')
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_compact_trees(self):
+        workspace = os.path.join(self.tmp.name, 'trees')
+        shutil.copytree(self.goodcsi, workspace)
+
+        self.assertEqual(compact_trees(workspace), 4)
+        trees = os.path.join(workspace, '2_sirius_2', 'trees')
+        self.assertEqual(os.listdir(trees), ['1_C3H6NO4P2_M+H+.json'])
+        self.assertTrue(os.path.exists(os.path.join(workspace, '2_sirius_2',
+                                                    'spectrum.ms')))
+
+    def test_compact_csi(self):
+        workspace = os.path.join(self.tmp.name, 'csi')
+        shutil.copytree(self.goodcsi, workspace)
+
+        self.assertTrue(compact_csi(workspace) > 0)
+        self.assertEqual(sorted(os.listdir(workspace)),
+                         ['2_sirius_2', '3_sirius_3', '7_sirius_7',
+                          'fingerprints.csv',
+                          'summary_csi_fingerid.csv', 'version.txt'])
+        for name in ['2_sirius_2', '3_sirius_3', '7_sirius_7']:
+            self.assertEqual(os.listdir(os.path.join(workspace, name)),
+                             ['fingerprints'])
+        fingerprint = os.path.join('2_sirius_2', 'fingerprints',
+                                   '1_C3H6NO4P2_M+H+.fpt')
+        with open(os.path.join(workspace, fingerprint)) as f:
+            compacted = f.read()
+        with open(os.path.join(self.goodcsi, fingerprint)) as f:
+            self.assertEqual(compacted, f.read())
+
+    def test_compact_fingerprints(self):
+        workspace = os.path.join(self.tmp.name, 'csi-output')
+        shutil.copytree(self.goodcsi, workspace)
+        before = sorted(os.listdir(os.path.join(workspace, '2_sirius_2')))
+
+        result = compact_fingerprints(CSIDirFmt(self.tmp.name, mode='r'))
+        output = result.get_path()
+        self.assertEqual(os.listdir(os.path.join(output, '2_sirius_2')),
+                         ['fingerprints'])
+        self.assertTrue(os.path.exists(os.path.join(output,
+                                                    'fingerprints.csv')))
+        # the input is left untouched
+        self.assertEqual(sorted(os.listdir(os.path.join(workspace,
+                                                        '2_sirius_2'))),
+                         before)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main, skipUnless
+import os
+import shutil
+import tempfile
+
+from q2_qemistree._compress import (compress_mgf, compression,
+                                    decompress_mgf, open_compressed)
+
+try:
+    import zstandard  # noqa: F401
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+
+class CompressTests(TestCase):
+    def setUp(self):
+        THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+        self.tmp = tempfile.TemporaryDirectory()
+        self.mgf = os.path.join(self.tmp.name, 'features.mgf')
+        shutil.copy(os.path.join(THIS_DIR, 'data/sirius.mgf'), self.mgf)
+        with open(self.mgf, 'rb') as f:
+            self.contents = f.read()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def round_trip(self, method):
+        compressed = os.path.join(self.tmp.name, 'features.mgf.' + method)
+        compress_mgf(self.mgf, compressed, method)
+        self.assertEqual(compression(compressed), method)
+        self.assertLess(os.path.getsize(compressed), len(self.contents))
+
+        with open_compressed(compressed) as f:
+            self.assertEqual(f.read(), self.contents)
+        output = os.path.join(self.tmp.name, 'decompressed.mgf')
+        decompress_mgf(compressed, output)
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), self.contents)
+        return compressed
+
+    def test_gzip(self):
+        compressed = self.round_trip('gzip')
+        with open(compressed, 'rb') as f:
+            first = f.read()
+        # no file name nor time in the header
+        compress_mgf(self.mgf, compressed)
+        with open(compressed, 'rb') as f:
+            self.assertEqual(f.read(), first)
+
+    @skipUnless(HAS_ZSTD, 'requires zstandard')
+    def test_zstd(self):
+        self.round_trip('zstd')
+
+    def test_not_compressed(self):
+        self.assertIsNone(compression(self.mgf))
+        with self.assertRaisesRegex(ValueError, 'is not compressed with '
+                                    'gzip or zstd'):
+            open_compressed(self.mgf)
+
+    def test_unknown_compression(self):
+        with self.assertRaisesRegex(ValueError, "should be one of gzip, "
+                                    "zstd, not 'bzip2'"):
+            compress_mgf(self.mgf, self.mgf + '.bz2', 'bzip2')
+
+
+if __name__ == '__main__':
+    main()
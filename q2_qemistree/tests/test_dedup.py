@@ -0,0 +1,116 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import os
+import shutil
+import tempfile
+
+from q2_qemistree import MGFDirFmt, compute_fingerprints
+from q2_qemistree._dedup import group_features, deduplicate_mgf, fan_out
+from q2_qemistree._mgf import index_mgf
+
+
+def record(feature_id, level, pepmass, rt, peaks):
+    lines = ['BEGIN IONS', 'FEATURE_ID=%s' % feature_id,
+             'PEPMASS=%s' % pepmass, 'CHARGE=1+', 'RTINSECONDS=%s' % rt,
+             'MSLEVEL=%d' % level]
+    lines += ['%s %s' % peak for peak in peaks]
+    return '\n'.join(lines + ['END IONS', ''])
+
+
+def feature(feature_id, pepmass, rt, peaks):
+    return (record(feature_id, 1, pepmass, rt, [(pepmass, 1e6)]) +
+            record(feature_id, 2, pepmass, rt, peaks))
+
+
+PEAKS = [(55.0548, 1e4), (69.0451, 1.2e5), (83.0603, 1e5)]
+
+
+class DeduplicationTests(TestCase):
+    def setUp(self):
+        THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+        self.sirius = os.path.join(THIS_DIR, 'data/fake-sirius/bin')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.mgf = os.path.join(self.tmp.name, 'features.mgf')
+        with open(self.mgf, 'w') as f:
+            f.write(feature('1', 110.0203, 464.8, PEAKS))
+            # a re-injection with a small shift and an extra noise peak
+            f.write(feature('2', 110.0204, 465.1,
+                            PEAKS + [(90.1, 100.0)]))
+            # same precursor, different fragments
+            f.write(feature('3', 110.0203, 464.8,
+                            [(60.0, 1e4), (71.1, 1e5)]))
+            # same spectrum, different retention time
+            f.write(feature('4', 110.0203, 600.0, PEAKS))
+            f.write(feature('5', 110.0202, 464.9, PEAKS))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_group_features(self):
+        groups = group_features(self.mgf)
+        self.assertEqual(list(groups.items()),
+                         [('1', ['2', '5']), ('3', []), ('4', [])])
+
+    def test_group_features_tolerance(self):
+        groups = group_features(self.mgf, rt_tolerance=1000)
+        self.assertEqual(list(groups.items()),
+                         [('1', ['2', '4', '5']), ('3', [])])
+
+    def test_deduplicate_mgf(self):
+        output = os.path.join(self.tmp.name, 'deduplicated.mgf')
+        groups = deduplicate_mgf(self.mgf, output)
+        self.assertEqual([f.feature_id for f in index_mgf(output)],
+                         list(groups))
+
+    def test_fan_out(self):
+        THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+        workspace = os.path.join(self.tmp.name, 'csi')
+        shutil.copytree(os.path.join(THIS_DIR, 'data/goodcsi'), workspace)
+
+        fan_out(workspace, {'2': ['20', '21'], '5': ['50']})
+        self.assertEqual(sorted(os.listdir(os.path.join(workspace,
+                                                        '8_sirius_20'))),
+                         sorted(os.listdir(os.path.join(workspace,
+                                                        '2_sirius_2'))))
+        self.assertTrue(os.path.isdir(os.path.join(workspace,
+                                                   '9_sirius_21')))
+        self.assertEqual(len(os.listdir(workspace)), 9)
+
+        with open(os.path.join(workspace, 'summary_csi_fingerid.csv')) as f:
+            rows = [line.split('\t') for line in f]
+        names = [row[1] for row in rows]
+        self.assertEqual(names.count('20'), 1)
+        self.assertEqual(names.count('50'), 0)
+        row = rows[names.index('20')]
+        row[1] = '2'
+        self.assertEqual(row, rows[names.index('2')])
+
+    def test_compute_fingerprints(self):
+        result = compute_fingerprints(self.sirius, MGFDirFmt(self.tmp.name,
+                                                             mode='r'),
+                                      ppm_max=15, profile='orbitrap',
+                                      deduplicate=True)
+        folders = sorted(name.split('_')[-1]
+                         for name in os.listdir(result.get_path())
+                         if os.path.isdir(os.path.join(result.get_path(),
+                                                       name)))
+        self.assertEqual(folders, ['1', '2', '3', '4', '5'])
+
+        with open(os.path.join(str(result.path), 'duplicates.tsv')) as f:
+            self.assertEqual(f.read(), '#featureID\trepresentative\n'
+                                       '2\t1\n5\t1\n')
+        with open(os.path.join(str(result.path), 'stdout.txt')) as f:
+            stdout = f.read()
+        self.assertIn('Copied the results of 2 duplicated features', stdout)
+        self.assertNotIn('finished feature 2 ', stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import os
+import tempfile
+import qiime2
+
+from q2_qemistree import MGFDirFmt, estimate_runtime
+
+
+class EstimateTests(TestCase):
+    def setUp(self):
+        THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+        ions = qiime2.Artifact.load(os.path.join(THIS_DIR,
+                                                 'data/sirius.mgf.qza'))
+        self.features = ions.view(MGFDirFmt)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_estimate_runtime(self):
+        estimate_runtime(self.tmp.name, self.features, 'orbitrap', n_jobs=2)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name,
+                                                    'index.html')))
+
+        with open(os.path.join(self.tmp.name, 'estimate.tsv')) as f:
+            lines = [line.rstrip('\n').split('\t') for line in f]
+        self.assertEqual(lines[0], ['step', 'estimated_wall_seconds',
+                                    'estimated_cpu_seconds',
+                                    'estimated_heap_bytes'])
+        self.assertEqual([line[0] for line in lines[1:]],
+                         ['compute-fragmentation-trees',
+                          'predict-fingerprints'])
+
+        with open(os.path.join(self.tmp.name, 'features.tsv')) as f:
+            counts = [line.rstrip('\n').split('\t') for line in f]
+        self.assertEqual(counts[0], ['features', 'count'])
+        self.assertEqual(counts[1][0], 'features in the MGF file')
+        self.assertEqual(counts[-1][0], 'processed by Sirius')
+        self.assertEqual(int(counts[1][1]),
+                         sum(int(count) for _, count in counts[2:]))
+
+
+if __name__ == '__main__':
+    main()
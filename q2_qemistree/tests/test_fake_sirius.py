@@ -0,0 +1,186 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from q2_qemistree import (MGFDirFmt, compute_fragmentation_trees,
+                          rerank_molecular_formulas, predict_fingerprints)
+from q2_qemistree._cache import feature_id
+from q2_qemistree._process_fingerprint import (collate_fingerprint,
+                                               is_batched_result)
+
+
+class FakeSiriusTests(TestCase):
+    def setUp(self):
+        THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+        self.sirius = os.path.join(THIS_DIR, 'data/fake-sirius/bin')
+        self.tmp = tempfile.TemporaryDirectory()
+        shutil.copy(os.path.join(THIS_DIR, 'data/sirius.mgf'),
+                    os.path.join(self.tmp.name, 'features.mgf'))
+        self.features = MGFDirFmt(self.tmp.name, mode='r')
+        self.ids = ['1', '2', '3', '4', '6', '7', '8']
+        self.environ = dict(os.environ)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        self.tmp.cleanup()
+
+    def trees(self, **kwargs):
+        return compute_fragmentation_trees(self.sirius, self.features,
+                                           ppm_max=15, profile='orbitrap',
+                                           **kwargs)
+
+    def test_pipeline(self):
+        trees = self.trees(n_jobs=2, n_shards=2)
+        folders = [name for name in os.listdir(trees.get_path())
+                   if name != 'version.txt']
+        self.assertEqual(sorted(map(feature_id, folders), key=int), self.ids)
+        self.assertEqual(sorted(os.listdir(trees.path)),
+                         ['sirius-output', 'stderr.txt', 'stdout.txt',
+                          'usage.tsv', 'usage_summary.tsv'])
+
+        formulas = rerank_molecular_formulas(self.sirius, trees,
+                                             self.features)
+        spectra = [name for name in os.listdir(formulas.get_path())
+                   if name.endswith('.ms')]
+        self.assertEqual(sorted(map(feature_id, spectra), key=int), self.ids)
+
+        fingerprints = predict_fingerprints(self.sirius, formulas, ppm_max=15)
+        collated = collate_fingerprint(fingerprints)
+        self.assertEqual(sorted(collated.index, key=int), self.ids)
+        self.assertEqual(collated.shape[1], 2937)
+
+    def test_batch(self):
+        features = [self.features, self.features]
+        trees = compute_fragmentation_trees(self.sirius, features,
+                                            ppm_max=15, profile='orbitrap')
+        folders = [name for name in os.listdir(trees.get_path())
+                   if name != 'version.txt']
+        expected = sorted(['1-' + i for i in self.ids] +
+                          ['2-' + i for i in self.ids])
+        self.assertEqual(sorted(map(feature_id, folders)), expected)
+
+        formulas = rerank_molecular_formulas(self.sirius, trees, features)
+        spectra = [name for name in os.listdir(formulas.get_path())
+                   if name.endswith('.ms')]
+        self.assertEqual(sorted(map(feature_id, spectra)), expected)
+
+        fingerprints = predict_fingerprints(self.sirius, formulas, ppm_max=15)
+        self.assertTrue(is_batched_result(fingerprints))
+        for prefix in ['1-', '2-']:
+            collated = collate_fingerprint(fingerprints, prefix=prefix)
+            self.assertEqual(sorted(collated.index, key=int), self.ids)
+
+    def test_zodiac_groups(self):
+        trees = self.trees()
+        for partition in ['similarity', 'retention-time']:
+            formulas = rerank_molecular_formulas(
+                self.sirius, trees, self.features, n_jobs=2,
+                zodiac_max_features=3, zodiac_partition=partition,
+                zodiac_parallel_groups=2)
+            spectra = [name for name in os.listdir(formulas.get_path())
+                       if name.endswith('.ms')]
+            self.assertEqual(sorted(map(feature_id, spectra), key=int),
+                             self.ids)
+
+            with open(os.path.join(formulas.get_path(),
+                                   'zodiac_summary.csv')) as f:
+                rows = [line.split('\t') for line in f]
+            self.assertEqual(rows[0][0], 'id')
+            self.assertEqual(sorted((row[0] for row in rows[1:]), key=int),
+                             self.ids)
+            with open(os.path.join(str(formulas.path), 'stdout.txt')) as f:
+                log = f.read()
+            self.assertIn('# group 2\n', log)
+            self.assertNotIn('# group 3\n', log)
+
+        # the fragmentation trees are left untouched
+        folders = [name for name in os.listdir(trees.get_path())
+                   if name != 'version.txt']
+        self.assertEqual(len(folders), 7)
+
+    def test_deterministic(self):
+        first = self.trees()
+        second = self.trees()
+        name = sorted(os.listdir(first.get_path()))[0]
+        with open(os.path.join(first.get_path(), name,
+                               'summary_sirius.csv')) as f:
+            expected = f.read()
+        with open(os.path.join(second.get_path(), name,
+                               'summary_sirius.csv')) as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_maxmz(self):
+        result = self.trees(maxmz=120)
+        folders = [name for name in os.listdir(result.get_path())
+                   if name != 'version.txt']
+        self.assertEqual(sorted(map(feature_id, folders), key=int),
+                         ['1', '6', '8'])
+
+    def test_failure(self):
+        os.environ['FAKE_SIRIUS_FAIL'] = '4'
+        work_dir = os.path.join(self.tmp.name, 'work')
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.trees(work_dir=work_dir)
+
+        # the features finished before the failure are kept
+        del os.environ['FAKE_SIRIUS_FAIL']
+        result = self.trees(work_dir=work_dir)
+        folders = [name for name in os.listdir(result.get_path())
+                   if name != 'version.txt']
+        self.assertEqual(sorted(map(feature_id, folders), key=int), self.ids)
+        with open(os.path.join(str(result.path), 'stdout.txt')) as f:
+            self.assertIn('trees: finished feature 3', f.read())
+
+    def test_resume_killed(self):
+        # a run killed while SIRIUS is computing the shard, as it would be
+        # by the OOM killer or a preempted job
+        work_dir = os.path.join(self.tmp.name, 'work')
+        log = os.path.join(work_dir, 'attempt-0', 'shard-0', 'stdout.txt')
+        os.environ['FAKE_SIRIUS_DELAY'] = '1'
+        script = ('from q2_qemistree import MGFDirFmt, '
+                  'compute_fragmentation_trees\n'
+                  'compute_fragmentation_trees(%r, MGFDirFmt(%r, mode="r"), '
+                  'ppm_max=15, profile="orbitrap", work_dir=%r)' %
+                  (self.sirius, self.tmp.name, work_dir))
+        process = subprocess.Popen([sys.executable, '-c', script],
+                                   start_new_session=True)
+        try:
+            finished = []
+            while len(finished) < 2 and process.poll() is None:
+                time.sleep(0.05)
+                if os.path.exists(log):
+                    with open(log) as f:
+                        finished = [line.split()[3] for line in f
+                                    if 'finished feature' in line]
+        finally:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+        self.assertEqual(len(finished), 2)
+
+        # the features finished before the kill fail if they are run again
+        del os.environ['FAKE_SIRIUS_DELAY']
+        os.environ['FAKE_SIRIUS_FAIL'] = ','.join(finished)
+        result = self.trees(work_dir=work_dir)
+        folders = [name for name in os.listdir(result.get_path())
+                   if name != 'version.txt']
+        self.assertEqual(sorted(map(feature_id, folders), key=int), self.ids)
+        self.assertFalse(os.path.exists(os.path.join(work_dir,
+                                                     'attempt-0')))
+
+
+if __name__ == '__main__':
+    main()
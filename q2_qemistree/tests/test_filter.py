@@ -0,0 +1,161 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import io
+import os
+import tempfile
+from contextlib import redirect_stdout
+
+import pandas as pd
+import qiime2
+
+from q2_qemistree import MGFDirFmt, filter_features, subset_features
+from q2_qemistree._compress import compress_mgf
+from q2_qemistree._filter import select_features
+from q2_qemistree._mgf import index_mgf, read_index, write_index
+
+
+def record(feature_id, level, pepmass, rt, peaks):
+    lines = ['BEGIN IONS', 'FEATURE_ID=%s' % feature_id,
+             'PEPMASS=%s' % pepmass, 'RTINSECONDS=%s' % rt,
+             'MSLEVEL=%d' % level]
+    lines += ['%d.0 100.0' % (50 + i) for i in range(peaks)]
+    return '\n'.join(lines + ['END IONS', ''])
+
+
+class FilterTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.mgf = os.path.join(self.tmp.name, 'features.mgf')
+        with open(self.mgf, 'w') as f:
+            f.write(record('1', 1, 200.5, 60.0, 2))
+            f.write(record('1', 2, 200.5, 60.1, 3))
+            # precursor above maxmz
+            f.write(record('2', 1, 700.1, 61.0, 2))
+            f.write(record('2', 2, 700.1, 61.1, 3))
+            # no MS2
+            f.write(record('3', 1, 300.2, 62.0, 2))
+            # a single MS2 peak
+            f.write(record('4', 1, 310.2, 63.0, 2))
+            f.write(record('4', 2, 310.2, 63.1, 1))
+            # same precursor as feature 1
+            f.write(record('5', 1, 200.5, 60.0, 2))
+            f.write(record('5', 2, 200.5, 60.1, 3))
+            f.write(record('6', 1, 200.5, 90.0, 2))
+            f.write(record('6', 2, 200.5, 90.1, 3))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_select_features(self):
+        kept, dropped = select_features(index_mgf(self.mgf), maxmz=600,
+                                        min_peaks=2)
+        self.assertEqual([f.feature_id for f in kept], ['1', '6'])
+        self.assertEqual(list(dropped.items()),
+                         [('precursor m/z above 600', ['2']),
+                          ('no MS2 records', ['3']),
+                          ('fewer than 2 MS2 peaks', ['4']),
+                          ('duplicated precursor', ['5'])])
+
+    def test_select_features_tolerances(self):
+        with open(self.mgf, 'a') as f:
+            # within 0.01 Da and 10 seconds of feature 1
+            f.write(record('7', 1, 200.505, 65.0, 2))
+            f.write(record('7', 2, 200.505, 65.1, 3))
+            # m/z too far from feature 1
+            f.write(record('8', 1, 200.52, 60.0, 2))
+            f.write(record('8', 2, 200.52, 60.1, 3))
+            # retention time too far from feature 6
+            f.write(record('9', 1, 200.5, 75.0, 2))
+            f.write(record('9', 2, 200.5, 75.1, 3))
+        kept, dropped = select_features(index_mgf(self.mgf), maxmz=600,
+                                        min_peaks=2)
+        self.assertEqual([f.feature_id for f in kept], ['1', '6', '8', '9'])
+        self.assertEqual(dropped['duplicated precursor'], ['5', '7'])
+
+        kept, dropped = select_features(index_mgf(self.mgf), maxmz=600,
+                                        min_peaks=2, mz_tolerance=0.1,
+                                        rt_tolerance=1)
+        self.assertEqual([f.feature_id for f in kept], ['1', '6', '7', '9'])
+        self.assertEqual(dropped['duplicated precursor'], ['5', '8'])
+
+    def test_select_features_keep_duplicates(self):
+        kept, dropped = select_features(index_mgf(self.mgf), maxmz=800,
+                                        drop_duplicates=False)
+        self.assertEqual([f.feature_id for f in kept],
+                         ['1', '2', '4', '5', '6'])
+        self.assertEqual(dropped['no MS2 records'], ['3'])
+
+    def test_filter_features(self):
+        result = filter_features(MGFDirFmt(self.tmp.name, mode='r'),
+                                 maxmz=600, min_peaks=2)
+        output = os.path.join(str(result.path), 'features.mgf')
+        self.assertEqual([f.feature_id for f in index_mgf(output)],
+                         ['1', '6'])
+
+        with open(output) as f:
+            contents = f.read()
+        self.assertEqual(contents.count('BEGIN IONS'), 4)
+        self.assertIn(record('6', 2, 200.5, 90.1, 3), contents)
+        self.assertEqual(read_index(output), index_mgf(output))
+
+    def test_filter_features_report(self):
+        with open(self.mgf, 'a') as f:
+            for i in range(10, 22):
+                f.write(record(str(i), 1, 200.5, 60.0, 2))
+                f.write(record(str(i), 2, 200.5, 60.1, 3))
+        output = io.StringIO()
+        with redirect_stdout(output):
+            filter_features(MGFDirFmt(self.tmp.name, mode='r'), maxmz=600,
+                            min_peaks=2)
+        # only the first identifiers dropped for each reason are listed
+        self.assertIn('Dropped 13 features with duplicated precursor: 5, '
+                      '10, 11, 12, 13, 14, 15, 16, 17, 18, ...',
+                      output.getvalue())
+        self.assertIn('Dropped 1 features with no MS2 records: 3\n',
+                      output.getvalue())
+
+    def test_filter_features_compressed(self):
+        compress_mgf(self.mgf, self.mgf + '.gz')
+        os.remove(self.mgf)
+        result = filter_features(MGFDirFmt(self.tmp.name, mode='r'),
+                                 maxmz=600, min_peaks=2)
+        output = os.path.join(str(result.path), 'features.mgf')
+        self.assertEqual([f.feature_id for f in index_mgf(output)],
+                         ['1', '6'])
+        # the input is left compressed
+        self.assertEqual(os.listdir(self.tmp.name), ['features.mgf.gz'])
+
+    def test_filter_features_nothing_left(self):
+        with self.assertRaisesRegex(ValueError, 'None of the features'):
+            filter_features(MGFDirFmt(self.tmp.name, mode='r'), maxmz=100)
+
+    def test_subset_features(self):
+        write_index(index_mgf(self.mgf), self.mgf)
+        metadata = qiime2.Metadata(pd.DataFrame(
+            {'group': ['a', 'b']}, index=pd.Index(['6', '2'], name='id')))
+
+        result = subset_features(MGFDirFmt(self.tmp.name, mode='r'),
+                                 metadata)
+        output = os.path.join(str(result.path), 'features.mgf')
+        self.assertEqual([f.feature_id for f in read_index(output)],
+                         ['2', '6'])
+        with open(output) as f:
+            self.assertEqual(f.read().count('BEGIN IONS'), 4)
+
+    def test_subset_features_missing(self):
+        metadata = qiime2.Metadata(pd.DataFrame(
+            {'group': ['a']}, index=pd.Index(['7'], name='id')))
+        with self.assertRaisesRegex(ValueError, '1 feature IDs are not in '
+                                    'the MGF file: 7'):
+            subset_features(MGFDirFmt(self.tmp.name, mode='r'), metadata)
+
+
+if __name__ == '__main__':
+    main()
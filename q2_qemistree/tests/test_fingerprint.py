@@ -6,14 +6,18 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
-from unittest import TestCase, main
+from unittest import TestCase, main, mock
 import qiime2
 import os
+import tempfile
 from q2_qemistree import MGFDirFmt, SiriusDirFmt, ZodiacDirFmt, OutputDirs
 from q2_qemistree import (compute_fragmentation_trees,
                           rerank_molecular_formulas,
-                          predict_fingerprints)
-from q2_qemistree._fingerprint import artifactory
+                          predict_fingerprints, compute_fingerprints)
+from q2_qemistree._fingerprint import (artifactory, merge_workspaces,
+                                       resumable_artifactory,
+                                       requeued_artifactory,
+                                       complete_csi_summary)
 
 
 class FingerprintTests(TestCase):
@@ -51,6 +55,12 @@ class FingerprintTests(TestCase):
                                              ppm_max=15, profile='orbitrap')
         contents = os.listdir(result.get_path())
         self.assertTrue(('version.txt' in contents))
+        # without shards SIRIUS reads the input file, in the input order
+        folders = sorted((c.split('_') for c in contents
+                          if c != 'version.txt'), key=lambda c: int(c[0]))
+        self.assertEqual({source for _, source, _ in folders}, {'features'})
+        ids = [int(fid) for _, _, fid in folders]
+        self.assertEqual(ids, sorted(ids))
 
         contents = os.listdir(result.path)
         self.assertTrue(('stderr.txt' in contents))
@@ -69,6 +79,194 @@ class FingerprintTests(TestCase):
         self.assertTrue(('stderr.txt' in contents))
         self.assertTrue(('stdout.txt' in contents))
 
+    def test_fragmentation_trees_sharded(self):
+        ions = self.ions.view(MGFDirFmt)
+        result = compute_fragmentation_trees(sirius_path=self.goodsirpath,
+                                             features=ions,
+                                             ppm_max=15, profile='orbitrap',
+                                             n_jobs=2, n_shards=2)
+        contents = os.listdir(result.get_path())
+        self.assertTrue(('version.txt' in contents))
+        folders = [c for c in contents if c != 'version.txt']
+        indices = sorted(int(c.split('_')[0]) for c in folders)
+        self.assertEqual(indices, list(range(1, len(folders) + 1)))
+
+        contents = os.listdir(result.path)
+        self.assertTrue(('stderr.txt' in contents))
+        self.assertTrue(('stdout.txt' in contents))
+        self.assertEqual(sorted(contents),
+                         ['sirius-output', 'stderr.txt', 'stdout.txt',
+                          'usage.tsv', 'usage_summary.tsv'])
+
+    def test_merge_workspaces(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            workspaces = []
+            for n, ids in enumerate([['1', '4'], ['2']]):
+                ws = os.path.join(tmp, 'ws%d' % n)
+                for i, fid in enumerate(ids):
+                    name = '%d_features_%s' % (i + 1, fid)
+                    os.makedirs(os.path.join(ws, name))
+                with open(os.path.join(ws, 'version.txt'), 'w') as f:
+                    f.write('Sirius 4.0 (build 22)\n')
+                with open(os.path.join(ws, 'summary.csv'), 'w') as f:
+                    f.write('experimentName\tscore\n')
+                    for fid in ids:
+                        f.write('%s\t0.5\n' % fid)
+                workspaces.append(ws)
+
+            out = os.path.join(tmp, 'merged')
+            merge_workspaces(workspaces, out)
+
+            self.assertEqual(sorted(os.listdir(out)),
+                             ['1_features_1', '2_features_4', '3_features_2',
+                              'summary.csv', 'version.txt'])
+            with open(os.path.join(out, 'version.txt')) as f:
+                self.assertEqual(f.read(), 'Sirius 4.0 (build 22)\n')
+            with open(os.path.join(out, 'summary.csv')) as f:
+                self.assertEqual(f.read(), 'experimentName\tscore\n'
+                                           '1\t0.5\n4\t0.5\n2\t0.5\n')
+
+    def _make_feature(self, workspace, name, files=True):
+        os.makedirs(os.path.join(workspace, name, 'trees'))
+        if files:
+            with open(os.path.join(workspace, name, 'trees', 'tree.json'),
+                      'w') as f:
+                f.write('{}')
+
+    def test_resumable_artifactory(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            # an interrupted attempt with one finished and one partial feature
+            interrupted = os.path.join(work_dir, 'attempt-0', 'sirius-output')
+            self._make_feature(interrupted, '1_features_1')
+            self._make_feature(interrupted, '2_features_2', files=False)
+
+            observed = []
+
+            def run(missing, attempt):
+                observed.extend(missing)
+                workspace = SiriusDirFmt(attempt, mode='r').get_path()
+                for n, fid in enumerate(missing):
+                    self._make_feature(workspace, '%d_features_%s' % (n + 1,
+                                                                      fid))
+
+            def complete(path):
+                return len(os.listdir(os.path.join(path, 'trees'))) > 0
+
+            result = resumable_artifactory(SiriusDirFmt, work_dir, 'key',
+                                           ['1', '2', '3'], complete, run)
+
+            self.assertEqual(observed, ['2', '3'])
+            self.assertEqual(sorted(os.listdir(result.get_path())),
+                             ['1_features_1', '2_features_2', '3_features_3'])
+            self.assertEqual(os.listdir(work_dir), [])
+
+            with open(os.path.join(str(result.path), 'stdout.txt')) as f:
+                self.assertEqual(f.read(), '# attempt-0\n# attempt-1\n')
+
+    def test_resumable_artifactory_interrupted_merge(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            def run(missing, attempt):
+                workspace = SiriusDirFmt(attempt, mode='r').get_path()
+                for n, fid in enumerate(missing):
+                    self._make_feature(workspace, '%d_features_%s' % (n + 1,
+                                                                      fid))
+
+            def complete(path):
+                return len(os.listdir(os.path.join(path, 'trees'))) > 0
+
+            # the run is killed after the outputs are merged, but before the
+            # artifact is complete
+            with mock.patch('q2_qemistree._fingerprint.merge_usage',
+                            side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    resumable_artifactory(SiriusDirFmt, work_dir, 'key',
+                                          ['1', '2'], complete, run)
+
+            observed = []
+
+            def resume(missing, attempt):
+                observed.extend(missing)
+                run(missing, attempt)
+
+            result = resumable_artifactory(SiriusDirFmt, work_dir, 'key',
+                                           ['1', '2'], complete, resume)
+            self.assertEqual(observed, [])
+            self.assertEqual(sorted(os.listdir(result.get_path())),
+                             ['1_features_1', '2_features_2'])
+
+    def test_requeued_artifactory(self):
+        batches = []
+
+        def run(batch, batch_dir):
+            batches.append(batch)
+            workspace = SiriusDirFmt(batch_dir, mode='r').get_path()
+            for n, fid in enumerate(batch):
+                # feature 3 hangs SIRIUS, leaving a partial output behind
+                self._make_feature(workspace, '%d_features_%s' % (n + 1, fid),
+                                   files=fid != '3')
+                if fid == '3':
+                    raise TimeoutError('SIRIUS did not make progress')
+
+        def complete(path):
+            return len(os.listdir(os.path.join(path, 'trees'))) > 0
+
+        result = requeued_artifactory(SiriusDirFmt, ['1', '3', '4', '5'],
+                                      complete, run)
+
+        self.assertEqual(batches, [['1', '3', '4', '5'], ['3'], ['4', '5']])
+        self.assertEqual(sorted(os.listdir(result.get_path())),
+                         ['1_features_1', '2_features_4', '3_features_5'])
+        with open(os.path.join(str(result.path),
+                               'skipped_features.txt')) as f:
+            self.assertEqual(f.read(), '3\n')
+        with open(os.path.join(str(result.path), 'stdout.txt')) as f:
+            self.assertEqual(f.read().splitlines()[-1],
+                             'Skipped 1 features that hung SIRIUS: 3')
+
+    def test_requeued_artifactory_other_errors(self):
+        def run(batch, batch_dir):
+            raise ValueError('not a timeout')
+
+        with self.assertRaisesRegex(ValueError, 'not a timeout'):
+            requeued_artifactory(SiriusDirFmt, ['1'], None, run)
+
+    def test_resumable_artifactory_different_key(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            with open(os.path.join(work_dir, 'key.txt'), 'w') as f:
+                f.write('old-key')
+
+            with self.assertRaisesRegex(ValueError, 'different inputs or '
+                                        'parameters'):
+                resumable_artifactory(SiriusDirFmt, work_dir, 'key', ['1'],
+                                      None, None)
+
+    def test_complete_csi_summary(self):
+        with tempfile.TemporaryDirectory() as workspace:
+            for fid in ['1', '2']:
+                folder = os.path.join(workspace, '%s_features_%s' % (fid,
+                                                                     fid))
+                os.makedirs(folder)
+                with open(os.path.join(folder, 'summary_csi_fingerid.csv'),
+                          'w') as f:
+                    f.write('inchikey2D\tsmiles\n'
+                            'KEY%s\tC%s\n'
+                            'OTHER\tCC\n' % (fid, fid))
+
+            summary = os.path.join(workspace, 'summary_csi_fingerid.csv')
+            with open(summary, 'w') as f:
+                f.write('source\texperimentName\tconfidence\tinchikey2D\t'
+                        'smiles\n'
+                        'features\t1\t0.0\tKEY1\tC1\n')
+
+            complete_csi_summary(workspace)
+
+            with open(summary) as f:
+                self.assertEqual(f.read(),
+                                 'source\texperimentName\tconfidence\t'
+                                 'inchikey2D\tsmiles\n'
+                                 'features\t1\t0.0\tKEY1\tC1\n'
+                                 'features\t2\t\tKEY2\tC2\n')
+
     def test_fragmentation_trees_exception(self):
         ions = self.ions.view(MGFDirFmt)
         with self.assertRaises(ValueError):
@@ -102,6 +300,18 @@ class FingerprintTests(TestCase):
         self.assertTrue(('stderr.txt' in contents))
         self.assertTrue(('stdout.txt' in contents))
 
+    def test_compute_fingerprints(self):
+        ions = self.ions.view(MGFDirFmt)
+        result = compute_fingerprints(sirius_path=self.goodsirpath,
+                                      features=ions, ppm_max=15,
+                                      profile='orbitrap')
+        contents = os.listdir(result.get_path())
+        self.assertTrue(('summary_csi_fingerid.csv' in contents))
+
+        contents = os.listdir(result.path)
+        self.assertTrue(('stderr.txt' in contents))
+        self.assertTrue(('stdout.txt' in contents))
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,104 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import os
+import shutil
+import tempfile
+
+from q2_qemistree import (MGFDirFmt, CSIDirFmt, export_job_array,
+                          merge_fingerprints)
+from q2_qemistree._mgf import index_mgf
+
+
+class JobArrayTests(TestCase):
+    def setUp(self):
+        THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+        self.goodcsi = os.path.join(THIS_DIR, 'data/goodcsi')
+        self.tmp = tempfile.TemporaryDirectory()
+        shutil.copy(os.path.join(THIS_DIR, 'data/sirius.mgf'),
+                    os.path.join(self.tmp.name, 'features.mgf'))
+        self.features = MGFDirFmt(self.tmp.name, mode='r')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def shard(self, name, folders):
+        # a CSI:FingerID result with some of the features in goodcsi
+        path = os.path.join(self.tmp.name, name, 'csi-output')
+        os.makedirs(path)
+        for folder in os.listdir(self.goodcsi):
+            src = os.path.join(self.goodcsi, folder)
+            if not os.path.isdir(src):
+                shutil.copy(src, path)
+            elif folder in folders:
+                shutil.copytree(src, os.path.join(path, folder))
+        return CSIDirFmt(os.path.join(self.tmp.name, name), mode='r')
+
+    def test_export_job_array(self):
+        jobs = export_job_array(self.features, '/opt/sirius path', 15,
+                                'orbitrap', 3, java_flags='-Xmx8G -Xms4G')
+        job_dir = jobs.get_path()
+        self.assertEqual(sorted(os.listdir(job_dir)),
+                         ['manifest.tsv', 'shard-0', 'shard-0.sh', 'shard-1',
+                          'shard-1.sh', 'shard-2', 'shard-2.sh'])
+
+        with open(os.path.join(job_dir, 'manifest.tsv')) as f:
+            rows = [line.rstrip('\n').split('\t') for line in f]
+        self.assertEqual(rows[0], ['#shard', 'features', 'mgf', 'script',
+                                   'fingerprints'])
+        self.assertEqual(rows[1], ['shard-0', '1', 'shard-0/features.mgf',
+                                   'shard-0.sh', 'shard-0/fingerprints.qza'])
+        self.assertEqual(sum(int(row[1]) for row in rows[1:]), 7)
+
+        ids = [f.feature_id for row in rows[1:]
+               for f in index_mgf(os.path.join(job_dir, row[2]))]
+        self.assertEqual(sorted(ids), ['1', '2', '3', '4', '6', '7', '8'])
+
+        script = os.path.join(job_dir, 'shard-1.sh')
+        self.assertTrue(os.access(script, os.X_OK))
+        with open(script) as f:
+            content = f.read()
+        self.assertTrue(content.startswith('#!/bin/sh\n'))
+        self.assertIn('shard 2 of 3', content)
+        self.assertIn("--p-sirius-path '/opt/sirius path'", content)
+        self.assertIn("--p-java-flags '-Xmx8G -Xms4G'", content)
+        self.assertIn('--p-no-compact', content)
+        self.assertIn('--input-format MGFFile', content)
+        self.assertIn('--i-features shard-1/features.qza', content)
+        self.assertIn('--o-predicted-fingerprints shard-1/fingerprints.qza',
+                      content)
+
+    def test_export_job_array_small(self):
+        jobs = export_job_array(self.features, 'sirius', 15, 'orbitrap', 20)
+        with open(os.path.join(jobs.get_path(), 'manifest.tsv')) as f:
+            self.assertEqual(len(f.readlines()), 8)
+
+    def test_merge_fingerprints(self):
+        first = self.shard('first', ['2_sirius_2', '3_sirius_3'])
+        second = self.shard('second', ['4_sirius_4', '7_sirius_7'])
+
+        merged = merge_fingerprints([first, second])
+        self.assertEqual(sorted(os.listdir(merged.get_path())),
+                         ['1_sirius_2', '2_sirius_3', '3_sirius_4',
+                          '4_sirius_7', 'fingerprints.csv',
+                          'summary_csi_fingerid.csv', 'version.txt'])
+        # the shards are left untouched
+        self.assertEqual(len(os.listdir(first.get_path())), 5)
+
+    def test_merge_fingerprints_collision(self):
+        first = self.shard('first', ['2_sirius_2', '3_sirius_3'])
+        second = self.shard('second', ['3_sirius_3', '7_sirius_7'])
+
+        msg = '1 feature IDs are in more than one of them: 3'
+        with self.assertRaisesRegex(ValueError, msg):
+            merge_fingerprints([first, second])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import os
+import stat
+import subprocess
+import tempfile
+import time
+
+from q2_qemistree._launcher import Launcher, parse_cpus, split_cpus
+
+
+class LauncherTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # a stand-in for sirius that reports the JVM options it was given
+        self.sirius = os.path.join(self.tmp.name, 'sirius')
+        with open(self.sirius, 'w') as f:
+            f.write('#!/bin/sh\necho "$_JAVA_OPTIONS"\n')
+        os.chmod(self.sirius, os.stat(self.sirius).st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parse_cpus(self):
+        self.assertEqual(parse_cpus('0-3,8'), [0, 1, 2, 3, 8])
+        self.assertEqual(parse_cpus('5, 1-2, 2'), [1, 2, 5])
+
+        for spec in ['', 'a', '3-1', '1,,2']:
+            with self.assertRaisesRegex(ValueError, 'not a valid list'):
+                parse_cpus(spec)
+
+    def test_split_cpus(self):
+        self.assertEqual(split_cpus([0, 1, 2, 3, 4], 2), [[0, 1, 2], [3, 4]])
+        # when there are fewer CPUs than groups, the CPUs are shared
+        self.assertEqual(split_cpus([0], 2), [[0], [0]])
+
+    def test_launcher_missing_sirius(self):
+        with self.assertRaises(OSError):
+            Launcher(os.path.join(self.tmp.name, 'foo'))
+
+    def test_launcher_unavailable_cpus(self):
+        with self.assertRaisesRegex(ValueError, 'not'):
+            Launcher(self.tmp.name, cpus=[100000])
+
+    def test_environment(self):
+        launcher = Launcher(self.tmp.name, '-Xms2G -Djava.io.tmpdir=/scratch')
+        self.assertEqual(launcher.tmp_root, '/scratch')
+
+        before = dict(os.environ)
+        env = launcher.environment('/scratch/sirius-1')
+        self.assertEqual(before, dict(os.environ))
+        self.assertTrue(env['_JAVA_OPTIONS'].endswith(
+            '-Xms2G -Djava.io.tmpdir=/scratch/sirius-1'))
+
+    def test_run(self):
+        launcher = Launcher(self.tmp.name, '-Xmx1G -Djava.io.tmpdir=%s' %
+                            self.tmp.name, niceness=1)
+        stdout = os.path.join(self.tmp.name, 'stdout.txt')
+        stderr = os.path.join(self.tmp.name, 'stderr.txt')
+        launcher.run(['--help'], stdout, stderr, verbose=False)
+
+        with open(stdout) as f:
+            options = f.read().split()
+        self.assertIn('-Xmx1G', options)
+        tmp_dir = options[-1].split('=', 1)[1]
+        self.assertEqual(os.path.dirname(tmp_dir), self.tmp.name)
+        # the temporary directory of the job is removed once it is done
+        self.assertFalse(os.path.exists(tmp_dir))
+        # the resource usage is written next to the logs
+        for name in ['usage.tsv', 'usage_summary.tsv']:
+            self.assertTrue(os.path.exists(os.path.join(self.tmp.name,
+                                                        name)))
+
+    def test_run_affinity_niceness(self):
+        with open(self.sirius, 'w') as f:
+            f.write('#!/bin/sh\nnice\ngrep Cpus_allowed_list /proc/self/status'
+                    '\n')
+        cpus = sorted(os.sched_getaffinity(0))[:1]
+        launcher = Launcher(self.tmp.name, cpus=cpus, niceness=2)
+        self.assertEqual(launcher.prefix[1:3], ['--cpu-list', str(cpus[0])])
+        stdout = os.path.join(self.tmp.name, 'stdout.txt')
+        stderr = os.path.join(self.tmp.name, 'stderr.txt')
+        launcher.run([], stdout, stderr, verbose=False)
+
+        with open(stdout) as f:
+            niceness, allowed = f.read().splitlines()
+        self.assertEqual(int(niceness), os.nice(0) + 2)
+        self.assertEqual(allowed.split()[-1], str(cpus[0]))
+
+    def test_run_monitors(self):
+        with open(self.sirius, 'w') as f:
+            f.write('#!/bin/sh\nsleep 0.5\nexit 3\n')
+
+        class Monitor:
+            polls = []
+
+            def poll(self, process, output_dir, started):
+                self.polls.append((process.pid, output_dir, started))
+
+        launcher = Launcher(self.tmp.name, interval=0.05)
+        stdout = os.path.join(self.tmp.name, 'stdout.txt')
+        stderr = os.path.join(self.tmp.name, 'stderr.txt')
+        with self.assertRaises(subprocess.CalledProcessError):
+            launcher.run(['-o', 'output'], stdout, stderr, verbose=False,
+                         monitors=[Monitor()])
+        self.assertGreater(len(Monitor.polls), 1)
+        self.assertEqual(Monitor.polls[0][1], 'output')
+        # the start time is the same for every poll, and before the first
+        self.assertEqual(len({started for _, _, started in Monitor.polls}),
+                         1)
+        self.assertLess(Monitor.polls[0][2], time.time())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import os
+import tempfile
+
+from q2_qemistree._links import (link_or_copy, link_tree, reflink_or_copy,
+                                 share_files)
+
+
+class LinksTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.reference = os.path.join(self.tmp.name, 'reference')
+        self.workspace = os.path.join(self.tmp.name, 'workspace')
+        for root in [self.reference, self.workspace]:
+            os.makedirs(os.path.join(root, '1_features_1'))
+            self._write(root, '1_features_1/spectrum.ms', '>compound 1\n')
+            self._write(root, 'version.txt', 'Sirius 4.0 (build 22)\n')
+        self._write(self.reference, '1_features_1/tree.json', '{"a": 1}')
+        self._write(self.workspace, '1_features_1/tree.json', '{"b": 2}')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, root, name, contents):
+        with open(os.path.join(root, name), 'w') as f:
+            f.write(contents)
+
+    def _read(self, root, name):
+        with open(os.path.join(root, name)) as f:
+            return f.read()
+
+    def test_link_or_copy(self):
+        src = os.path.join(self.reference, 'version.txt')
+        dst = os.path.join(self.tmp.name, 'version.txt')
+        link_or_copy(src, dst)
+        self.assertEqual(self._read(self.tmp.name, 'version.txt'),
+                         'Sirius 4.0 (build 22)\n')
+        # both files are in the same temporary directory
+        self.assertTrue(os.path.samefile(src, dst))
+
+    def test_reflink_or_copy(self):
+        src = os.path.join(self.reference, 'version.txt')
+        dst = os.path.join(self.tmp.name, 'version.txt')
+        reflink_or_copy(src, dst)
+        # never a hardlink, so editing the source does not change the copy
+        self.assertFalse(os.path.samefile(src, dst))
+        self._write(self.reference, 'version.txt', 'edited\n')
+        self.assertEqual(self._read(self.tmp.name, 'version.txt'),
+                         'Sirius 4.0 (build 22)\n')
+
+    def test_link_tree(self):
+        dst = os.path.join(self.tmp.name, 'linked')
+        link_tree(self.reference, dst)
+        self.assertEqual(sorted(os.listdir(dst)),
+                         ['1_features_1', 'version.txt'])
+        self.assertEqual(self._read(dst, '1_features_1/tree.json'),
+                         '{"a": 1}')
+
+    def test_share_files(self):
+        names = {name: name for name in ['version.txt',
+                                         '1_features_1/spectrum.ms',
+                                         '1_features_1/tree.json']}
+        self.assertEqual(share_files(self.workspace, self.reference, names),
+                         2)
+
+        for name in ['version.txt', '1_features_1/spectrum.ms']:
+            self.assertTrue(os.path.samefile(
+                os.path.join(self.workspace, name),
+                os.path.join(self.reference, name)))
+        self.assertFalse(os.path.samefile(
+            os.path.join(self.workspace, '1_features_1/tree.json'),
+            os.path.join(self.reference, '1_features_1/tree.json')))
+        self.assertEqual(self._read(self.workspace, '1_features_1/tree.json'),
+                         '{"b": 2}')
+
+        # files that already share their data are not counted again
+        self.assertEqual(share_files(self.workspace, self.reference, names),
+                         0)
+
+    def test_share_files_only_names(self):
+        # identical files that are not listed are neither read nor linked
+        self.assertEqual(share_files(self.workspace, self.reference,
+                                     {'version.txt': 'version.txt'}), 1)
+        self.assertFalse(os.path.samefile(
+            os.path.join(self.workspace, '1_features_1/spectrum.ms'),
+            os.path.join(self.reference, '1_features_1/spectrum.ms')))
+
+    def test_share_files_renamed(self):
+        # Zodiac writes the spectra as <folder>.ms, CSI:FingerID keeps them
+        # as <folder>/spectrum.ms
+        self._write(self.reference, '1_features_1.ms', '>compound 1\n')
+        names = {'1_features_1/spectrum.ms': '1_features_1.ms',
+                 'missing/spectrum.ms': 'missing.ms'}
+        self.assertEqual(share_files(self.workspace, self.reference, names),
+                         1)
+        self.assertTrue(os.path.samefile(
+            os.path.join(self.workspace, '1_features_1/spectrum.ms'),
+            os.path.join(self.reference, '1_features_1.ms')))
+
+    def test_share_files_same_size(self):
+        # same size and different contents
+        self._write(self.workspace, 'version.txt', 'Sirius 4.0 (build 23)\n')
+        self.assertEqual(share_files(self.workspace, self.reference,
+                                     {'version.txt': 'version.txt'}), 0)
+        self.assertEqual(self._read(self.workspace, 'version.txt'),
+                         'Sirius 4.0 (build 23)\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,8 @@
 
 from unittest import TestCase, main
 import os
+import shutil
+import tempfile
 import qiime2
 import pandas as pd
 from biom.table import Table
@@ -123,6 +125,40 @@ class TestHierarchy(TestCase):
         tip_names = {node.name for node in treeout.tips()}
         self.assertEqual(tip_names, set(merged_fts._observation_ids))
 
+    def test_batchedCSI(self):
+        # one CSI:FingerID run over the MGF files of both feature tables
+        csi_results = [self.goodcsi.view(CSIDirFmt),
+                       self.goodcsi2.view(CSIDirFmt)]
+        with tempfile.TemporaryDirectory() as tmp:
+            batched = os.path.join(tmp, 'csi-output')
+            os.makedirs(batched)
+            summaries = []
+            for n, csi_result in enumerate(csi_results):
+                prefix = '%d-' % (n + 1)
+                path = str(csi_result.get_path())
+                for name in sorted(os.listdir(path)):
+                    if os.path.isdir(os.path.join(path, name)):
+                        fid = name.split('_')[-1]
+                        shutil.copytree(os.path.join(path, name), os.path.join(
+                            batched, '%d_sirius_%s%s' % (
+                                len(os.listdir(batched)), prefix, fid)))
+                summary = pd.read_csv(os.path.join(
+                    path, 'summary_csi_fingerid.csv'), dtype=str, sep='\t')
+                summary['experimentName'] = prefix + summary['experimentName']
+                summaries.append(summary)
+            pd.concat(summaries).to_csv(os.path.join(
+                batched, 'summary_csi_fingerid.csv'), sep='\t', index=False)
+
+            treeout, merged_fts, merged_fdata = make_hierarchy(
+                [CSIDirFmt(batched, mode='r')],
+                [self.features, self.features2])
+        expected, _, _ = make_hierarchy(csi_results,
+                                        [self.features, self.features2])
+        self.assertEqual({node.name for node in treeout.tips()},
+                         {node.name for node in expected.tips()})
+        self.assertEqual({node.name for node in treeout.tips()},
+                         set(merged_fts._observation_ids))
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,172 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import os
+import shutil
+import tempfile
+
+from q2_qemistree._mgf import (index_mgf, write_features, split_features,
+                               write_shards, concatenate_mgf, is_batched,
+                               index_path, write_index, read_index,
+                               read_features, write_subset)
+
+
+class MGFTests(TestCase):
+    def setUp(self):
+        THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+        self.mgf = os.path.join(THIS_DIR, 'data/sirius.mgf')
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_index_mgf(self):
+        features = index_mgf(self.mgf)
+        ids = [f.feature_id for f in features]
+        self.assertEqual(ids, ['1', '2', '3', '4', '6', '7', '8'])
+
+        first = features[0]
+        self.assertEqual(first.ms1, 1)
+        self.assertEqual(first.ms2, 8)
+        self.assertEqual(len(first.spans), 9)
+        self.assertAlmostEqual(first.pepmass, 110.02030181884766)
+        self.assertAlmostEqual(first.rt, 464.817)
+
+        with open(self.mgf, 'rb') as f:
+            start, end = first.spans[0]
+            f.seek(start)
+            record = f.read(end - start)
+        self.assertTrue(record.startswith(b'BEGIN IONS'))
+        self.assertTrue(record.endswith(b'END IONS\n'))
+
+    def test_index_mgf_no_feature_id(self):
+        fp = os.path.join(self.tmp.name, 'bad.mgf')
+        with open(fp, 'w') as f:
+            f.write('BEGIN IONS\nMSLEVEL=1\n100.0 1.0\nEND IONS\n')
+
+        with self.assertRaisesRegex(ValueError, 'byte 0 does not have a '
+                                    'FEATURE_ID'):
+            index_mgf(fp)
+
+    def test_write_features(self):
+        features = index_mgf(self.mgf)
+        fp = os.path.join(self.tmp.name, 'subset.mgf')
+        write_features(self.mgf, features[2:4], fp)
+
+        obs = index_mgf(fp)
+        self.assertEqual([f.feature_id for f in obs], ['3', '4'])
+        self.assertEqual([(f.ms1, f.ms2, f.peaks) for f in obs],
+                         [(f.ms1, f.ms2, f.peaks) for f in features[2:4]])
+
+    def test_write_features_spans(self):
+        features = index_mgf(self.mgf)
+        fp = os.path.join(self.tmp.name, 'subset.mgf')
+        written = write_features(self.mgf, features[4:1:-1], fp)
+        self.assertEqual(written, index_mgf(fp))
+        self.assertEqual([f.feature_id for f in written], ['6', '4', '3'])
+
+    def test_split_features(self):
+        self.assertEqual(split_features(list('abcde'), 2),
+                         [['a', 'c', 'e'], ['b', 'd']])
+        # empty shards are dropped
+        self.assertEqual(split_features(list('ab'), 4), [['a'], ['b']])
+
+    def test_split_features_cost(self):
+        costs = {'a': 1, 'b': 8, 'c': 3, 'd': 4, 'e': 2}
+        # longest first, each feature going to the least loaded shard
+        self.assertEqual(split_features(list('abcde'), 2, costs.get),
+                         [['b', 'a'], ['d', 'c', 'e']])
+        self.assertEqual(split_features(list('abcde'), 1, costs.get),
+                         [['b', 'd', 'c', 'e', 'a']])
+
+    def test_write_shards(self):
+        paths = write_shards(self.mgf, 3, self.tmp.name)
+        self.assertEqual(len(paths), 3)
+        self.assertTrue(all(os.path.basename(p) == 'features.mgf'
+                            for p in paths))
+
+        ids = [f.feature_id for p in paths for f in index_mgf(p)]
+        self.assertEqual(sorted(ids), ['1', '2', '3', '4', '6', '7', '8'])
+
+    def test_write_shards_cost(self):
+        path, = write_shards(self.mgf, 1, self.tmp.name,
+                             lambda f: f.pepmass)
+        masses = [f.pepmass for f in index_mgf(path)]
+        self.assertEqual(masses, sorted(masses, reverse=True))
+
+    def test_concatenate_mgf(self):
+        fp = os.path.join(self.tmp.name, 'batch.mgf')
+        concatenate_mgf([self.mgf, self.mgf], fp)
+
+        ids = ['1', '2', '3', '4', '6', '7', '8']
+        obs = index_mgf(fp)
+        self.assertEqual([f.feature_id for f in obs],
+                         ['1-' + i for i in ids] + ['2-' + i for i in ids])
+        self.assertEqual([(f.ms1, f.ms2, f.peaks) for f in obs],
+                         [(f.ms1, f.ms2, f.peaks)
+                          for f in index_mgf(self.mgf) * 2])
+        self.assertTrue(is_batched(f.feature_id for f in obs))
+        self.assertFalse(is_batched(ids))
+        self.assertFalse(is_batched([]))
+
+    def test_index(self):
+        fp = os.path.join(self.tmp.name, 'features.mgf')
+        shutil.copy(self.mgf, fp)
+        self.assertIsNone(read_index(fp))
+
+        features = index_mgf(fp)
+        write_index(features, fp)
+        self.assertEqual(index_path(fp),
+                         os.path.join(self.tmp.name, 'features.index.tsv'))
+        with open(index_path(fp)) as f:
+            self.assertEqual(f.readline(), '#mgf-bytes=%d\n' %
+                             os.path.getsize(fp))
+        self.assertEqual(read_index(fp), features)
+        self.assertEqual(index_mgf(fp), features)
+
+    def test_index_does_not_match(self):
+        fp = os.path.join(self.tmp.name, 'features.mgf')
+        shutil.copy(self.mgf, fp)
+        write_index(index_mgf(fp), fp)
+
+        # same size, records moved
+        with open(fp, 'rb') as f:
+            data = f.read()
+        with open(fp, 'wb') as f:
+            f.write(b'\n' + data[:-1])
+        self.assertIsNone(read_index(fp))
+
+        with open(fp, 'ab') as f:
+            f.write(b'\n')
+        self.assertIsNone(read_index(fp))
+        self.assertEqual([f.feature_id for f in index_mgf(fp)],
+                         ['1', '2', '3', '4', '6', '7', '8'])
+
+    def test_write_subset(self):
+        fp = os.path.join(self.tmp.name, 'features.mgf')
+        shutil.copy(self.mgf, fp)
+        write_index(index_mgf(fp), fp)
+
+        output = os.path.join(self.tmp.name, 'subset.mgf')
+        written = write_subset(fp, ['7', '2'], output)
+        self.assertEqual([f.feature_id for f in written], ['2', '7'])
+        self.assertEqual(read_index(output), written)
+        self.assertEqual(list(read_features(output, written)),
+                         list(read_features(fp, [f for f in index_mgf(fp)
+                                                 if f.feature_id in '27'])))
+
+    def test_write_subset_missing(self):
+        output = os.path.join(self.tmp.name, 'subset.mgf')
+        with self.assertRaisesRegex(ValueError, '2 feature IDs are not in '
+                                    'the MGF file: 10, 5'):
+            write_subset(self.mgf, ['5', '1', '10'], output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import os
+import tempfile
+
+from q2_qemistree._mgf import index_mgf
+from q2_qemistree._partition import (partition_features, pack_groups,
+                                     retention_windows, similarity_components)
+
+
+def record(feature_id, level, pepmass, rt, peaks):
+    lines = ['BEGIN IONS', 'FEATURE_ID=%s' % feature_id,
+             'PEPMASS=%s' % pepmass, 'CHARGE=1+', 'MSLEVEL=%d' % level]
+    if rt is not None:
+        lines.insert(4, 'RTINSECONDS=%s' % rt)
+    lines += ['%s %s' % peak for peak in peaks]
+    return '\n'.join(lines + ['END IONS', ''])
+
+
+def feature(feature_id, pepmass, rt, fragments):
+    return (record(feature_id, 1, pepmass, rt, [(pepmass, 1e6)]) +
+            record(feature_id, 2, pepmass, rt,
+                   [(mz, 1e5) for mz in fragments]))
+
+
+SUGAR = [85.0284, 97.0284, 127.0390, 145.0495, 163.0601]
+AMINE = [58.0651, 72.0808, 86.0964, 100.1121]
+COMMON = [55.0548]
+
+
+class PartitionTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.mgf = os.path.join(self.tmp.name, 'features.mgf')
+        with open(self.mgf, 'w') as f:
+            f.write(feature('1', 325.1129, 300.0, SUGAR + COMMON))
+            f.write(feature('2', 180.0634, 120.0, AMINE + COMMON))
+            # shares all but one of the sugar fragments with feature 1
+            f.write(feature('3', 343.1235, 310.0, SUGAR[:4] + [200.1]))
+            f.write(feature('4', 130.1226, 90.0, AMINE + COMMON))
+            # only the common fragment in common with the others
+            f.write(feature('5', 210.0, 500.0, COMMON + [101.0, 150.0]))
+            f.write(feature('6', 144.0, None, AMINE))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def ids(self, groups):
+        return [[f.feature_id for f in group] for group in groups]
+
+    def test_retention_windows(self):
+        features = index_mgf(self.mgf)
+        self.assertEqual(self.ids(retention_windows(features, 4)),
+                         [['4', '2', '1', '3'], ['5', '6']])
+        self.assertEqual(self.ids(retention_windows(features, 10)),
+                         [['4', '2', '1', '3', '5', '6']])
+
+    def test_similarity_components(self):
+        features = index_mgf(self.mgf)
+        components = similarity_components(self.mgf, features, 10)
+        self.assertEqual(self.ids(components),
+                         [['1', '3'], ['2', '4', '6'], ['5']])
+
+    def test_similarity_components_common_peaks(self):
+        features = index_mgf(self.mgf)
+        # fewer shared peaks are needed, but the peak at 55.0548 is shared by
+        # more features than fit in a group and does not connect them
+        components = similarity_components(self.mgf, features, 3,
+                                           min_shared=1, min_fraction=0)
+        self.assertEqual(self.ids(components),
+                         [['1', '3'], ['2', '4', '6'], ['5']])
+        components = similarity_components(self.mgf, features, 4,
+                                           min_shared=1, min_fraction=0)
+        self.assertEqual(self.ids(components),
+                         [['1', '2', '3', '4', '5', '6']])
+
+    def test_pack_groups(self):
+        features = {f.feature_id: f for f in index_mgf(self.mgf)}
+        components = [[features[i] for i in ids]
+                      for ids in [['1', '3'], ['2', '4', '6'], ['5']]]
+        self.assertEqual(self.ids(pack_groups(components, 3)),
+                         [['2', '4', '6'], ['1', '3', '5']])
+        # large components are split by retention time
+        self.assertEqual(self.ids(pack_groups(components, 2)),
+                         [['1', '3'], ['4', '2'], ['6', '5']])
+
+    def test_partition_features(self):
+        self.assertEqual(self.ids(partition_features(self.mgf, 3)),
+                         [['2', '4', '6'], ['1', '3', '5']])
+        self.assertEqual(self.ids(partition_features(self.mgf, 4,
+                                                     'retention-time')),
+                         [['1', '2', '3', '4'], ['5', '6']])
+
+    def test_partition_features_errors(self):
+        with self.assertRaisesRegex(ValueError, 'one of similarity'):
+            partition_features(self.mgf, 3, 'mass')
+        with self.assertRaisesRegex(ValueError, 'positive'):
+            partition_features(self.mgf, 0)
+
+
+if __name__ == '__main__':
+    main()
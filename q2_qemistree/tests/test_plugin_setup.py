@@ -6,8 +6,15 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import os
+import tempfile
 import unittest
 
+import qiime2
+
+from q2_qemistree import MGFDirFmt
+from q2_qemistree._compress import compress_mgf
+from q2_qemistree._mgf import index_mgf, read_index
 from q2_qemistree.plugin_setup import plugin as qemistree_plugin
 
 
@@ -15,3 +22,37 @@ class PluginSetupTests(unittest.TestCase):
 
     def test_plugin_setup(self):
         self.assertEqual(qemistree_plugin.name, 'qemistree')
+
+
+class ImportTests(unittest.TestCase):
+    def setUp(self):
+        THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+        self.mgf = os.path.join(THIS_DIR, 'data/sirius.mgf')
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_import_mgf(self):
+        # as in the README and the scripts of export_job_array
+        artifact = qiime2.Artifact.import_data('MassSpectrometryFeatures',
+                                               self.mgf, view_type='MGFFile')
+        features = artifact.view(MGFDirFmt)
+        mgf = os.path.join(str(features.path), 'features.mgf')
+        self.assertEqual(read_index(mgf), index_mgf(self.mgf))
+        self.assertEqual(sorted(os.listdir(str(features.path))),
+                         ['features.index.tsv', 'features.mgf'])
+
+    def test_import_compressed_mgf(self):
+        compressed = os.path.join(self.tmp.name, 'sirius.mgf.gz')
+        compress_mgf(self.mgf, compressed)
+        artifact = qiime2.Artifact.import_data('MassSpectrometryFeatures',
+                                               compressed,
+                                               view_type='CompressedMGFFile')
+        features = artifact.view(MGFDirFmt)
+        self.assertEqual(sorted(os.listdir(str(features.path))),
+                         ['features.index.tsv', 'features.mgf.gz'])
+
+        plain = features.decompressed()
+        mgf = os.path.join(str(plain.path), 'features.mgf')
+        self.assertEqual(read_index(mgf), index_mgf(self.mgf))
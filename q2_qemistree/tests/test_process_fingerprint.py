@@ -11,11 +11,14 @@ from biom import load_table
 import pandas as pd
 import os
 import pkg_resources
+import shutil
+import tempfile
 import qiime2
 
 from q2_qemistree import CSIDirFmt
 from q2_qemistree._process_fingerprint import (collate_fingerprint,
-                                               get_feature_smiles)
+                                               get_feature_smiles,
+                                               is_batched_result)
 
 data = pkg_resources.resource_filename('q2_qemistree', 'data')
 
@@ -66,6 +69,40 @@ class FingerprintTests(TestCase):
         indx = self.properties.index
         self.assertEqual(set(tablefp.columns) == set(indx), True)
 
+    def batched_csi(self, output):
+        # features 2 and 3 of the first MGF file, 4 and 7 of the second
+        THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+        goodcsi = os.path.join(THIS_DIR, 'data/goodcsi')
+        prefixes = {'2': '1-', '3': '1-', '4': '2-', '7': '2-'}
+        os.makedirs(output)
+        for name in os.listdir(goodcsi):
+            path = os.path.join(goodcsi, name)
+            if os.path.isdir(path):
+                n, source, fid = name.split('_')
+                shutil.copytree(path, os.path.join(
+                    output, '%s_%s_%s%s' % (n, source, prefixes[fid], fid)))
+            else:
+                shutil.copy(path, output)
+        summary = os.path.join(output, 'summary_csi_fingerid.csv')
+        table = pd.read_csv(summary, dtype=str, sep='\t')
+        table['experimentName'] = [prefixes.get(fid, '1-') + fid
+                                   for fid in table['experimentName']]
+        table.to_csv(summary, sep='\t', index=False)
+        return output
+
+    def test_batched(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            batched = self.batched_csi(os.path.join(tmp, 'csi-output'))
+            self.assertTrue(is_batched_result(batched))
+            self.assertFalse(is_batched_result(self.goodcsi.view(CSIDirFmt)))
+
+            tablefp = collate_fingerprint(batched, prefix='2-')
+            self.assertEqual(sorted(tablefp.index), ['4', '7'])
+            smiles = get_feature_smiles(batched, tablefp, prefix='2-')
+            self.assertEqual(set(smiles.index), {'4', '7'})
+            tablefp = collate_fingerprint(batched, prefix='1-')
+            self.assertEqual(sorted(tablefp.index), ['2', '3'])
+
 
 if __name__ == '__main__':
     main()
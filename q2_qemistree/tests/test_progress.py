@@ -0,0 +1,97 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import io
+import json
+import os
+import tempfile
+from contextlib import redirect_stdout
+
+from q2_qemistree._progress import Progress, count_complete, format_duration
+
+
+def has_trees(path):
+    return os.path.isdir(os.path.join(path, 'trees'))
+
+
+class ProgressTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmp.name, 'output')
+        self.progress_fp = os.path.join(self.tmp.name, 'progress.jsonl')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _feature(self, output, name, complete=True):
+        os.makedirs(os.path.join(output, name))
+        if complete:
+            os.makedirs(os.path.join(output, name, 'trees'))
+
+    def test_format_duration(self):
+        self.assertEqual(format_duration(0), '0:00:00')
+        self.assertEqual(format_duration(3725.4), '1:02:05')
+
+    def test_count_complete(self):
+        self.assertEqual(count_complete(self.output, has_trees), 0)
+        self.assertEqual(count_complete(None, has_trees), 0)
+
+        self._feature(self.output, '1_features_1')
+        self._feature(self.output, '2_features_2', complete=False)
+        with open(os.path.join(self.output, 'version.txt'), 'w') as f:
+            f.write('Sirius\n')
+        self.assertEqual(count_complete(self.output, has_trees), 1)
+
+    def test_update(self):
+        progress = Progress('trees', 10, has_trees, self.progress_fp,
+                            window=120)
+        start = progress.start
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            progress.update(2, start + 60)
+            # nothing is reported until the count changes
+            progress.update(2, start + 90)
+            # the throughput is measured from the last update before the
+            # window started
+            progress.update(6, start + 240)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines, [
+            'trees: completed 2 of 10 features (2.0 features/min), ETA '
+            '0:04:00',
+            'trees: completed 6 of 10 features (1.6 features/min), ETA '
+            '0:02:30'])
+
+        with open(self.progress_fp) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[1]['completed'], 6)
+        self.assertEqual(records[1]['total'], 10)
+        self.assertEqual(records[1]['elapsed_seconds'], 240)
+        self.assertEqual(records[1]['eta_seconds'], 150)
+
+    def test_poll_shards(self):
+        progress = Progress('trees', 3, has_trees)
+        shards = [os.path.join(self.tmp.name, 'shard-%d' % n)
+                  for n in range(2)]
+        self._feature(shards[0], '1_features_1')
+        self._feature(shards[1], '1_features_2')
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            progress.poll(None, shards[0])
+            progress.poll(None, shards[1])
+            # polling the same directory again does not count it twice
+            progress.poll(None, shards[1])
+        self.assertEqual(progress.last, 2)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+if __name__ == '__main__':
+    main()
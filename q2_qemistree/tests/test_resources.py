@@ -0,0 +1,209 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import os
+import tempfile
+
+from q2_qemistree._mgf import Feature, index_mgf
+from q2_qemistree._resources import (MB, BASE_HEAP, cgroup_limits,
+                                     host_resources, compound_memory,
+                                     feature_cost, estimate_resources,
+                                     with_heap, tree_seconds, makespan,
+                                     estimate_steps, FINGERID_HEAP,
+                                     heaviest_shard)
+
+
+class ResourcesTests(TestCase):
+    def setUp(self):
+        THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+        self.features = index_mgf(os.path.join(THIS_DIR, 'data/sirius.mgf'))
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, contents):
+        path = os.path.join(self.tmp.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(contents)
+
+    def test_cgroup_limits_v2(self):
+        self._write('memory.max', '4294967296\n')
+        self._write('cpu.max', '250000 100000\n')
+        self.assertEqual(cgroup_limits(self.tmp.name), (4 * 1024 * MB, 2))
+
+    def test_cgroup_limits_v2_unlimited(self):
+        self._write('memory.max', 'max\n')
+        self._write('cpu.max', 'max 100000\n')
+        self.assertEqual(cgroup_limits(self.tmp.name), (None, None))
+
+    def test_cgroup_limits_v1(self):
+        self._write('memory/memory.limit_in_bytes', '2147483648\n')
+        self._write('cpu/cpu.cfs_quota_us', '400000\n')
+        self._write('cpu/cpu.cfs_period_us', '100000\n')
+        self.assertEqual(cgroup_limits(self.tmp.name), (2 * 1024 * MB, 4))
+
+        # unlimited cgroups report a huge memory limit and a quota of -1
+        self._write('memory/memory.limit_in_bytes', '9223372036854771712\n')
+        self._write('cpu/cpu.cfs_quota_us', '-1\n')
+        self.assertEqual(cgroup_limits(self.tmp.name), (None, None))
+
+    def test_cgroup_limits_v2_nested(self):
+        # a job limited in a child cgroup, more tightly than its parents
+        self._write('proc/cgroup', '0::/slurm/job_1/step_0\n')
+        self._write('memory.max', '8589934592\n')
+        self._write('slurm/job_1/memory.max', '2147483648\n')
+        self._write('slurm/job_1/step_0/memory.max', 'max\n')
+        self._write('slurm/cpu.max', '200000 100000\n')
+        self._write('slurm/job_1/step_0/cpu.max', '800000 100000\n')
+        proc_cgroup = os.path.join(self.tmp.name, 'proc/cgroup')
+        self.assertEqual(cgroup_limits(self.tmp.name, proc_cgroup),
+                         (2 * 1024 * MB, 2))
+
+    def test_cgroup_limits_v1_nested(self):
+        self._write('proc/cgroup', '12:memory:/slurm/job_1\n'
+                                   '4:cpu,cpuacct:/slurm/job_1\n'
+                                   '1:name=systemd:/init.scope\n')
+        self._write('memory/memory.limit_in_bytes', '9223372036854771712\n')
+        self._write('memory/slurm/job_1/memory.limit_in_bytes',
+                    '1073741824\n')
+        self._write('cpu/slurm/job_1/cpu.cfs_quota_us', '300000\n')
+        self._write('cpu/slurm/job_1/cpu.cfs_period_us', '100000\n')
+        proc_cgroup = os.path.join(self.tmp.name, 'proc/cgroup')
+        self.assertEqual(cgroup_limits(self.tmp.name, proc_cgroup),
+                         (1024 * MB, 3))
+
+    def test_host_resources(self):
+        self._write('memory.max', '1048576\n')
+        memory, cpus = host_resources(self.tmp.name)
+        self.assertEqual(memory, 1024 ** 2)
+        self.assertGreaterEqual(cpus, 1)
+
+    def test_compound_memory(self):
+        light = Feature('1', [], 1, 1, 200.0, 10, 60.0)
+        self.assertLess(compound_memory(light),
+                        compound_memory(light._replace(pepmass=800.0)))
+        self.assertLess(compound_memory(light),
+                        compound_memory(light._replace(peaks=1000)))
+
+    def test_feature_cost(self):
+        light = Feature('1', [], 1, 1, 200.0, 10, 60.0)
+        self.assertEqual(feature_cost(light), 16.0)
+        self.assertEqual(feature_cost(light._replace(pepmass=400.0)), 128.0)
+        self.assertEqual(feature_cost(light._replace(peaks=30)), 32.0)
+
+    def test_heaviest_shard(self):
+        shard = heaviest_shard(self.features, 2)
+        heaviest = max(self.features, key=feature_cost)
+        self.assertEqual(shard[0], heaviest)
+        self.assertEqual(heaviest_shard(self.features, 1),
+                         sorted(self.features, key=feature_cost,
+                                reverse=True))
+
+    def test_heaviest_shard_no_features(self):
+        self.assertEqual(heaviest_shard([], 4), [])
+        self.assertEqual(estimate_resources(heaviest_shard([], 4),
+                                            8 * 1024 * MB, 4).heap,
+                         BASE_HEAP)
+
+    def test_estimate_resources(self):
+        plan = estimate_resources(self.features, 64 * 1024 * MB, 2)
+        self.assertEqual(plan.processors, 2)
+        self.assertEqual(plan.initial_buffer, 2)
+        # the buffer never holds more compounds than there are features
+        self.assertEqual(plan.max_buffer, 7)
+        self.assertGreater(plan.heap, BASE_HEAP)
+        self.assertLess(plan.heap, 64 * 1024 * MB)
+
+    def test_estimate_resources_little_memory(self):
+        # the buffer shrinks to what fits in memory, but never below one
+        plan = estimate_resources(self.features, 1300 * MB, 16)
+        self.assertEqual(plan.processors, 16)
+        self.assertEqual(plan.max_buffer, 1)
+        self.assertEqual(plan.initial_buffer, 1)
+        self.assertLessEqual(plan.heap, 1300 * MB)
+
+    def test_estimate_resources_below_base_heap(self):
+        # the heap would not fit in the memory limit
+        with self.assertRaisesRegex(ValueError, '1024 MB of memory .* at '
+                                    'least 1280 MB'):
+            estimate_resources(self.features, 1024 * MB, 4)
+        with self.assertRaisesRegex(ValueError, '512 MB of memory'):
+            estimate_resources([], 512 * MB, 4)
+
+    def test_estimate_resources_no_features(self):
+        plan = estimate_resources([], 64 * 1024 * MB, 4)
+        self.assertEqual(plan, (BASE_HEAP, 1, 1, 4))
+
+    def test_with_heap(self):
+        self.assertEqual(with_heap(None, 2048 * MB), '-Xmx2048m')
+        self.assertEqual(with_heap('-Xms1G', 2048 * MB), '-Xms1G -Xmx2048m')
+        # the heap size chosen by the user is kept
+        self.assertEqual(with_heap('-Xmx8G', 2048 * MB), '-Xmx8G')
+
+    def test_tree_seconds(self):
+        feature = Feature('1', [], 1, 1, 200.0, 10, 60.0)
+        self.assertAlmostEqual(tree_seconds(feature), 0.8)
+        self.assertLess(tree_seconds(feature, 'orbitrap', 'pubchem'),
+                        tree_seconds(feature))
+
+        # a feature can not take longer than the timeout of all its trees
+        heavy = feature._replace(pepmass=2000.0, peaks=1000)
+        self.assertEqual(tree_seconds(heavy, tree_timeout=10,
+                                      num_candidates=5), 50)
+        self.assertGreater(tree_seconds(heavy, tree_timeout=0), 50)
+
+    def test_makespan(self):
+        costs = {'a': 1, 'b': 8, 'c': 3, 'd': 4, 'e': 2}
+        self.assertEqual(makespan(list('abcde'), costs.get, 1), 18)
+        self.assertEqual(makespan(list('abcde'), costs.get, 2), 9)
+        # a single feature bounds the wall time
+        self.assertEqual(makespan(list('abcde'), costs.get, 10), 8)
+        self.assertEqual(makespan([], costs.get, 2), 0)
+
+    def test_estimate_steps(self):
+        estimates = estimate_steps(self.features, 'orbitrap', n_jobs=2)
+        self.assertEqual(list(estimates), ['compute-fragmentation-trees',
+                                           'predict-fingerprints'])
+        for wall, cpu, heap in estimates.values():
+            self.assertLessEqual(wall, cpu)
+            self.assertGreaterEqual(wall, cpu / 2)
+            self.assertGreater(heap, BASE_HEAP)
+
+        one = estimate_steps(self.features, 'orbitrap', n_jobs=1)
+        self.assertEqual(one['predict-fingerprints'][2], FINGERID_HEAP +
+                         256 * MB)
+        self.assertGreaterEqual(one['compute-fragmentation-trees'][0],
+                                estimates['compute-fragmentation-trees'][0])
+
+    def test_estimate_steps_values(self):
+        # feature costs of 16 and 1, i.e. 0.8 s and 0.05 s of trees
+        features = [Feature('1', [], 1, 1, 200.0, 10, 60.0),
+                    Feature('2', [], 1, 1, 100.0, 0, 90.0)]
+        estimates = estimate_steps(features, 'qtof', 'all', 'pubchem', 1)
+        wall, cpu, _ = estimates['compute-fragmentation-trees']
+        self.assertAlmostEqual(wall, 0.85)
+        self.assertAlmostEqual(cpu, 0.85)
+        self.assertEqual(estimates['predict-fingerprints'],
+                         (16.0, 16.0, FINGERID_HEAP + 256 * MB))
+
+        estimates = estimate_steps(features, 'qtof', 'all', 'pubchem', 2)
+        wall, cpu, _ = estimates['compute-fragmentation-trees']
+        self.assertAlmostEqual(wall, 0.8)
+        self.assertAlmostEqual(cpu, 0.85)
+        self.assertEqual(estimates['predict-fingerprints'],
+                         (8.0, 16.0, FINGERID_HEAP + 512 * MB))
+
+        self.assertEqual(estimate_steps([], 'qtof')['predict-fingerprints'],
+                         (0, 0, FINGERID_HEAP + 256 * MB))
+
+
+if __name__ == '__main__':
+    main()
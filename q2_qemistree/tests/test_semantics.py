@@ -7,18 +7,27 @@
 # ----------------------------------------------------------------------------
 
 from unittest import TestCase, main
-from q2_qemistree._semantics import validate_mgf
+import os
+import tempfile
+import warnings
+
+from q2_qemistree._compress import compress_mgf
+from q2_qemistree._validate import (validate_compressed_mgf, validate_mgf,
+                                    validate_mgf_file, validate_mgf_sample)
 
 
 class FingerprintTests(TestCase):
+    def validate(self, mgf):
+        return validate_mgf(mgf.split('\n'))
+
     def test_validate_mgf(self):
-        self.assertTrue(validate_mgf(GOOD_MGF.split('\n')))
+        self.assertTrue(self.validate(GOOD_MGF))
 
     def test_validate_not_enough_ms2s(self):
         with self.assertWarnsRegex(UserWarning, r'At least one feature '
                                    '\\(Feature ID = "5"\\) does not have MS2 '
                                    'information'):
-            validate_mgf(BAD_MGF.split('\n'))
+            self.validate(BAD_MGF)
 
     def test_validate_no_ms1(self):
         to_replace = ('BEGIN IONS',
@@ -39,7 +48,7 @@ class FingerprintTests(TestCase):
 
         with self.assertRaisesRegex(ValueError, 'Feature "5" does not have an'
                                     ' MSLEVEL=1 record'):
-            validate_mgf(bad.split('\n'))
+            self.validate(bad)
 
     def test_validate_no_trailing_ms1(self):
         bad = ["BEGIN IONS",
@@ -60,7 +69,7 @@ class FingerprintTests(TestCase):
 
         with self.assertRaisesRegex(ValueError, 'Feature "6" does not have an'
                                     ' MSLEVEL=1 record'):
-            validate_mgf(bad.split('\n'))
+            self.validate(bad)
 
     def test_validate_more_than_one_ms1(self):
         doubled = ["BEGIN IONS",
@@ -81,7 +90,174 @@ class FingerprintTests(TestCase):
 
         with self.assertRaisesRegex(ValueError, 'Feature "6" has more than one'
                                     ' MSLEVEL=1 record'):
-            validate_mgf(doubled.split('\n'))
+            self.validate(doubled)
+
+
+class FileValidationTests(FingerprintTests):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.mgf = os.path.join(self.tmp.name, 'features.mgf')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def validate(self, mgf, newline='\n'):
+        with open(self.mgf, 'w', newline=newline) as f:
+            f.write(mgf)
+        return validate_mgf_file(self.mgf)
+
+    def test_validate_empty(self):
+        self.assertTrue(self.validate(''))
+
+    def test_validate_line_endings(self):
+        for newline in ['\r\n', '\r']:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                self.assertTrue(self.validate(BAD_MGF, newline))
+            self.assertEqual(len(caught), 1)
+            self.assertIn('(Feature ID = "5")', str(caught[0].message))
+
+            bad = GOOD_MGF.replace('MSLEVEL=1', 'MSLEVEL=2', 1)
+            with self.assertRaisesRegex(ValueError, 'Feature "1" does not '
+                                        'have an MSLEVEL=1 record'):
+                self.validate(bad, newline)
+
+    def test_validate_markers_inside_lines(self):
+        # only lines starting with a marker count
+        mgf = GOOD_MGF.replace('SCANS=-1', 'SCANS=-1 MSLEVEL=1 END IONS')
+        self.assertTrue(self.validate(mgf))
+
+
+class ParallelValidationTests(FileValidationTests):
+    def validate(self, mgf, newline='\n'):
+        with open(self.mgf, 'w', newline=newline) as f:
+            f.write(mgf)
+        # every record is about its own chunk
+        return validate_mgf_file(self.mgf, n_jobs=8, min_chunk_size=1)
+
+    def test_same_as_sequential(self):
+        # features split across chunks, features without MS2 at the edges
+        # of the chunks and an error after them
+        records = []
+        for i in range(1, 41):
+            for level in [1] + [2] * (i % 4):
+                records.append('BEGIN IONS\nFEATURE_ID=%d\nMSLEVEL=%d\n'
+                               '100.0 1.0\nEND IONS\n' % (i, level))
+        mgf = '\n'.join(records)
+        bad = mgf.replace('FEATURE_ID=37\nMSLEVEL=1',
+                          'FEATURE_ID=37\nMSLEVEL=2')
+        with open(self.mgf, 'w') as f:
+            f.write(bad)
+
+        results = []
+        for n_jobs in [1, 2, 3, 5, 8]:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                with self.assertRaises(ValueError) as error:
+                    validate_mgf_file(self.mgf, n_jobs=n_jobs,
+                                      min_chunk_size=1)
+            results.append(([str(w.message) for w in caught],
+                            str(error.exception)))
+        self.assertEqual(results[0][1], 'Feature "37" does not have an '
+                                        'MSLEVEL=1 record')
+        self.assertEqual(len(results[0][0]), 9)
+        for result in results[1:]:
+            self.assertEqual(result, results[0])
+
+
+class SampledValidationTests(FileValidationTests):
+    def validate(self, mgf, newline='\n'):
+        with open(self.mgf, 'w', newline=newline) as f:
+            f.write(mgf)
+        return validate_mgf_sample(self.mgf)
+
+    def write_features(self, n_features, bad=()):
+        # features with an MS1 and three MS2 records, the `bad` ones without
+        # their MS1
+        with open(self.mgf, 'w') as f:
+            for i in range(1, n_features + 1):
+                for level in [1, 2, 2, 2]:
+                    if i in bad and level == 1:
+                        continue
+                    f.write('BEGIN IONS\nFEATURE_ID=%d\nPEPMASS=300.1\n'
+                            'MSLEVEL=%d\n100.0 1.0\nEND IONS\n\n' %
+                            (i, level))
+
+    def test_sample_starts_at_features(self):
+        # most samples start in the middle of a feature
+        self.write_features(200)
+        self.assertTrue(validate_mgf_sample(self.mgf, records=1,
+                                            samples=500, sample_records=3))
+
+    def test_sample_outside_first_records(self):
+        self.write_features(200, bad=range(101, 201))
+        self.assertTrue(validate_mgf_sample(self.mgf, records=10,
+                                            samples=0))
+        with self.assertRaisesRegex(ValueError, r'Feature "1\d\d" does not '
+                                    'have an MSLEVEL=1 record'):
+            validate_mgf_sample(self.mgf, records=10, samples=20,
+                                sample_records=3)
+        with self.assertRaisesRegex(ValueError, 'Feature "101" does not have'
+                                    ' an MSLEVEL=1 record'):
+            validate_mgf_file(self.mgf)
+
+    def test_lone_carriage_return_outside_samples(self):
+        # read as text, the carriage return makes a second MS1 record
+        self.write_features(2000)
+        lone = ('BEGIN IONS\nFEATURE_ID=9999\nPEPMASS=300.1\rMSLEVEL=1\n'
+                'MSLEVEL=1\n100.0 1.0\nEND IONS\n')
+        with open(self.mgf, 'a', newline='') as f:
+            f.write(lone)
+        # only the blocks of the records checked are read
+        self.assertTrue(validate_mgf_sample(self.mgf, records=10,
+                                            samples=0))
+        with self.assertRaisesRegex(ValueError, 'Feature "9999" has more '
+                                    'than one MSLEVEL=1'):
+            validate_mgf_file(self.mgf)
+
+        # in the records checked, the file is read as text
+        with open(self.mgf, 'w', newline='') as f:
+            f.write(lone)
+        with self.assertRaisesRegex(ValueError, 'Feature "9999" has more '
+                                    'than one MSLEVEL=1'):
+            validate_mgf_sample(self.mgf, samples=0)
+
+
+class CompressedValidationTests(FileValidationTests):
+    def validate(self, mgf, newline='\n', block_size=1024):
+        with open(self.mgf, 'w', newline=newline) as f:
+            f.write(mgf)
+        compress_mgf(self.mgf, self.mgf + '.gz')
+        return validate_compressed_mgf(self.mgf + '.gz',
+                                       block_size=block_size)
+
+    def test_block_boundaries(self):
+        # blocks end in the middle of lines and of the markers
+        bad = GOOD_MGF.replace('MSLEVEL=1', 'MSLEVEL=2', 1)
+        for block_size in [1, 2, 7, 64]:
+            self.assertTrue(self.validate(GOOD_MGF, block_size=block_size))
+            self.assertTrue(self.validate(GOOD_MGF, '\r\n', block_size))
+            with self.assertRaisesRegex(ValueError, 'Feature "1" does not '
+                                        'have an MSLEVEL=1 record'):
+                self.validate(bad, block_size=block_size)
+
+    def test_first_records(self):
+        # a feature without an MS1 after those of GOOD_MGF
+        bad = GOOD_MGF + ('\nBEGIN IONS\nFEATURE_ID=99\nMSLEVEL=2\n'
+                          '100.0 1.0\nEND IONS\n')
+        with self.assertRaisesRegex(ValueError, 'Feature "99" does not '
+                                    'have an MSLEVEL=1 record'):
+            self.validate(bad)
+        self.assertTrue(validate_compressed_mgf(self.mgf + '.gz', records=2))
+
+    def test_lone_carriage_return_after_first_block(self):
+        # read as text, the carriage return makes a second MS1 record
+        mgf = GOOD_MGF + ('\nBEGIN IONS\nFEATURE_ID=99\nPEPMASS=1.0\r'
+                          'MSLEVEL=1\nMSLEVEL=1\n100.0 1.0\nEND IONS\n')
+        for block_size in [1, 2, 7, 64, 1024]:
+            with self.assertRaisesRegex(ValueError, 'Feature "99" has more '
+                                        'than one MSLEVEL=1'):
+                self.validate(mgf, block_size=block_size)
 
 
 GOOD_MGF = """BEGIN IONS
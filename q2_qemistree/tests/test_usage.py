@@ -0,0 +1,115 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main, skipUnless
+from collections import OrderedDict
+import os
+import subprocess
+import sys
+import tempfile
+
+from q2_qemistree._usage import (UsageSampler, process_tree, sample_tree,
+                                 merge_usage, read_summary, write_summary)
+
+
+HAS_PROC = os.path.isdir('/proc')
+
+
+class UsageTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _summary(self, name, **values):
+        directory = os.path.join(self.tmp.name, name)
+        os.makedirs(directory)
+        summary = OrderedDict([('wall_seconds', 10.0),
+                               ('peak_rss_bytes', 100),
+                               ('mean_cpu_percent', 50.0),
+                               ('cpu_seconds', 5.0), ('peak_threads', 4),
+                               ('read_bytes', 10), ('write_bytes', 20),
+                               ('samples', 1)])
+        summary.update(values)
+        write_summary(summary, directory)
+        with open(os.path.join(directory, 'usage.tsv'), 'w') as f:
+            f.write('elapsed_seconds\trss_bytes\tcpu_percent\tthreads\t'
+                    'read_bytes\twrite_bytes\n10.0\t100\t50.0\t4\t10\t20\n')
+        return directory
+
+    @skipUnless(HAS_PROC, 'requires /proc')
+    def test_sample_tree(self):
+        child = subprocess.Popen([sys.executable, '-c',
+                                  'import time; time.sleep(5)'])
+        try:
+            self.assertIn(child.pid, process_tree(os.getpid()))
+            sample = sample_tree(os.getpid())
+            self.assertGreater(sample['rss'], 0)
+            self.assertGreaterEqual(sample['threads'], 2)
+        finally:
+            child.kill()
+            child.wait()
+
+    @skipUnless(HAS_PROC, 'requires /proc')
+    def test_sampler(self):
+        child = subprocess.Popen([sys.executable, '-c',
+                                  'sum(range(10 ** 7))'])
+        sampler = UsageSampler()
+        sampler.poll(child)
+        child.wait()
+        sampler.write(self.tmp.name)
+
+        with open(os.path.join(self.tmp.name, 'usage.tsv')) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0].split('\t')[:2],
+                         ['elapsed_seconds', 'rss_bytes'])
+        self.assertEqual(len(lines), 2)
+
+        summary = read_summary(self.tmp.name)
+        self.assertEqual(list(summary)[:2], ['wall_seconds',
+                                             'peak_rss_bytes'])
+        self.assertGreater(summary['peak_rss_bytes'], 0)
+        self.assertEqual(summary['samples'], 1)
+
+    def test_merge_usage_concurrent(self):
+        parts = [('shard 0', self._summary('a')),
+                 ('shard 1', self._summary('b', wall_seconds=20.0)),
+                 ('shard 2', os.path.join(self.tmp.name, 'missing'))]
+        merge_usage(parts, self.tmp.name, concurrent=True)
+
+        summary = read_summary(self.tmp.name)
+        self.assertEqual(summary['wall_seconds'], 20.0)
+        self.assertEqual(summary['peak_rss_bytes'], 200)
+        self.assertEqual(summary['cpu_seconds'], 10.0)
+        self.assertEqual(summary['mean_cpu_percent'], 50.0)
+        self.assertEqual(summary['peak_threads'], 8)
+
+        with open(os.path.join(self.tmp.name, 'usage.tsv')) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[1], '# shard 0')
+        self.assertEqual(lines[3], '# shard 1')
+        self.assertEqual(len(lines), 5)
+
+    def test_merge_usage_sequential(self):
+        parts = [('attempt-0', self._summary('a')),
+                 ('attempt-1', self._summary('b', peak_rss_bytes=300))]
+        merge_usage(parts, self.tmp.name, concurrent=False)
+
+        summary = read_summary(self.tmp.name)
+        self.assertEqual(summary['wall_seconds'], 20.0)
+        self.assertEqual(summary['peak_rss_bytes'], 300)
+        self.assertEqual(summary['mean_cpu_percent'], 50.0)
+
+    def test_merge_usage_nothing_recorded(self):
+        merge_usage([('shard 0', self.tmp.name)], self.tmp.name, True)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+
+if __name__ == '__main__':
+    main()
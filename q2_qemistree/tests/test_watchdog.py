@@ -0,0 +1,80 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2018, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+import os
+import tempfile
+
+from q2_qemistree._watchdog import Watchdog, activity
+
+
+class WatchdogTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmp.name, 'output')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_activity(self):
+        self.assertEqual(activity(self.output), (0, 0))
+
+        os.makedirs(os.path.join(self.output, '1_features_1', 'trees'))
+        count, newest = activity(self.output)
+        self.assertEqual(count, 2)
+        self.assertGreater(newest, 0)
+
+        # files deeper in the per-feature folders are not inspected
+        with open(os.path.join(self.output, '1_features_1', 'trees',
+                               'tree.json'), 'w') as f:
+            f.write('{}')
+        self.assertEqual(activity(self.output)[0], 2)
+
+    def test_stall(self):
+        watchdog = Watchdog(stall_timeout=60)
+        watchdog.poll(None, self.output, now=0)
+        watchdog.poll(None, self.output, now=50)
+
+        # new output resets the clock
+        os.makedirs(os.path.join(self.output, '1_features_1'))
+        watchdog.poll(None, self.output, now=100)
+        watchdog.poll(None, self.output, now=150)
+
+        with self.assertRaisesRegex(TimeoutError, 'did not make progress'):
+            watchdog.poll(None, self.output, now=161)
+
+    def test_max_runtime(self):
+        watchdog = Watchdog(max_runtime=60)
+        watchdog.poll(None, self.output, now=0)
+        watchdog.poll(None, self.output, now=60)
+        with self.assertRaisesRegex(TimeoutError, 'more than 60 seconds'):
+            watchdog.poll(None, self.output, now=61)
+
+    def test_measured_from_start(self):
+        # the first poll is an interval after the start of the process
+        watchdog = Watchdog(stall_timeout=60, max_runtime=100)
+        watchdog.poll(None, self.output, started=0, now=10)
+        with self.assertRaisesRegex(TimeoutError, 'did not make progress'):
+            watchdog.poll(None, self.output, started=0, now=61)
+
+        # output written before the first poll is progress
+        watchdog = Watchdog(stall_timeout=60, max_runtime=100)
+        os.makedirs(os.path.join(self.output, '1_features_1'))
+        watchdog.poll(None, self.output, started=0, now=10)
+        watchdog.poll(None, self.output, started=0, now=61)
+        with self.assertRaisesRegex(TimeoutError, 'more than 100 seconds'):
+            watchdog.poll(None, self.output, started=0, now=101)
+
+    def test_disabled(self):
+        watchdog = Watchdog(0, None)
+        watchdog.poll(None, self.output, now=0)
+        watchdog.poll(None, self.output, now=10 ** 6)
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,8 @@ setup(
         'qiime2.plugins': ['q2-qemistree=q2_qemistree.plugin_setup:plugin']
     },
     package_data={'q2_qemistree': ['data/molecular_properties.csv',
-                                   'assets/index.html', 'citations.bib']},
+                                   'assets/index.html',
+                                   'assets/estimate/index.html',
+                                   'citations.bib']},
     install_requires=['itolapi']
 )